@@ -94,6 +94,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'faceapp.middleware.RequestIdMiddleware',
+    'faceapp.middleware.MetricsMiddleware',
+    'faceapp.db_router.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add this for static files on Render
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -149,6 +152,61 @@ else:
         }
     }
 
+# Optional read replica for the dashboard/analytics/export/AI views (faceapp.db_router).
+# Locally, point it at a copy of the SQLite file: REPLICA_DATABASE_URL=sqlite:///db_replica.sqlite3
+REPLICA_DATABASE_URL = os.getenv('REPLICA_DATABASE_URL')
+if REPLICA_DATABASE_URL:
+    if REPLICA_DATABASE_URL.startswith('sqlite:///'):
+        DATABASES['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / REPLICA_DATABASE_URL.replace('sqlite:///', ''),
+        }
+    else:
+        import dj_database_url
+        DATABASES['replica'] = dj_database_url.parse(REPLICA_DATABASE_URL)
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['faceapp.db_router.ReplicaRouter']
+# Seconds a client keeps reading from the primary after it wrote
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '10'))
+
+
+# Cache backend (used by faceapp.payload_cache). REDIS_URL selects Redis (requires
+# the redis package); otherwise CACHE_BACKEND picks 'locmem' (default, only for a
+# single web process with JOBS_MODE 'thread' or 'inline') or 'file' (shared by
+# processes on one host). Processes that write data apart from the web process
+# (the Procfile worker, archive_terms, backfill_student_images, ...) refuse to run
+# on locmem, since their data-version bumps would never reach the web process.
+REDIS_URL = os.getenv('REDIS_URL')
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem').lower()
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 1000},
+        }
+    }
+
+# Dashboard/analytics payloads are cached per user until that user's data version changes
+PAYLOAD_CACHE_ENABLED = os.getenv('PAYLOAD_CACHE_ENABLED', 'True').lower() == 'true'
+PAYLOAD_CACHE_TIMEOUT = int(os.getenv('PAYLOAD_CACHE_TIMEOUT', '3600'))
+# Delta syncs (faceapp.changelog) only return change log entries at least this old, so
+# entries whose insert has not committed yet cannot be skipped by a client's cursor
+CHANGE_LOG_SAFETY_SECONDS = float(os.getenv('CHANGE_LOG_SAFETY_SECONDS', '5'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -214,6 +272,21 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Student image cache (faceapp.image_cache)
+IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', os.path.join(MEDIA_ROOT, 'image_cache'))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+IMAGE_CACHE_FRESH_SECONDS = int(os.getenv('IMAGE_CACHE_FRESH_SECONDS', '300'))
+IMAGE_DECODE_CACHE_SIZE = int(os.getenv('IMAGE_DECODE_CACHE_SIZE', '64'))
+IMAGE_FETCH_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+
+# Parquet archives of closed terms (faceapp.archive)
+ARCHIVE_ROOT = os.getenv('ARCHIVE_ROOT', os.path.join(MEDIA_ROOT, 'archive'))
+
+# Content-addressed student photos (faceapp.student_images)
+STUDENT_IMAGE_QUALITY = int(os.getenv('STUDENT_IMAGE_QUALITY', '90'))
+STUDENT_THUMBNAIL_SIZE = int(os.getenv('STUDENT_THUMBNAIL_SIZE', '160'))
+STUDENT_FACE_CROP_SIZE = int(os.getenv('STUDENT_FACE_CROP_SIZE', '224'))
+
 # Cloudinary Configuration
 CLOUDINARY_STORAGE = {
     'CLOUD_NAME': os.getenv('CLOUDINARY_CLOUD_NAME'),
@@ -231,47 +304,106 @@ if not DEBUG:
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Advanced analytics (faceapp.analytics): the dense student x session matrix covers
+# at most this many of the newest sessions in scope
+ANALYTICS_MAX_SESSIONS = int(os.getenv('ANALYTICS_MAX_SESSIONS', '2000'))
+
+# Background jobs (faceapp.jobs)
+# 'thread' runs jobs on a daemon thread in the web process, 'worker' leaves them
+# to `python manage.py run_jobs`, 'inline' runs them right after the request commits.
+# The thread starts with the first request each server process handles.
+# 'worker' needs a cache shared with the web process (REDIS_URL or CACHE_BACKEND='file');
+# set both together and add a `worker: python manage.py run_jobs` process to the Procfile.
+JOBS_MODE = os.getenv('JOBS_MODE', 'thread')
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', '2'))
+JOBS_RETRY_BASE_SECONDS = float(os.getenv('JOBS_RETRY_BASE_SECONDS', '5'))
+JOBS_LOCK_TIMEOUT = int(os.getenv('JOBS_LOCK_TIMEOUT', '600'))
+# Excel exports of more records than this run as a build_export job (faceapp.reports)
+EXPORT_SYNC_MAX_ROWS = int(os.getenv('EXPORT_SYNC_MAX_ROWS', '20000'))
+# Incremental exports (faceapp.incremental) stop before records created in the last N seconds,
+# whose transactions may still be open; must exceed the longest transaction creating records
+EXPORT_WATERMARK_LAG_SECONDS = float(os.getenv('EXPORT_WATERMARK_LAG_SECONDS', '60'))
+
+# Live attendance feed (/events/attendance/, Server-Sent Events; faceapp.events)
+# Streams close after SSE_STREAM_SECONDS and the browser reconnects with Last-Event-ID.
+SSE_BUFFER_SIZE = int(os.getenv('SSE_BUFFER_SIZE', '500'))
+SSE_QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', '100'))
+SSE_MAX_SUBSCRIBERS = int(os.getenv('SSE_MAX_SUBSCRIBERS', '10'))  # keep below the gunicorn thread count
+SSE_STREAM_SECONDS = int(os.getenv('SSE_STREAM_SECONDS', '300'))
+SSE_HEARTBEAT_SECONDS = int(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+SSE_RETRY_MS = int(os.getenv('SSE_RETRY_MS', '3000'))
+
+# Metrics (/metrics, Prometheus text format)
+# Each worker snapshots its values into METRICS_DIR so scrapes see all workers.
+METRICS_DIR = os.getenv('METRICS_DIR', str(BASE_DIR / 'metrics'))
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+# Scrapers send it as a Bearer token; without one, only logged-in admins can read /metrics
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 # Logging Configuration
+# LOG_FORMAT=json switches the log files to one JSON object per line.
+# With LOG_QUEUE_ENABLED (default) handlers run on a background QueueListener
+# thread so request threads never block on log I/O (see faceapp.logging_utils).
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_QUEUE_ENABLED = os.getenv('LOG_QUEUE_ENABLED', 'True').lower() == 'true'
+# Fraction of Rekognition calls whose raw responses are logged (at DEBUG level only)
+RECOGNITION_PAYLOAD_LOG_SAMPLE_RATE = float(os.getenv('RECOGNITION_PAYLOAD_LOG_SAMPLE_RATE', '0.01'))
+
+LOG_FILE_FORMATTER = 'json' if LOG_FORMAT == 'json' else 'detailed'
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {
+            '()': 'faceapp.logging_utils.RequestIdFilter',
+        },
+    },
     'formatters': {
         'verbose': {
-            'format': '{levelname} {asctime} {module} {process:d} {thread:d} {message}',
+            'format': '{levelname} {asctime} {module} {process:d} {thread:d} [{request_id}] {message}',
             'style': '{',
         },
         'simple': {
-            'format': '{levelname} {asctime} {message}',
+            'format': '{levelname} {asctime} [{request_id}] {message}',
             'style': '{',
         },
         'detailed': {
-            'format': '{levelname} {asctime} {name} {funcName}:{lineno} {message}',
+            'format': '{levelname} {asctime} {name} {funcName}:{lineno} [{request_id}] {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'faceapp.logging_utils.JsonFormatter',
+        },
     },
     'handlers': {
         'file': {
-            'level': 'INFO',
+            'level': LOG_LEVEL,
             'class': 'logging.FileHandler',
             'filename': BASE_DIR / 'logs' / 'attendance_system.log',
-            'formatter': 'detailed',
+            'formatter': LOG_FILE_FORMATTER,
+            'filters': ['request_id'],
         },
         'console': {
-            'level': 'INFO',
+            'level': LOG_LEVEL,
             'class': 'logging.StreamHandler',
             'formatter': 'simple',
+            'filters': ['request_id'],
         },
         'performance_file': {
             'level': 'INFO',
             'class': 'logging.FileHandler',
             'filename': BASE_DIR / 'logs' / 'performance.log',
-            'formatter': 'detailed',
+            'formatter': LOG_FILE_FORMATTER,
+            'filters': ['request_id'],
         },
         'security_file': {
             'level': 'WARNING',
             'class': 'logging.FileHandler',
             'filename': BASE_DIR / 'logs' / 'security.log',
-            'formatter': 'detailed',
+            'formatter': LOG_FILE_FORMATTER,
+            'filters': ['request_id'],
         },
     },
     'loggers': {
@@ -282,7 +414,7 @@ LOGGING = {
         },
         'faceapp': {
             'handlers': ['console', 'file', 'performance_file'],
-            'level': 'INFO',
+            'level': LOG_LEVEL,
             'propagate': False,
         },
         'faceapp.security': {
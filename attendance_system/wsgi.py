@@ -13,4 +13,14 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_system.settings')
 
-application = get_wsgi_application()
+django_application = get_wsgi_application()
+
+from faceapp.jobs import ensure_worker  # noqa: E402 - needs the app registry loaded above
+
+
+def application(environ, start_response):
+    # Start the JOBS_MODE='thread' worker in each server process (not in the
+    # --preload master, whose threads would not survive the fork), so queued
+    # jobs resume after a restart
+    ensure_worker()
+    return django_application(environ, start_response)
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import Teacher, Student, Class, AttendanceSession, AttendanceRecord, AIQuery
+from .models import Teacher, Student, Class, AttendanceSession, AttendanceRecord, AIQuery, ArchivedTerm, ExportConsumer
 
 # Register Teacher with UserAdmin so you can manage them in admin
 @admin.register(Teacher)
@@ -18,3 +18,5 @@ admin.site.register(Class)
 admin.site.register(AttendanceSession)
 admin.site.register(AttendanceRecord)
 admin.site.register(AIQuery)
+admin.site.register(ArchivedTerm)
+admin.site.register(ExportConsumer)
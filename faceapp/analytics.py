@@ -0,0 +1,292 @@
+"""
+Vectorized attendance analytics for the advanced analytics page.
+
+build_attendance_matrix() pivots the attendance records of a teacher into
+a student x session matrix (sessions in chronological order). A student is
+expected at a session when enrolled in its class or when they attended
+it. Every metric below is a numpy/pandas reduction over that matrix, and
+results are returned as parallel lists (one list per field, rates in
+percent) so the payload stays small and the page only has to plot them.
+A date window limits the matrix to the sessions in it, including those of
+archived terms (faceapp.archive). The matrix is dense, so it never holds
+more than ANALYTICS_MAX_SESSIONS sessions: the newest ones in scope are
+kept and `truncated` is set on the result.
+"""
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .archive import archived_records, archived_sessions
+from .models import AttendanceRecord, AttendanceSession, Student
+
+RECENT_SESSIONS = 5  # expected sessions in the "recent attendance" window
+ROLLING_DAYS = 7  # session days in the rolling attendance average
+MIN_SESSIONS = 3  # expected sessions before a student can be flagged
+ABSENCE_STREAK = 3  # consecutive absences that flag a student
+RISK_THRESHOLD = 60  # risk score above which a student is flagged
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+class AttendanceMatrix:
+    """Students x sessions: `present`, `late` and `expected` boolean arrays plus their labels"""
+
+    def __init__(self, students, sessions, present, late, expected, truncated=False):
+        self.students = students  # DataFrame indexed by student id: name
+        self.sessions = sessions  # DataFrame indexed by session id: date, start_time, class_id
+        self.present = present
+        self.late = late
+        self.expected = expected
+        self.truncated = truncated  # older sessions were left out (ANALYTICS_MAX_SESSIONS)
+
+
+def build_attendance_matrix(teacher=None, date_from=None, date_to=None):
+    students = Student.objects.filter(is_active=True)
+    sessions = AttendanceSession.objects.all()
+    records = AttendanceRecord.objects.filter(session__isnull=False, student__is_active=True)
+    enrollments = Student.classes.through.objects.filter(student__is_active=True)
+    if teacher:
+        students = students.filter(classes__teacher=teacher).distinct()
+        sessions = sessions.filter(teacher=teacher)
+        records = records.filter(teacher=teacher)
+        enrollments = enrollments.filter(class__teacher=teacher)
+    if date_from:
+        sessions = sessions.filter(date__gte=date_from)
+        records = records.filter(session_date__gte=date_from)
+    if date_to:
+        sessions = sessions.filter(date__lte=date_to)
+        records = records.filter(session_date__lte=date_to)
+    windowed = bool(date_from or date_to)
+    max_sessions = getattr(settings, 'ANALYTICS_MAX_SESSIONS', 2000)
+    # Date of the oldest session kept, and of the next older one if there is one
+    cut = list(sessions.order_by('-date').values_list('date', flat=True)[max_sessions - 1:max_sessions + 1])
+    truncated = len(cut) > 1
+    if truncated:
+        # Only load the days of the newest sessions; the exact cut is made below
+        date_from = max(date_from or cut[0], cut[0])
+        sessions = sessions.filter(date__gte=date_from)
+        records = records.filter(session_date__gte=date_from)
+
+    students = pd.DataFrame.from_records(
+        list(students.values_list('id', 'name')), columns=['student_id', 'name']
+    ).set_index('student_id').sort_values('name', kind='stable')
+    sessions = pd.DataFrame.from_records(
+        list(sessions.values_list('id', 'date', 'start_time', 'class_session_id')),
+        columns=['session_id', 'date', 'start_time', 'class_id']
+    )
+    records = pd.DataFrame.from_records(
+        list(records.values_list('student_id', 'session_id', 'is_late')),
+        columns=['student_id', 'session_id', 'is_late']
+    )
+    if windowed:
+        # Archived terms only take part in windowed analytics
+        old_sessions = archived_sessions(teacher, date_from, date_to)
+        old_records = archived_records(teacher, date_from, date_to)
+        if len(old_sessions):
+            sessions = pd.concat([sessions, old_sessions.rename(columns={'id': 'session_id'})[sessions.columns]],
+                                 ignore_index=True)
+            records = pd.concat([records, old_records[records.columns]], ignore_index=True)
+    sessions = sessions.sort_values(['date', 'start_time', 'session_id']).set_index('session_id')
+    if len(sessions) > max_sessions:
+        truncated = True
+        sessions = sessions.iloc[-max_sessions:]  # records of dropped sessions fall out below
+    enrollments = pd.DataFrame.from_records(
+        list(enrollments.values_list('student_id', 'class_id')), columns=['student_id', 'class_id']
+    )
+
+    shape = (len(students), len(sessions))
+    present = np.zeros(shape, dtype=bool)
+    late = np.zeros(shape, dtype=bool)
+    rows = students.index.get_indexer(records['student_id'])
+    cols = sessions.index.get_indexer(records['session_id'])
+    known = (rows >= 0) & (cols >= 0)
+    present[rows[known], cols[known]] = True
+    late[rows[known], cols[known]] = records['is_late'].to_numpy(dtype=bool)[known]
+
+    # Expected = enrolled in the session's class (sessions without a class: attendees only)
+    enrolled = pd.crosstab(enrollments['student_id'], enrollments['class_id']).astype(bool)
+    expected = (
+        enrolled.reindex(index=students.index, columns=sessions['class_id'], fill_value=False)
+        .to_numpy(dtype=bool)
+    ) if len(enrollments) else np.zeros(shape, dtype=bool)
+    expected = expected | present
+
+    return AttendanceMatrix(students, sessions, present, late, expected, truncated)
+
+
+def _percent(numerator, denominator):
+    """Element-wise numerator/denominator in percent, NaN where the denominator is 0"""
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, np.round(numerator / denominator * 100, 1), np.nan)
+
+
+def _values(array):
+    """JSON-ready list with None for NaN"""
+    return [None if value != value else value for value in np.asarray(array).tolist()]
+
+
+def _runs(matrix):
+    """Runs of equal values in each row's expected cells: (row, value, length), row-major"""
+    rows, cols = np.nonzero(matrix.expected)
+    values = matrix.present[rows, cols]
+    starts = np.ones(len(rows), dtype=bool)
+    starts[1:] = (rows[1:] != rows[:-1]) | (values[1:] != values[:-1])
+    lengths = np.diff(np.append(np.flatnonzero(starts), len(rows)))
+    return rows[starts], values[starts], lengths
+
+
+def student_metrics(matrix):
+    present, late, expected = matrix.present, matrix.late, matrix.expected
+    student_count = len(matrix.students)
+
+    expected_count = expected.sum(axis=1)
+    attended = present.sum(axis=1)
+    late_count = late.sum(axis=1)
+    attendance_rate = _percent(attended, expected_count)
+    late_rate = _percent(late_count, attended)
+
+    # Attendance over each student's last RECENT_SESSIONS expected sessions
+    from_end = np.cumsum(expected[:, ::-1], axis=1)[:, ::-1]
+    recent = expected & (from_end <= RECENT_SESSIONS)
+    recent_rate = _percent((present & recent).sum(axis=1), recent.sum(axis=1))
+
+    # Streaks: current run is signed (+n present, -n absent)
+    run_rows, run_values, run_lengths = _runs(matrix)
+    longest_streak = np.zeros(student_count, dtype=int)
+    np.maximum.at(longest_streak, run_rows[run_values], run_lengths[run_values])
+    current_streak = np.zeros(student_count, dtype=int)
+    last_run = np.append(run_rows[1:] != run_rows[:-1], True) if len(run_rows) else np.zeros(0, dtype=bool)
+    current_streak[run_rows[last_run]] = np.where(run_values[last_run], run_lengths[last_run], -run_lengths[last_run])
+
+    # Risk score 0-100: shortfall below 95% attendance (full at 50%), overall and recent, plus lateness
+    def shortfall(rate):
+        return np.clip((95 - np.nan_to_num(rate, nan=100.0)) / 45, 0, 1)
+
+    risk_score = np.round(100 * (
+        0.55 * shortfall(attendance_rate)
+        + 0.30 * shortfall(recent_rate)
+        + 0.15 * np.clip(np.nan_to_num(late_rate) / 50, 0, 1)
+    )).astype(int)
+    at_risk = (expected_count >= MIN_SESSIONS) & (
+        (risk_score > RISK_THRESHOLD) | (current_streak <= -ABSENCE_STREAK)
+    )
+
+    return {
+        'id': matrix.students.index.tolist(),
+        'name': matrix.students['name'].tolist(),
+        'expected': expected_count.tolist(),
+        'attended': attended.tolist(),
+        'late': late_count.tolist(),
+        'attendance_rate': _values(attendance_rate),
+        'late_rate': _values(late_rate),
+        'recent_rate': _values(recent_rate),
+        'current_streak': current_streak.tolist(),
+        'longest_streak': longest_streak.tolist(),
+        'risk_score': risk_score.tolist(),
+        'at_risk': at_risk.tolist(),
+    }
+
+
+def session_metrics(matrix):
+    present = matrix.present.sum(axis=0)
+    expected = matrix.expected.sum(axis=0)
+    return {
+        'id': matrix.sessions.index.tolist(),
+        'date': [value.isoformat() for value in matrix.sessions['date']],
+        'present': present.tolist(),
+        'expected': expected.tolist(),
+        'attendance_rate': _values(_percent(present, expected)),
+        'late_rate': _values(_percent(matrix.late.sum(axis=0), present)),
+    }
+
+
+def _per_session_totals(matrix):
+    totals = matrix.sessions.copy()
+    totals['present'] = matrix.present.sum(axis=0)
+    totals['late'] = matrix.late.sum(axis=0)
+    totals['expected'] = matrix.expected.sum(axis=0)
+    totals['date'] = pd.to_datetime(totals['date'])
+    return totals
+
+
+def daily_series(matrix):
+    daily = _per_session_totals(matrix).groupby('date')[['present', 'late', 'expected']].sum()
+    attendance_rate = pd.Series(_percent(daily['present'], daily['expected']), index=daily.index)
+    rolling = attendance_rate.rolling(ROLLING_DAYS, min_periods=1).mean().round(1)
+    return {
+        'date': [value.date().isoformat() for value in daily.index],
+        'present': daily['present'].tolist(),
+        'expected': daily['expected'].tolist(),
+        'attendance_rate': _values(attendance_rate),
+        'rolling_attendance_rate': _values(rolling),
+        'late_rate': _values(_percent(daily['late'], daily['present'])),
+    }
+
+
+def weekly_late_trend(matrix):
+    totals = _per_session_totals(matrix)
+    weekly = totals.groupby(totals['date'].dt.to_period('W-SUN'))[['present', 'late']].sum()
+    late_rate = _percent(weekly['late'], weekly['present'])
+    # Least-squares slope of the weekly late rate, in percentage points per week
+    known = ~np.isnan(late_rate)
+    slope = round(float(np.polyfit(np.flatnonzero(known), late_rate[known], 1)[0]), 2) if known.sum() >= 2 else None
+    return {
+        'week': [period.start_time.date().isoformat() for period in weekly.index],
+        'present': weekly['present'].tolist(),
+        'late': weekly['late'].tolist(),
+        'late_rate': _values(late_rate),
+        'slope': slope,
+    }
+
+
+def weekday_heatmap(matrix):
+    """Attendance rate by weekday (rows) x hourly start-time slot (columns)"""
+    totals = _per_session_totals(matrix)
+    totals['weekday'] = totals['date'].dt.weekday
+    totals['slot'] = [value.hour for value in totals['start_time']]
+    grid = totals.pivot_table(index='weekday', columns='slot', values=['present', 'expected'],
+                              aggfunc='sum', fill_value=0)
+    if grid.empty:
+        return {'weekdays': [], 'slots': [], 'attendance_rate': [], 'sessions': [], 'weekday_attendance_rate': []}
+    sessions = totals.pivot_table(index='weekday', columns='slot', values='present',
+                                  aggfunc='count', fill_value=0)
+    rates = _percent(grid['present'], grid['expected'])
+    return {
+        'weekdays': [WEEKDAYS[day] for day in grid.index],
+        'slots': [f"{hour:02d}:00" for hour in grid['present'].columns],
+        'attendance_rate': [_values(row) for row in rates],
+        'sessions': sessions.to_numpy().tolist(),
+        'weekday_attendance_rate': _values(_percent(grid['present'].sum(axis=1), grid['expected'].sum(axis=1))),
+    }
+
+
+def compute_analytics(teacher=None, date_from=None, date_to=None):
+    """All analytics series for `teacher` (every teacher when None), optionally within a date window"""
+    matrix = build_attendance_matrix(teacher, date_from, date_to)
+    students = student_metrics(matrix)
+    at_risk = [
+        student_id for _, student_id in sorted(
+            (-score, student_id)
+            for student_id, score, flagged in zip(students['id'], students['risk_score'], students['at_risk'])
+            if flagged
+        )
+    ]
+    present = int(matrix.present.sum())
+    return {
+        'overall': {
+            'students': len(matrix.students),
+            'sessions': len(matrix.sessions),
+            'attendance_rate': _values([_percent(present, matrix.expected.sum())])[0],
+            'late_rate': _values([_percent(matrix.late.sum(), present)])[0],
+            'at_risk_count': len(at_risk),
+            'truncated': matrix.truncated,
+        },
+        'students': students,
+        'sessions': session_metrics(matrix),
+        'daily': daily_series(matrix),
+        'weekly_late': weekly_late_trend(matrix),
+        'heatmap': weekday_heatmap(matrix),
+        'at_risk': at_risk,
+    }
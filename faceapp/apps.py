@@ -23,3 +23,14 @@ class FaceappConfig(AppConfig):
             tf.get_logger().setLevel('ERROR')
         except ImportError:
             pass
+
+        # Register background job handlers, summary-table signal handlers and system checks
+        from . import tasks  # noqa: F401
+        from . import signals  # noqa: F401
+        from . import checks  # noqa: F401
+
+        # Move log handlers onto a background thread so requests never block on log I/O
+        from django.conf import settings
+        if getattr(settings, 'LOG_QUEUE_ENABLED', False):
+            from .logging_utils import start_queue_logging
+            start_queue_logging(settings.LOGGING.get('loggers', {}).keys())
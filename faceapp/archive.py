@@ -0,0 +1,181 @@
+"""
+Parquet archives of closed terms.
+
+archive_term() moves every session of the classes of one academic year and
+semester into zstd-compressed Parquet files under ARCHIVE_ROOT, together
+with their records. The rows are then deleted from the hot tables. Each run
+adds one part file per table to the term's directory:
+
+    <ARCHIVE_ROOT>/<year>_<semester>/{sessions,records}/part-*.parquet
+
+AI queries are not archived: they belong to no teacher or class, so a term
+cannot claim them.
+
+ArchivedTerm is the manifest: row counts and the session date range of
+each term. archived_sessions() and archived_records() read only the
+terms whose range overlaps the requested dates. They push the teacher,
+class and date filters down into the Parquet reader. Windowed analytics and
+date-ranged exports merge their rows with the hot ones. Class and Student
+rows are kept, so archived rows still match current enrollments; names are
+copied into the files in case students are deleted later.
+"""
+import os
+import re
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import ArchivedTerm, AttendanceRecord, AttendanceSession
+from .payload_cache import bump_data_version_on_commit
+from .summaries import refresh_student_class
+
+_TIME = pa.time64('us')
+_TIMESTAMP = pa.timestamp('us', tz='UTC')
+
+SESSION_SCHEMA = pa.schema([
+    ('id', pa.int64()), ('name', pa.string()), ('date', pa.date32()),
+    ('start_time', _TIME), ('end_time', _TIME), ('teacher_id', pa.int64()),
+    ('class_id', pa.int64()), ('class_name', pa.string()), ('class_code', pa.string()),
+])
+RECORD_SCHEMA = pa.schema([
+    ('id', pa.int64()), ('student_id', pa.int64()), ('student_name', pa.string()),
+    ('student_code', pa.string()), ('session_id', pa.int64()), ('session_name', pa.string()),
+    ('teacher_id', pa.int64()), ('class_id', pa.int64()), ('session_date', pa.date32()),
+    ('date', pa.date32()), ('time', _TIME), ('arrival_time', _TIME), ('is_late', pa.bool_()),
+    ('timestamp', _TIMESTAMP),
+])
+
+# Parquet column -> values() lookup
+SESSION_FIELDS = {
+    'id': 'id', 'name': 'name', 'date': 'date', 'start_time': 'start_time', 'end_time': 'end_time',
+    'teacher_id': 'teacher_id', 'class_id': 'class_session_id', 'class_name': 'class_session__name',
+    'class_code': 'class_session__code',
+}
+RECORD_FIELDS = {
+    'id': 'id', 'student_id': 'student_id', 'student_name': 'student__name',
+    'student_code': 'student__student_id', 'session_id': 'session_id', 'session_name': 'session__name',
+    'teacher_id': 'teacher_id', 'class_id': 'class_session_id', 'session_date': 'session_date',
+    'date': 'date', 'time': 'time', 'arrival_time': 'arrival_time', 'is_late': 'is_late',
+    'timestamp': 'timestamp',
+}
+
+
+def archive_root():
+    return getattr(settings, 'ARCHIVE_ROOT', os.path.join(settings.MEDIA_ROOT, 'archive'))
+
+
+def term_directory(academic_year, semester):
+    return re.sub(r'[^A-Za-z0-9-]+', '_', f"{academic_year}_{semester}").strip('_')
+
+
+def term_sessions(academic_year, semester):
+    return AttendanceSession.objects.filter(
+        class_session__academic_year=academic_year, class_session__semester=semester
+    )
+
+
+def _write_part(directory, schema, queryset, fields):
+    """Write `queryset` as one Parquet part in `directory`; returns (path, row count)"""
+    rows = [
+        {column: row[lookup] for column, lookup in fields.items()}
+        for row in queryset.values(*fields.values())
+    ]
+    if not rows:
+        return None, 0
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"part-{timezone.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}.parquet")
+    pq.write_table(pa.Table.from_pylist(rows, schema=schema), path, compression='zstd')
+    return path, len(rows)
+
+
+def archive_term(academic_year, semester):
+    """Move one term out of the hot tables; returns its ArchivedTerm, or None when it has no sessions"""
+    sessions = term_sessions(academic_year, semester)
+    session_ids = list(sessions.values_list('id', flat=True))
+    if not session_ids:
+        return None
+    dates = sessions.aggregate(first=Min('date'), last=Max('date'))
+
+    name = term_directory(academic_year, semester)
+    directory = os.path.join(archive_root(), name)
+    written = []
+    try:
+        with transaction.atomic():
+            term, _ = ArchivedTerm.objects.select_for_update().get_or_create(
+                academic_year=academic_year, semester=semester,
+                defaults={'path': name, 'date_from': dates['first'], 'date_to': dates['last']},
+            )
+            counts = {}
+            for table, schema, queryset, fields in (
+                ('sessions', SESSION_SCHEMA, AttendanceSession.objects.filter(id__in=session_ids), SESSION_FIELDS),
+                ('records', RECORD_SCHEMA, AttendanceRecord.objects.filter(session_id__in=session_ids), RECORD_FIELDS),
+            ):
+                path, counts[table] = _write_part(os.path.join(directory, table), schema, queryset, fields)
+                if path:
+                    written.append(path)
+
+            term.date_from = min(term.date_from, dates['first'])
+            term.date_to = max(term.date_to, dates['last'])
+            term.session_count += counts['sessions']
+            term.record_count += counts['records']
+            term.save()
+
+            attendees = set(AttendanceRecord.objects.filter(session_id__in=session_ids).exclude(
+                class_session__isnull=True).values_list('student_id', 'class_session_id'))
+            # Records cascade with their sessions
+            AttendanceSession.objects.filter(id__in=session_ids).delete()
+            # The per-session delete signals still saw the other sessions of the batch
+            for student_id, class_id in attendees:
+                refresh_student_class(student_id, class_id)
+            bump_data_version_on_commit()
+    except BaseException:
+        for path in written:
+            os.remove(path)
+        raise
+    return term
+
+
+def _terms(date_from=None, date_to=None):
+    terms = ArchivedTerm.objects.all()
+    if date_from:
+        terms = terms.filter(date_to__gte=date_from)
+    if date_to:
+        terms = terms.filter(date_from__lte=date_to)
+    return terms
+
+
+def _read(table, schema, date_column, teacher=None, date_from=None, date_to=None, class_id=None):
+    filters = []
+    if teacher:
+        filters.append(('teacher_id', '=', teacher.id))
+    if class_id:
+        filters.append(('class_id', '=', class_id))
+    if date_from:
+        filters.append((date_column, '>=', date_from))
+    if date_to:
+        filters.append((date_column, '<=', date_to))
+
+    frames = []
+    for term in _terms(date_from, date_to):
+        directory = os.path.join(archive_root(), term.path, table)
+        if os.path.isdir(directory):
+            frames.append(pq.read_table(directory, schema=schema, filters=filters or None).to_pandas())
+    if not frames:
+        return schema.empty_table().to_pandas()
+    return pd.concat(frames, ignore_index=True)
+
+
+def archived_sessions(teacher=None, date_from=None, date_to=None, class_id=None):
+    """Archived sessions (SESSION_SCHEMA columns) of the terms overlapping the date range"""
+    return _read('sessions', SESSION_SCHEMA, 'date', teacher, date_from, date_to, class_id)
+
+
+def archived_records(teacher=None, date_from=None, date_to=None, class_id=None):
+    """Archived records (RECORD_SCHEMA columns) whose session date lies in the range"""
+    return _read('records', RECORD_SCHEMA, 'session_date', teacher, date_from, date_to, class_id)
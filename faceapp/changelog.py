@@ -0,0 +1,130 @@
+"""
+Change log for delta syncs of attendance data.
+
+faceapp.signals writes one ChangeLogEntry per created, updated or deleted
+AttendanceRecord and AttendanceSession, and per enrollment added or
+removed, tagged with the owning teacher. Entries are written once the
+change commits, so rolled-back writes are never logged. A client keeps
+the id of the last entry it has seen as its cursor. changes_since() then
+returns the current rows of everything upserted since that cursor, plus
+tombstones for deletions. When nothing changed this costs a single query
+on the (teacher, id) index.
+
+Ids are allocated when an entry is inserted but become visible when it
+commits, and concurrent inserts can commit out of id order. A client that
+read id 12 while 11 was still being inserted would skip 11 for good.
+changes_since() therefore only returns entries older than
+CHANGE_LOG_SAFETY_SECONDS, and stops at the first newer one: entries after
+it wait for a later poll. This holds as long as no log insert takes longer
+than the lag. latest_cursor() needs no lag. An entry is written only after
+its data committed, so a payload read after the cursor already includes
+any entry still in flight.
+
+Records deleted together with their session or class are not logged one
+by one; the session tombstone implies them. prune_change_log removes old
+entries but always keeps the newest one. A cursor older than the oldest
+remaining entry therefore gets reset=True, meaning the client must do a
+full reload.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AttendanceRecord, AttendanceSession, ChangeLogEntry
+
+
+def log_change(kind, action, object_id, teacher_id, class_id=None):
+    log_changes([(kind, action, object_id, teacher_id, class_id)])
+
+
+def log_changes(changes):
+    """Write (kind, action, object_id, teacher_id, class_id) entries after the current transaction commits"""
+    entries = [
+        ChangeLogEntry(kind=kind, action=action, object_id=object_id, teacher_id=teacher_id, class_id=class_id)
+        for kind, action, object_id, teacher_id, class_id in changes
+        if teacher_id is not None
+    ]
+    if entries:
+        transaction.on_commit(lambda: ChangeLogEntry.objects.bulk_create(entries))
+
+
+def latest_cursor():
+    return ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def changes_since(teacher, cursor, limit=500):
+    """
+    Changes visible to `teacher` (every teacher when None) after `cursor`:
+    {'cursor', 'has_more', 'reset', 'records', 'sessions', 'deleted', 'enrollments'}
+    with records and sessions as {id: values dict}.
+    """
+    entries = ChangeLogEntry.objects.filter(id__gt=cursor)
+    if teacher:
+        entries = entries.filter(teacher=teacher)
+    entries = list(entries.order_by('id').values_list(
+        'id', 'kind', 'action', 'object_id', 'class_id', 'created_at'
+    )[:limit + 1])
+    # Hold back recent entries and everything after the first of them; see the module docstring
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'CHANGE_LOG_SAFETY_SECONDS', 5))
+    for position, entry in enumerate(entries):
+        if entry[5] >= cutoff:
+            entries = entries[:position]
+            break
+
+    result = {
+        'cursor': cursor,
+        'has_more': len(entries) > limit,
+        'reset': False,
+        'records': {},
+        'sessions': {},
+        'deleted': {'records': [], 'sessions': []},
+        'enrollments': {'added': [], 'removed': []},
+    }
+    if not entries:
+        return result
+
+    oldest = ChangeLogEntry.objects.order_by('id').values_list('id', flat=True).first()
+    if cursor < oldest - 1:
+        result['reset'] = True
+        return result
+
+    entries = entries[:limit]
+    result['cursor'] = entries[-1][0]
+
+    # Last action per object wins
+    latest = {}
+    for _, kind, action, object_id, class_id, _ in entries:
+        latest[(kind, object_id, class_id)] = action
+
+    upserted = {ChangeLogEntry.KIND_RECORD: [], ChangeLogEntry.KIND_SESSION: []}
+    for (kind, object_id, class_id), action in latest.items():
+        if kind == ChangeLogEntry.KIND_ENROLLMENT:
+            key = 'added' if action == ChangeLogEntry.ACTION_UPSERT else 'removed'
+            result['enrollments'][key].append([object_id, class_id])
+        elif action == ChangeLogEntry.ACTION_DELETE:
+            result['deleted'][f"{kind}s"].append(object_id)
+        else:
+            upserted[kind].append(object_id)
+
+    if upserted[ChangeLogEntry.KIND_RECORD]:
+        records = AttendanceRecord.objects.filter(id__in=upserted[ChangeLogEntry.KIND_RECORD])
+        if teacher:
+            records = records.filter(teacher=teacher)
+        result['records'] = {
+            row['id']: row for row in records.values(
+                'student__name', 'student_id', 'session__name', 'session_id',
+                'date', 'time', 'arrival_time', 'is_late', 'timestamp', 'id'
+            )
+        }
+    if upserted[ChangeLogEntry.KIND_SESSION]:
+        sessions = AttendanceSession.objects.filter(id__in=upserted[ChangeLogEntry.KIND_SESSION])
+        if teacher:
+            sessions = sessions.filter(teacher=teacher)
+        result['sessions'] = {
+            row['id']: row for row in sessions.values(
+                'id', 'name', 'date', 'start_time', 'end_time', 'class_session__name'
+            )
+        }
+    return result
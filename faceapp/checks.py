@@ -0,0 +1,17 @@
+"""System checks for deployment settings that break at runtime rather than at startup."""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+from .payload_cache import shared_cache_error
+
+
+@register(Tags.caches)
+def check_worker_cache(app_configs, **kwargs):
+    """JOBS_MODE='worker' needs a cache the separate run_jobs process shares with the web process"""
+    if getattr(settings, 'JOBS_MODE', 'thread') != 'worker':
+        return []
+    error = shared_cache_error("JOBS_MODE='worker' (python manage.py run_jobs)")
+    if not error:
+        return []
+    return [Error(error, hint="Use JOBS_MODE='thread' for a single process, or configure a shared cache.",
+                  id='faceapp.E001')]
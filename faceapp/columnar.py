@@ -0,0 +1,118 @@
+"""
+Columnar encoding of the dashboard payload.
+
+The row format repeats every key on every record and spells out student
+names in each session's present/absent/late lists. The columnar format
+(requested with ?format=columnar or an Accept header containing
+COLUMNAR_MEDIA_TYPE) sends one array per field instead. Students and
+sessions are dictionaries, and records and session details refer to them
+by integer index. A session's present list is built from its records in
+record order, the way get_complete_attendance_data() builds the name list,
+and its late list holds positions in that present list. Absent students are
+only known by name, so students sharing a name are all encoded as the first
+of them; the name they expand to is the same. Fields that are not row lists
+are passed through unchanged.
+Columnar bodies are encoded with orjson when it is installed.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+COLUMNAR_MEDIA_TYPE = 'application/vnd.faceapp.columnar+json'
+COLUMNAR_VERSION = 1
+
+STUDENT_FIELDS = ('id', 'name', 'student_id', 'email')
+SESSION_FIELDS = ('id', 'name', 'date', 'start_time', 'end_time', 'class_session__name')
+RECORD_FIELDS = ('id', 'date', 'time', 'arrival_time', 'is_late', 'timestamp')
+STATISTIC_FIELDS = ('total_sessions_attended', 'available_sessions', 'times_late', 'times_on_time',
+                    'attendance_percentage')
+
+
+def wants_columnar(request):
+    return (request.GET.get('format') == 'columnar'
+            or COLUMNAR_MEDIA_TYPE in request.META.get('HTTP_ACCEPT', ''))
+
+
+def encode_compact(data):
+    """JSON bytes without whitespace, via orjson when available"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS, default=DjangoJSONEncoder().default)
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8')
+
+
+def _columns(rows, fields):
+    return {field: [row.get(field) for row in rows] for field in fields}
+
+
+def columnar_attendance_data(data):
+    """Columnar form of a get_complete_attendance_data()-based payload"""
+    data = dict(data)
+    students = list(data.pop('all_students'))
+    sessions = data.pop('all_sessions')
+    records = data.pop('all_attendance_records')
+    details = data.pop('session_details')
+    statistics = data.pop('student_statistics')
+
+    # Records can reference students outside all_students (inactive or unenrolled);
+    # they are appended to the dictionary after the listed ones
+    listed_students = len(students)
+    student_index = {student['id']: i for i, student in enumerate(students)}
+    for record in records:
+        if record['student_id'] not in student_index:
+            student_index[record['student_id']] = len(students)
+            students.append({'id': record['student_id'], 'name': record['student__name']})
+    session_index = {session['id']: i for i, session in enumerate(sessions)}
+
+    # Absent lists hold names; the first student with a name stands for all of them
+    name_index = {}
+    for i, student in enumerate(students):
+        name_index.setdefault(student['name'], i)
+
+    def absent(detail):
+        return [name_index[name] for name in detail['absent_students']]
+
+    # Present and late students come from the session's own records, so both follow record order
+    records_by_session = {}
+    for record in records:
+        records_by_session.setdefault(record['session_id'], []).append(record)
+
+    def session_records(detail):
+        return records_by_session.get(detail['session_info']['id'], [])
+
+    def present(detail):
+        return [student_index[record['student_id']] for record in session_records(detail)]
+
+    def late(detail):
+        return [i for i, record in enumerate(session_records(detail)) if record['is_late']]
+
+    return {
+        **data,
+        'format': 'columnar',
+        'format_version': COLUMNAR_VERSION,
+        'listed_students': listed_students,
+        'students': _columns(students, STUDENT_FIELDS),
+        'sessions': _columns(sessions, SESSION_FIELDS),
+        'records': {
+            'student': [student_index[record['student_id']] for record in records],
+            'session': [session_index.get(record['session_id']) for record in records],
+            **_columns(records, RECORD_FIELDS),
+        },
+        'session_details': {
+            'key': list(details),
+            'session': [session_index[detail['session_info']['id']] for detail in details.values()],
+            'present': [present(detail) for detail in details.values()],
+            'absent': [absent(detail) for detail in details.values()],
+            'late': [late(detail) for detail in details.values()],
+            'eligible_count': [detail['eligible_count'] for detail in details.values()],
+        },
+        'student_statistics': {
+            'name': list(statistics),
+            **_columns(list(statistics.values()), STATISTIC_FIELDS),
+        },
+    }
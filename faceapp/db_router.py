@@ -0,0 +1,132 @@
+"""
+Read-replica routing for the heavy read-only views.
+
+When a 'replica' database is configured (REPLICA_DATABASE_URL), views
+decorated with @read_from_replica send their reads there. So does code
+wrapped in `with replica_reads():`. Everything else keeps using 'default':
+all writes, and every read outside those views.
+
+Read-after-write consistency:
+- Once a request writes to a faceapp model, its remaining reads go to the
+  primary.
+- The response then sets a pin cookie for REPLICA_STICKY_SECONDS. Until it
+  expires, that browser's requests read from the primary, so a teacher never
+  sees a dashboard older than their own last change. The window should
+  exceed the replica's usual lag.
+- Session and auth writes (django_session, last_login) do not pin.
+
+Other users can still read data up to the replica lag old, for the
+reads that go to the replica. Payloads cached per data version
+(faceapp.payload_cache) are always built inside primary_reads(). A cached
+payload is then served and 304-validated until the next version bump. If it
+had been built on a lagging replica just after a bump, it would stay stale
+for that whole time rather than for the replica lag. With the payload cache
+on, the cached views therefore only use the replica for their uncached
+reads.
+
+Migrations only run on the primary. In tests the replica mirrors 'default'.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+REPLICA_ALIAS = 'replica'
+PIN_COOKIE = 'primary_pin'
+
+
+class _Routing:
+    __slots__ = ('replica', 'pinned', 'wrote')
+
+    def __init__(self, replica=False, pinned=False):
+        self.replica = replica  # reads may use the replica
+        self.pinned = pinned  # the client wrote recently
+        self.wrote = False  # this request wrote to a faceapp model
+
+
+_routing = ContextVar('faceapp_db_routing', default=None)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def replica_reads():
+    """Send reads inside the block to the replica (unless pinned to the primary)"""
+    current = _routing.get()
+    state = _Routing(replica=True, pinned=current.pinned if current else False)
+    if current:
+        state.wrote = current.wrote
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+        if current and state.wrote:
+            current.wrote = True
+
+
+@contextmanager
+def primary_reads():
+    """Send reads inside the block to the primary, even within replica_reads()"""
+    current = _routing.get()
+    state = _Routing(replica=False, pinned=current.pinned if current else False)
+    if current:
+        state.wrote = current.wrote
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+        if current and state.wrote:
+            current.wrote = True
+
+
+def read_from_replica(view):
+    """View decorator: the view's reads may be served by the replica"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with replica_reads():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state and state.replica and not state.pinned and not state.wrote and replica_configured():
+            return REPLICA_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state and model._meta.app_label == 'faceapp':
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # both aliases hold the same data
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    """Per-request routing state; pins a client to the primary for a while after it writes"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _routing.set(_Routing(pinned=PIN_COOKIE in request.COOKIES))
+        try:
+            response = self.get_response(request)
+            wrote = _routing.get().wrote
+        finally:
+            _routing.reset(token)
+        if wrote and replica_configured():
+            response.set_cookie(PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 10),
+                                httponly=True, samesite='Lax')
+        return response
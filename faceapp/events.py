@@ -0,0 +1,134 @@
+"""
+In-process fan-out of live attendance events for Server-Sent Events.
+
+faceapp.signals publishes one compact event per created AttendanceRecord
+once its transaction commits. Every open /events/attendance/ stream holds
+a Subscription with a bounded queue. A subscriber that falls behind loses
+its queue and is told to reset (re-fetch) instead of blocking publishers.
+The broker keeps the last SSE_BUFFER_SIZE events in a ring buffer, so a
+reconnecting EventSource resumes from its Last-Event-ID. When that id has
+already left the buffer, the client also gets a reset.
+
+Events only reach streams served by the same process. The web service
+runs a single gunicorn worker (with threads for the long-lived streams).
+"""
+import itertools
+import queue
+import threading
+from collections import deque
+
+from django.conf import settings
+
+
+class Event:
+    __slots__ = ('id', 'teacher_id', 'session_id', 'data')
+
+    def __init__(self, event_id, teacher_id, session_id, data):
+        self.id = event_id
+        self.teacher_id = teacher_id
+        self.session_id = session_id
+        self.data = data
+
+
+class Subscription:
+    """Bounded queue of events for one stream, filtered by teacher and/or session"""
+
+    def __init__(self, broker, teacher_id=None, session_id=None, queue_size=100):
+        self.broker = broker
+        self.teacher_id = teacher_id
+        self.session_id = session_id
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize=queue_size)
+
+    def matches(self, event):
+        return ((self.teacher_id is None or event.teacher_id == self.teacher_id)
+                and (self.session_id is None or event.session_id == self.session_id))
+
+    def put(self, event):
+        if self.overflowed:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """Next event, or None after `timeout` seconds"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class EventBroker:
+    def __init__(self, buffer_size=500, max_subscribers=100):
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._buffer = deque(maxlen=buffer_size)
+        self._subscribers = set()
+
+    def publish(self, teacher_id, session_id, data):
+        with self._lock:
+            event = Event(next(self._ids), teacher_id, session_id, data)
+            self._buffer.append(event)
+            subscribers = [s for s in self._subscribers if s.matches(event)]
+        for subscription in subscribers:
+            subscription.put(event)
+        return event
+
+    def subscribe(self, teacher_id=None, session_id=None, last_event_id=None, queue_size=100):
+        """
+        Register a subscription; returns (subscription, backlog, complete).
+        `backlog` holds the buffered events after last_event_id. `complete`
+        is False when some of those events have already been evicted.
+        """
+        subscription = Subscription(self, teacher_id, session_id, queue_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers()
+            self._subscribers.add(subscription)
+            if last_event_id is None:
+                return subscription, [], True
+            oldest = self._buffer[0].id if self._buffer else None
+            latest = self._buffer[-1].id if self._buffer else 0
+            backlog = [e for e in self._buffer if e.id > last_event_id and subscription.matches(e)]
+        # An id ahead of ours comes from another process or a restart
+        complete = last_event_id <= latest and (oldest is None or last_event_id >= oldest - 1)
+        return subscription, backlog, complete
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+broker = EventBroker(
+    buffer_size=getattr(settings, 'SSE_BUFFER_SIZE', 500),
+    max_subscribers=getattr(settings, 'SSE_MAX_SUBSCRIBERS', 100),
+)
+
+
+def attendance_event(record):
+    """Compact event payload for an AttendanceRecord (with student and session loaded)"""
+    arrival = record.arrival_time or record.time
+    return {
+        'record': record.id,
+        'student': record.student_id,
+        'student_name': record.student.name,
+        'session': record.session_id,
+        'session_name': record.session.name if record.session else None,
+        'date': record.date.strftime('%Y-%m-%d') if record.date else None,
+        'arrival': arrival.strftime('%H:%M:%S') if arrival else None,
+        'late': record.is_late,
+    }
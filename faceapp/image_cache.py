@@ -0,0 +1,247 @@
+"""
+Pooled, cached image loading for student photos.
+
+Remote images (Cloudinary URLs) are fetched through one pooled
+requests.Session with timeouts and retries, and stored in a bounded on-disk
+LRU cache under IMAGE_CACHE_DIR keyed by URL. Each entry remembers the
+ETag / Last-Modified validators, so once an entry is older than
+IMAGE_CACHE_FRESH_SECONDS it is revalidated with a conditional GET instead
+of downloaded again. Decoded RGB arrays are kept in a small in-process LRU
+keyed by (source, validator) and returned read-only so callers can share
+them; use ``array.copy()`` before modifying one.
+
+Each process tracks the cache size from one directory scan plus the bytes it
+writes, and only scans again to evict when a write takes it past
+IMAGE_CACHE_MAX_BYTES. Other workers' writes are seen at that scan, so the
+limit is soft by whatever they wrote in between.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+import requests
+from django.conf import settings
+from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import metrics
+
+logger = logging.getLogger('faceapp.image_cache')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class ImageFetcher:
+    def __init__(self):
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._decoded = OrderedDict()
+        self._decoded_lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._size_lock = threading.Lock()
+        self._cache_bytes = None  # unknown until the first scan
+
+    @property
+    def cache_dir(self):
+        return _setting('IMAGE_CACHE_DIR', os.path.join(settings.MEDIA_ROOT, 'image_cache'))
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    retry = Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                                  allowed_methods=frozenset(['GET']))
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.cache_dir, key[:2], key)
+        return f"{base}.img", f"{base}.json"
+
+    def fetch_bytes(self, url):
+        """Return (body, validator) for a remote image, using the disk cache when possible"""
+        body_path, meta_path = self._paths(url)
+        meta = _read_meta(meta_path)
+        has_body = meta is not None and os.path.exists(body_path)
+
+        if has_body and time.time() - meta.get('fetched_at', 0) < _setting('IMAGE_CACHE_FRESH_SECONDS', 300):
+            metrics.cache_requests.inc(cache='image_disk', result='hit')
+            return self._read_cached(body_path), _validator(meta)
+
+        headers = {}
+        if has_body:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        try:
+            response = self.session.get(url, headers=headers, timeout=_setting('IMAGE_FETCH_TIMEOUT', (3.05, 10)))
+        except requests.RequestException as e:
+            if has_body:
+                logger.warning(f"Image fetch failed, serving stale cache for {url}: {e}")
+                metrics.cache_requests.inc(cache='image_disk', result='stale')
+                return self._read_cached(body_path), _validator(meta)
+            raise
+
+        if response.status_code == 304 and has_body:
+            meta['fetched_at'] = time.time()
+            write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+            metrics.cache_requests.inc(cache='image_disk', result='revalidated')
+            return self._read_cached(body_path), _validator(meta)
+
+        response.raise_for_status()
+        metrics.cache_requests.inc(cache='image_disk', result='miss')
+        body = response.content
+        replaced = meta.get('size', 0) if has_body else 0
+        meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+            'size': len(body),
+        }
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        write_atomic(body_path, body)
+        write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+        self._record_write(len(body) - replaced)
+        return body, _validator(meta)
+
+    def _read_cached(self, body_path):
+        with open(body_path, 'rb') as fh:
+            body = fh.read()
+        try:
+            os.utime(body_path)  # mtime doubles as the LRU clock
+        except OSError:
+            pass
+        return body
+
+    def _record_write(self, added):
+        with self._size_lock:
+            if self._cache_bytes is not None:
+                self._cache_bytes += added
+                if self._cache_bytes <= _setting('IMAGE_CACHE_MAX_BYTES', 200 * 1024 * 1024):
+                    return
+        self._evict()
+
+    def _evict(self):
+        """Scan the cache and delete least recently used entries until it fits IMAGE_CACHE_MAX_BYTES"""
+        max_bytes = _setting('IMAGE_CACHE_MAX_BYTES', 200 * 1024 * 1024)
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith('.img'):
+                        path = os.path.join(root, name)
+                        try:
+                            stat = os.stat(path)
+                        except OSError:
+                            continue
+                        entries.append((stat.st_mtime, stat.st_size, path))
+                        total += stat.st_size
+            if total > max_bytes:
+                entries.sort()
+                for _, size, path in entries:
+                    if total <= max_bytes:
+                        break
+                    for victim in (path, path[:-len('.img')] + '.json'):
+                        try:
+                            os.remove(victim)
+                        except OSError:
+                            pass
+                    total -= size
+            with self._size_lock:
+                self._cache_bytes = total
+        finally:
+            self._evict_lock.release()
+
+    def load_rgb(self, image_path):
+        """Load a local MEDIA_ROOT path or remote URL as a read-only RGB array (or None)"""
+        if image_path.startswith('http://') or image_path.startswith('https://'):
+            body, validator = self.fetch_bytes(image_path)
+            key = (image_path, validator)
+            cached = self._get_decoded(key)
+            if cached is not None:
+                return cached
+            return self._put_decoded(key, _decode_rgb(body))
+
+        full_path = os.path.join(settings.MEDIA_ROOT, image_path)
+        if not os.path.exists(full_path):
+            return None
+        key = (full_path, os.path.getmtime(full_path))
+        cached = self._get_decoded(key)
+        if cached is not None:
+            return cached
+        image = cv2.imread(full_path)
+        if image is None:
+            return None
+        return self._put_decoded(key, cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+
+    def _get_decoded(self, key):
+        with self._decoded_lock:
+            array = self._decoded.get(key)
+            if array is not None:
+                self._decoded.move_to_end(key)
+        metrics.cache_requests.inc(cache='image_decoded', result='hit' if array is not None else 'miss')
+        return array
+
+    def _put_decoded(self, key, array):
+        if array is None:
+            return None
+        array.setflags(write=False)
+        with self._decoded_lock:
+            self._decoded[key] = array
+            self._decoded.move_to_end(key)
+            while len(self._decoded) > _setting('IMAGE_DECODE_CACHE_SIZE', 64):
+                self._decoded.popitem(last=False)
+        return array
+
+
+def _decode_rgb(body):
+    image = cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR)
+    if image is not None:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    # Formats OpenCV cannot decode (e.g. GIF) go through Pillow
+    return np.array(Image.open(io.BytesIO(body)).convert('RGB'))
+
+
+def _validator(meta):
+    return meta.get('etag') or meta.get('last_modified') or meta.get('size')
+
+
+def _read_meta(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def write_atomic(path, data):
+    """Write `data` to `path` through a temporary file so readers never see a partial file"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp_path, path)
+
+
+image_fetcher = ImageFetcher()
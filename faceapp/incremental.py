@@ -0,0 +1,94 @@
+"""
+Incremental, watermark-based exports.
+
+An ExportConsumer is a named export owned by a teacher, e.g. a nightly
+sync. Its watermark is the highest AttendanceRecord id it has been sent.
+An export:
+- reads the owner's records (every record for admins) with ids after the
+  watermark, up to `high` (see below);
+- moves the watermark to `high` once the whole file has been written.
+
+An interrupted export leaves the watermark where it was, so the next call
+sends the same rows again plus anything newer. Two exports running at once
+cannot both advance it. The reads are id-range scans: on the
+(teacher, id) index for teachers, and on the primary key for admins. A
+nightly run therefore costs time in proportion to the new records, not
+the history.
+
+Ids are used rather than timestamps because they are unique. But an id
+is allocated when its record is inserted and only becomes visible when
+that transaction commits, and transactions can commit out of id order.
+Using the newest visible id as `high` could move the watermark past a
+record that is still uncommitted, and that record would never be
+exported. So `high` stops just below the first record (in id order)
+created within the last EXPORT_WATERMARK_LAG_SECONDS. Records from there
+on wait for a later export. This is safe as long as no transaction that
+creates records stays open longer than the lag.
+
+The export sends new records only: updates and deletions of
+rows already exported are not sent again (faceapp.changelog tracks those).
+reset() moves the watermark back to 0 for a full re-export, to any id, or
+to the newest settled record to skip the history.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import AttendanceRecord, ExportConsumer
+
+RESET_LATEST = 'latest'
+
+
+def consumer_for(teacher, name):
+    consumer, _ = ExportConsumer.objects.get_or_create(teacher=teacher, name=name)
+    return consumer
+
+
+def consumer_records(consumer):
+    """Every record the consumer's owner may export"""
+    records = AttendanceRecord.objects.all()
+    if not consumer.teacher.is_admin:
+        records = records.filter(teacher_id=consumer.teacher_id)
+    return records
+
+
+def settled_high(records, start):
+    """Highest id after `start` below every record younger than the lag (`start` when none)"""
+    records = records.filter(id__gt=start)
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'EXPORT_WATERMARK_LAG_SECONDS', 60))
+    recent = records.filter(timestamp__gte=cutoff).aggregate(first=Min('id'))['first']
+    if recent is not None:
+        records = records.filter(id__lt=recent)
+    return records.aggregate(high=Max('id'))['high'] or start
+
+
+def pending_records(consumer):
+    """(records after the watermark in id order, high watermark) of the next export"""
+    start = consumer.watermark
+    records = consumer_records(consumer)
+    high = settled_high(records, start)
+    return records.filter(id__gt=start, id__lte=high).order_by('id'), high
+
+
+def advance(consumer, start, high):
+    """Move the watermark from `start` to `high`; False when another export moved it first"""
+    if high == start:
+        return True
+    updated = ExportConsumer.objects.filter(id=consumer.id, watermark=start).update(watermark=high, updated_at=timezone.now())
+    if updated:
+        consumer.watermark = high
+    return bool(updated)
+
+
+def reset(consumer, watermark=0):
+    """Set the watermark to a record id, or RESET_LATEST for the newest settled record"""
+    if watermark == RESET_LATEST:
+        watermark = settled_high(consumer_records(consumer), 0)
+    watermark = int(watermark)
+    if watermark < 0:
+        raise ValueError('Watermark must be a record id or 0')
+    consumer.watermark = watermark
+    consumer.save(update_fields=['watermark', 'updated_at'])
+    return consumer
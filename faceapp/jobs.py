@@ -0,0 +1,264 @@
+"""
+Database-backed background job queue.
+
+Slow side effects (Cloudinary uploads, Rekognition indexing and deletes,
+large exports) are stored as BackgroundJob rows and executed outside the
+request by a worker:
+
+* ``python manage.py run_jobs`` - a dedicated worker process, or
+* JOBS_MODE='thread' - a daemon thread inside the web process (default,
+  for single-service deployments), or
+* JOBS_MODE='inline' - run synchronously after commit (tests / debugging).
+
+Jobs are claimed with a conditional UPDATE so several workers can share
+the table safely, retried with exponential backoff up to max_attempts,
+and deduplicated through an optional idempotency key. Enqueueing a key
+whose job failed for good queues that job again, so a user retry is not
+a silent no-op.
+
+A handler can register an on_failure callback, called once the job fails
+for good, to undo what the request did before enqueueing it.
+
+In thread mode the WSGI application (attendance_system.wsgi) starts the
+worker thread on the first request each process serves, so jobs left
+queued by a restart run without waiting for the next enqueue.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BackgroundJob
+
+logger = logging.getLogger('faceapp.jobs')
+
+_handlers = {}
+_failure_handlers = {}
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying cannot help; the job fails immediately"""
+
+
+def job_handler(kind, on_failure=None):
+    """
+    Register a function(job) -> result as the handler for jobs of `kind`;
+    on_failure(job) runs after the last attempt failed
+    """
+    def decorator(func):
+        _handlers[kind] = func
+        if on_failure is not None:
+            _failure_handlers[kind] = on_failure
+        return func
+    return decorator
+
+
+def _mode():
+    return getattr(settings, 'JOBS_MODE', 'thread')
+
+
+def enqueue(kind, payload=None, idempotency_key=None, created_by=None, max_attempts=5, delay=0):
+    """
+    Queue a job, or return the existing one when `idempotency_key` was
+    already used; an existing job that failed is queued again
+    """
+    if idempotency_key:
+        existing = BackgroundJob.objects.filter(idempotency_key=idempotency_key).first()
+        if existing and existing.status == BackgroundJob.STATUS_FAILED:
+            requeued = BackgroundJob.objects.filter(id=existing.id, status=BackgroundJob.STATUS_FAILED).update(
+                kind=kind, payload=payload or {}, created_by=created_by, max_attempts=max_attempts, attempts=0,
+                status=BackgroundJob.STATUS_QUEUED, run_after=timezone.now() + timedelta(seconds=delay),
+                finished_at=None, result=None,
+            )
+            existing.refresh_from_db()
+            if requeued:
+                _schedule(existing, requeued=True)
+            return existing
+        if existing:
+            return existing
+
+    fields = dict(
+        kind=kind,
+        payload=payload or {},
+        idempotency_key=idempotency_key,
+        created_by=created_by,
+        max_attempts=max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+    try:
+        with transaction.atomic():
+            job = BackgroundJob.objects.create(**fields)
+    except IntegrityError:
+        return BackgroundJob.objects.get(idempotency_key=idempotency_key)
+    _schedule(job)
+    return job
+
+
+def _schedule(job, requeued=False):
+    mode = _mode()
+    if mode == 'inline':
+        transaction.on_commit(lambda: run_job(job.id))
+    elif mode == 'thread':
+        transaction.on_commit(wake_worker)
+    logger.info(f"{'Re-enqueued' if requeued else 'Enqueued'} {job.kind} job {job.id}")
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def claim_next(worker):
+    """Atomically claim the next runnable job (or a stale running one) for `worker`"""
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=getattr(settings, 'JOBS_LOCK_TIMEOUT', 600))
+    runnable = BackgroundJob.objects.filter(
+        Q(status=BackgroundJob.STATUS_QUEUED, run_after__lte=now) |
+        Q(status=BackgroundJob.STATUS_RUNNING, locked_at__lt=stale_before)
+    ).order_by('run_after', 'id')
+
+    for job_id, status in runnable.values_list('id', 'status')[:5]:
+        claimed = BackgroundJob.objects.filter(id=job_id, status=status).filter(
+            Q(status=BackgroundJob.STATUS_QUEUED) | Q(locked_at__lt=stale_before)
+        ).update(status=BackgroundJob.STATUS_RUNNING, locked_by=worker, locked_at=now)
+        if claimed:
+            return BackgroundJob.objects.get(id=job_id)
+    return None
+
+
+def _backoff_seconds(attempts):
+    base = getattr(settings, 'JOBS_RETRY_BASE_SECONDS', 5)
+    return min(base * (2 ** (attempts - 1)), 3600) * random.uniform(0.8, 1.2)
+
+
+def run_job(job_or_id, worker=None):
+    """Execute one job and record success, retry or failure"""
+    job = job_or_id
+    if not isinstance(job, BackgroundJob):
+        job = claim_specific(job_or_id, worker or worker_name())
+        if job is None:
+            return None
+
+    handler = _handlers.get(job.kind)
+    job.attempts += 1
+    started = time.perf_counter()
+    try:
+        if handler is None:
+            raise PermanentJobError(f"No handler registered for job kind '{job.kind}'")
+        result = handler(job)
+    except Exception as e:
+        permanent = isinstance(e, PermanentJobError) or job.attempts >= job.max_attempts
+        job.last_error = str(e)[:4000]
+        job.locked_by = ''
+        job.locked_at = None
+        if permanent:
+            job.status = BackgroundJob.STATUS_FAILED
+            job.finished_at = timezone.now()
+            logger.error(f"Job {job.id} ({job.kind}) failed after {job.attempts} attempt(s): {e}",
+                         exc_info=not isinstance(e, PermanentJobError))
+            on_failure = _failure_handlers.get(job.kind)
+            if on_failure is not None:
+                try:
+                    on_failure(job)
+                except Exception as cleanup_error:
+                    logger.exception(f"Failure handler of job {job.id} ({job.kind}) raised: {cleanup_error}")
+        else:
+            delay = _backoff_seconds(job.attempts)
+            job.status = BackgroundJob.STATUS_QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+            logger.warning(f"Job {job.id} ({job.kind}) attempt {job.attempts} failed, retrying in {delay:.0f}s: {e}")
+        job.save()
+        return job
+
+    job.status = BackgroundJob.STATUS_SUCCEEDED
+    job.result = result
+    job.last_error = ''
+    job.locked_by = ''
+    job.locked_at = None
+    job.finished_at = timezone.now()
+    job.save()
+    logger.info(f"Job {job.id} ({job.kind}) succeeded in {time.perf_counter() - started:.2f}s")
+    return job
+
+
+def claim_specific(job_id, worker):
+    claimed = BackgroundJob.objects.filter(id=job_id, status=BackgroundJob.STATUS_QUEUED).update(
+        status=BackgroundJob.STATUS_RUNNING, locked_by=worker, locked_at=timezone.now()
+    )
+    return BackgroundJob.objects.get(id=job_id) if claimed else None
+
+
+def run_pending(worker=None, limit=None):
+    """Run runnable jobs until the queue is empty (or `limit` jobs ran); returns the count"""
+    worker = worker or worker_name()
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_next(worker)
+        if job is None:
+            break
+        run_job(job, worker)
+        processed += 1
+    return processed
+
+
+# In-process worker thread (JOBS_MODE='thread')
+
+_thread = None
+_thread_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def _thread_worker_loop():
+    poll = getattr(settings, 'JOBS_POLL_INTERVAL', 2.0)
+    worker = worker_name()
+    while True:
+        _wakeup.wait(poll)
+        _wakeup.clear()
+        try:
+            close_old_connections()
+            run_pending(worker)
+        except Exception as e:
+            logger.exception(f"Job worker thread error: {e}")
+        finally:
+            close_old_connections()
+
+
+def ensure_worker():
+    """Start the in-process worker thread unless it is running; returns False unless JOBS_MODE='thread'"""
+    global _thread
+    if _mode() != 'thread':
+        return False
+    if _thread is None or not _thread.is_alive():
+        with _thread_lock:
+            if _thread is None or not _thread.is_alive():
+                _thread = threading.Thread(target=_thread_worker_loop, name='faceapp-jobs', daemon=True)
+                _thread.start()
+    return True
+
+
+def wake_worker():
+    """Start (if needed) and wake the in-process worker thread; no-op unless JOBS_MODE='thread'"""
+    if ensure_worker():
+        _wakeup.set()
+
+
+def job_status_payload(job):
+    """JSON-friendly status of a job for polling clients"""
+    return {
+        'job_id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'result': job.result,
+        'error': job.last_error or None,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
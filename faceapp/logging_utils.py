@@ -0,0 +1,119 @@
+"""
+Non-blocking, request-correlated logging.
+
+start_queue_logging() moves the handlers configured in settings.LOGGING
+behind a QueueHandler/QueueListener pair, so request threads only enqueue
+records and file/console I/O happens on a background thread. The
+RequestIdFilter stamps every record with the id of the request that
+produced it (see RequestIdMiddleware), which ties together all log lines
+for one attendance frame.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import uuid
+
+_request_id = contextvars.ContextVar('faceapp_request_id', default='-')
+
+_listeners = []
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+def set_request_id(value=None):
+    """Bind a request id to the current context and return (id, reset token)"""
+    request_id = value or uuid.uuid4().hex[:16]
+    return request_id, _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+def sampled(rate):
+    """True for roughly `rate` (0..1) of calls; used to thin out payload dumps"""
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+class RequestIdFilter(logging.Filter):
+    """Attach the current request id to records that do not carry one yet"""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = _request_id.get()
+        return True
+
+
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including any `extra=` fields"""
+
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def start_queue_logging(logger_names):
+    """Route the handlers of the given loggers through background listeners"""
+    if _listeners:
+        return
+    for name in logger_names:
+        logger = logging.getLogger(name or None)
+        handlers = [h for h in logger.handlers if not isinstance(h, logging.handlers.QueueHandler)]
+        if not handlers:
+            continue
+        log_queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(RequestIdFilter())
+        listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        for handler in handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(queue_handler)
+        listener.start()
+        _listeners.append((queue_handler, listener))
+
+
+def stop_queue_logging():
+    """Flush queued records and stop the listener threads"""
+    for _, listener in _listeners:
+        try:
+            listener.stop()
+        except Exception:
+            pass
+
+
+def _restart_after_fork():
+    # Listener threads do not survive fork (gunicorn --preload); give each
+    # child fresh queues and threads.
+    for index, (queue_handler, listener) in enumerate(_listeners):
+        log_queue = queue.SimpleQueue()
+        queue_handler.queue = log_queue
+        new_listener = logging.handlers.QueueListener(
+            log_queue, *listener.handlers, respect_handler_level=True
+        )
+        new_listener.start()
+        _listeners[index] = (queue_handler, new_listener)
+
+
+atexit.register(stop_queue_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
@@ -0,0 +1,64 @@
+"""
+Move closed terms (Class.academic_year + semester) into Parquet archives.
+
+Terms are given as YEAR:SEMESTER, or picked with --idle-days: every term
+without a session in the last N days. Archived sessions and records are
+deleted from the database; see faceapp.archive.
+
+Examples:
+    python manage.py archive_terms 2023-2024:Fall 2023-2024:Spring
+    python manage.py archive_terms --idle-days 120 --dry-run
+"""
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Max
+
+from faceapp.archive import archive_term, term_sessions
+from faceapp.models import AttendanceSession
+from faceapp.payload_cache import shared_cache_error
+
+
+class Command(BaseCommand):
+    help = 'Archive the sessions and records of closed terms to Parquet files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('terms', nargs='*', help='Terms to archive, as YEAR:SEMESTER (e.g. 2023-2024:Fall)')
+        parser.add_argument('--idle-days', type=int,
+                            help='Archive every term whose newest session is more than N days old')
+        parser.add_argument('--dry-run', action='store_true', help='List what would be archived without writing')
+
+    def handle(self, *args, **options):
+        terms = []
+        for spec in options['terms']:
+            academic_year, _, semester = spec.partition(':')
+            if not academic_year or not semester:
+                raise CommandError(f"Invalid term {spec!r}; expected YEAR:SEMESTER")
+            terms.append((academic_year, semester))
+        if options['idle_days'] is not None:
+            cutoff = date.today() - timedelta(days=options['idle_days'])
+            idle = AttendanceSession.objects.filter(class_session__isnull=False).values(
+                'class_session__academic_year', 'class_session__semester'
+            ).annotate(last=Max('date')).filter(last__lt=cutoff).order_by('last')
+            terms += [(row['class_session__academic_year'], row['class_session__semester']) for row in idle]
+        if not terms:
+            raise CommandError('Give terms as YEAR:SEMESTER or use --idle-days')
+        error = None if options['dry_run'] else shared_cache_error('archive_terms')
+        if error:
+            raise CommandError(error)
+
+        for academic_year, semester in dict.fromkeys(terms):
+            label = f"{academic_year} {semester}"
+            if options['dry_run']:
+                counts = term_sessions(academic_year, semester).aggregate(
+                    sessions=Count('id', distinct=True), records=Count('attendancerecord'))
+                self.stdout.write(f"{label}: {counts['sessions']} sessions, {counts['records']} records")
+                continue
+            term = archive_term(academic_year, semester)
+            if term is None:
+                self.stdout.write(f"{label}: nothing to archive")
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{label}: archived to {term.path} ({term.session_count} sessions, "
+                    f"{term.record_count} records in total)"
+                ))
@@ -0,0 +1,42 @@
+"""
+Copy session keys (teacher, class, session date) onto attendance records.
+
+Migration 0013 already does this once; rerun it after writes that bypass
+the model signals (raw SQL, bulk_create, QuerySet.update on sessions).
+
+Examples:
+    python manage.py backfill_record_keys           # fix every stale record
+    python manage.py backfill_record_keys --verify  # report stale records, change nothing
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from faceapp.payload_cache import bump_data_version, shared_cache_error
+from faceapp.record_keys import backfill_record_keys, stale_records
+
+
+class Command(BaseCommand):
+    help = 'Fill AttendanceRecord.teacher/class_session/session_date from their sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Records updated per statement')
+        parser.add_argument('--verify', action='store_true',
+                            help='Count records whose keys differ from their session without writing')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            stale = stale_records().count()
+            if stale:
+                raise CommandError(f"{stale} attendance record(s) have stale session keys; run without --verify")
+            self.stdout.write(self.style.SUCCESS("Attendance record keys are up to date"))
+            return
+
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        error = shared_cache_error('backfill_record_keys')
+        if error:
+            raise CommandError(error)
+        updated = backfill_record_keys(batch_size=options['batch_size'])
+        if updated:
+            # update() sends no signals; payloads group records by these keys
+            bump_data_version()
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated} attendance record(s)"))
@@ -0,0 +1,60 @@
+"""
+Link students enrolled before content-addressed storage to a StudentImage
+and generate their thumbnail and face-crop derivatives.
+
+Example:
+    python manage.py backfill_student_images --limit 100
+"""
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from faceapp.image_cache import image_fetcher
+from faceapp.models import Student, StudentImage
+from faceapp.payload_cache import bump_data_version, shared_cache_error
+from faceapp.student_images import build_derivatives, store_photo
+
+
+class Command(BaseCommand):
+    help = 'Store existing student photos by content hash and build their derivatives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Process at most this many students')
+
+    def handle(self, *args, **options):
+        error = shared_cache_error('backfill_student_images')
+        if error:
+            raise CommandError(error)
+        students = Student.objects.filter(image__isnull=True).exclude(image_path='').order_by('id')
+        if options['limit']:
+            students = students[:options['limit']]
+
+        linked = failed = 0
+        for student in students:
+            try:
+                if student.image_path.startswith('http'):
+                    image_bytes = image_fetcher.fetch_bytes(student.image_path)[0]
+                else:
+                    with open(os.path.join(settings.MEDIA_ROOT, student.image_path), 'rb') as fh:
+                        image_bytes = fh.read()
+
+                student_image, _, created = store_photo(image_bytes)
+                if created and student.image_path.startswith('http'):
+                    # Keep pointing at the already uploaded original instead of uploading a copy
+                    os.remove(os.path.join(settings.MEDIA_ROOT, student_image.original))
+                    StudentImage.objects.filter(id=student_image.id).update(original=student.image_path)
+                    student_image.original = student.image_path
+                if not student_image.thumbnail:
+                    build_derivatives(student_image)
+                Student.objects.filter(id=student.id).update(image=student_image)
+                linked += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"{student.name} (id {student.id}): {e}")
+
+        if linked:
+            # update() sends no signals; invalidate payloads that include thumbnail URLs
+            bump_data_version()
+        self.stdout.write(self.style.SUCCESS(f"Linked {linked} student(s), {failed} failed"))
@@ -0,0 +1,377 @@
+"""
+Micro-benchmark for the attendance recognition pipeline.
+
+Drives the same helpers used by take_attendance_with_session and add_student
+(base64 decode, frame decode/normalize, detection, search and the enrollment
+and attendance DB writes) with synthetic images, and reports per-stage
+latency percentiles, throughput and peak RSS as JSON so runs can be diffed
+between commits.
+
+Example:
+    python manage.py benchmark_recognition --gallery-sizes 10,100,1000 \
+        --concurrency 1,4 --frames 200 --output bench/recognition.json
+
+--backend aws indexes the synthetic faces into the configured Rekognition
+collection, and cleanup deletes them again. It refuses to run unless both
+the database and the collection are scratch ones (their names contain
+'test' or 'bench'), or --allow-live is given.
+"""
+import base64
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from faceapp.models import Teacher, Class, Student, AttendanceSession, AttendanceRecord
+from faceapp.views import face_recognition_utils as fr
+
+
+STAGES = ['base64_decode', 'image_decode', 'detect', 'search', 'enroll_write', 'attendance_write']
+SCRATCH_MARKERS = ('test', 'bench')  # names of databases and collections safe to benchmark against
+DELETE_BATCH = 1000  # face ids per Rekognition delete_faces call (the API allows 4096)
+
+
+def is_scratch(name):
+    return any(marker in str(name).lower() for marker in SCRATCH_MARKERS)
+
+
+class StubRekognitionClient:
+    """Local stand-in for the boto3 Rekognition client with deterministic responses"""
+
+    def __init__(self, latency_ms=0.0, match_rate=0.9):
+        self.latency = latency_ms / 1000.0
+        self.match_rate = match_rate
+        self.gallery = []
+        self._lock = threading.Lock()
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def detect_faces(self, Image, Attributes=None):
+        self._wait()
+        return {'FaceDetails': [{
+            'BoundingBox': {'Left': 0.3, 'Top': 0.2, 'Width': 0.4, 'Height': 0.5},
+            'Confidence': 99.9,
+        }]}
+
+    def search_faces_by_image(self, CollectionId, Image, MaxFaces=1, FaceMatchThreshold=80):
+        self._wait()
+        with self._lock:
+            gallery = list(self.gallery)
+        if not gallery or random.random() > self.match_rate:
+            return {'FaceMatches': []}
+        return {'FaceMatches': [{
+            'Similarity': 97.5,
+            'Face': {'FaceId': uuid.uuid4().hex, 'ExternalImageId': random.choice(gallery)},
+        }]}
+
+    def index_faces(self, CollectionId, Image, ExternalImageId, **kwargs):
+        self._wait()
+        with self._lock:
+            self.gallery.append(ExternalImageId)
+        return {'FaceRecords': [{'Face': {'FaceId': uuid.uuid4().hex}}]}
+
+    def delete_faces(self, CollectionId, FaceIds):
+        self._wait()
+        return {'DeletedFaces': FaceIds}
+
+
+def synthetic_face_image(width, height, seed):
+    """Build a noisy JPEG with a face-like ellipse and return it as a data URL"""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+    center = (width // 2, height // 2)
+    axes = (width // 5, height // 3)
+    cv2.ellipse(frame, center, axes, 0, 0, 360, (180, 150, 130), -1)
+    cv2.circle(frame, (center[0] - axes[0] // 2, center[1] - axes[1] // 4), max(axes[0] // 8, 2), (40, 40, 40), -1)
+    cv2.circle(frame, (center[0] + axes[0] // 2, center[1] - axes[1] // 4), max(axes[0] // 8, 2), (40, 40, 40), -1)
+    ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if not ok:
+        raise CommandError("Failed to encode synthetic image")
+    return 'data:image/jpeg;base64,' + base64.b64encode(encoded.tobytes()).decode('ascii')
+
+
+def percentile_summary(samples):
+    """Return count/mean/p50/p95/p99/max in milliseconds"""
+    if not samples:
+        return {'count': 0}
+    arr = np.asarray(samples) * 1000.0
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {
+        'count': int(arr.size),
+        'mean_ms': round(float(arr.mean()), 3),
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'max_ms': round(float(arr.max()), 3),
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return round(peak / (1024 * 1024), 1)
+    return round(peak / 1024, 1)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the attendance recognition pipeline with synthetic images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=['stub', 'aws'], default='stub',
+                            help='Use the local stub client or the configured AWS Rekognition collection')
+        parser.add_argument('--gallery-sizes', default='10,100',
+                            help='Comma-separated numbers of enrolled students to benchmark against')
+        parser.add_argument('--concurrency', default='1,4',
+                            help='Comma-separated numbers of concurrent worker threads')
+        parser.add_argument('--frames', type=int, default=100,
+                            help='Number of attendance frames per configuration')
+        parser.add_argument('--width', type=int, default=640)
+        parser.add_argument('--height', type=int, default=480)
+        parser.add_argument('--backend-latency-ms', type=float, default=0.0,
+                            help='Simulated round-trip latency for the stub backend')
+        parser.add_argument('--output', default=None,
+                            help='Write JSON results to this path')
+        parser.add_argument('--keep-data', action='store_true',
+                            help='Do not delete the benchmark teacher, students, records and indexed faces afterwards')
+        parser.add_argument('--allow-live', action='store_true',
+                            help='Allow --backend aws against a database or collection that is not a test one')
+
+    def handle(self, *args, **options):
+        gallery_sizes = self._int_list(options['gallery_sizes'], '--gallery-sizes')
+        concurrency_levels = self._int_list(options['concurrency'], '--concurrency')
+
+        original_client, original_configured = fr.rekognition_client, fr.AWS_CONFIGURED
+        if options['backend'] == 'stub':
+            fr.rekognition_client = StubRekognitionClient(latency_ms=options['backend_latency_ms'])
+            fr.AWS_CONFIGURED = True
+        elif not fr.AWS_CONFIGURED:
+            raise CommandError("AWS Rekognition is not configured; use --backend stub")
+        else:
+            database, collection = connection.settings_dict['NAME'], getattr(fr, 'AWS_COLLECTION_ID', '')
+            if not (is_scratch(database) and is_scratch(collection)) and not options['allow_live']:
+                raise CommandError(
+                    f"--backend aws would index benchmark faces into collection {collection!r} on database "
+                    f"{database!r}. Use a test database and collection (names containing "
+                    f"{' or '.join(map(repr, SCRATCH_MARKERS))}) or pass --allow-live."
+                )
+        self.indexed_faces = []
+
+        images = [synthetic_face_image(options['width'], options['height'], seed) for seed in range(16)]
+        results = {
+            'started_at': datetime.now().isoformat(),
+            'git_revision': git_revision(),
+            'backend': options['backend'],
+            'database_vendor': connection.vendor,
+            'image_size': [options['width'], options['height']],
+            'frames_per_run': options['frames'],
+            'runs': [],
+        }
+
+        teacher = None
+        try:
+            for gallery_size in gallery_sizes:
+                teacher, class_obj, session = self._setup_fixture(gallery_size)
+                enroll_samples = self._enroll_gallery(teacher, class_obj, gallery_size, images)
+
+                for workers in concurrency_levels:
+                    AttendanceRecord.objects.filter(session=session).delete()
+                    run = self._run_attendance(session, images, options['frames'], workers)
+                    run['gallery_size'] = gallery_size
+                    run['stages']['enroll_write'] = percentile_summary(enroll_samples)
+                    results['runs'].append(run)
+                    self._print_run(run)
+
+                if not options['keep_data']:
+                    self._cleanup(teacher)
+                    teacher = None
+        finally:
+            if teacher is not None and not options['keep_data']:
+                self._cleanup(teacher)
+            fr.rekognition_client, fr.AWS_CONFIGURED = original_client, original_configured
+
+        results['finished_at'] = datetime.now().isoformat()
+        if options['output']:
+            os.makedirs(os.path.dirname(os.path.abspath(options['output'])), exist_ok=True)
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def _int_list(self, value, flag):
+        try:
+            values = [int(v) for v in value.split(',') if v.strip()]
+        except ValueError:
+            raise CommandError(f"{flag} must be a comma-separated list of integers")
+        if not values or any(v <= 0 for v in values):
+            raise CommandError(f"{flag} values must be positive")
+        return values
+
+    def _setup_fixture(self, gallery_size):
+        suffix = uuid.uuid4().hex[:8]
+        teacher = Teacher.objects.create_user(
+            username=f"bench_{suffix}", password=uuid.uuid4().hex,
+            first_name='Bench', last_name='Teacher'
+        )
+        class_obj = Class.objects.create(
+            name=f"Benchmark {gallery_size}", code=f"BENCH{suffix}", teacher=teacher
+        )
+        session = AttendanceSession.objects.create(
+            name=f"Benchmark session {gallery_size}",
+            date=date.today(),
+            start_time=(datetime.now() - timedelta(minutes=5)).time(),
+            teacher=teacher,
+            class_session=class_obj
+        )
+        return teacher, class_obj, session
+
+    def _enroll_gallery(self, teacher, class_obj, gallery_size, images):
+        """Enroll students through index_face_rekognition and time the DB writes"""
+        samples = []
+        for i in range(gallery_size):
+            student_id = f"BENCH{class_obj.id}-{i}"
+            image_bytes = fr.decode_base64_image(images[i % len(images)])
+            face_id = fr.index_face_rekognition(image_bytes, student_id, f"Bench Student {i}")
+            if face_id:
+                self.indexed_faces.append(face_id)
+
+            started = time.perf_counter()
+            student = Student.objects.create(
+                name=f"Bench Student {i}",
+                student_id=student_id,
+                image_path=f"students/bench_{i}.jpg",
+                face_encoding=json.dumps({'face_id': face_id, 'student_id': student_id,
+                                          'service': 'benchmark'})
+            )
+            student.classes.add(class_obj)
+            samples.append(time.perf_counter() - started)
+        return samples
+
+    def _process_frame(self, session, image_data):
+        """One attendance frame, stage for stage as in take_attendance_with_session"""
+        timings = {}
+
+        started = time.perf_counter()
+        img_bytes = fr.decode_base64_image(image_data)
+        timings['base64_decode'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        matched_student_id, similarity = fr.search_face_rekognition(img_bytes, threshold=80)
+        timings['search'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        rgb_frame, detect_bytes = fr.prepare_detection_frame(img_bytes)
+        timings['image_decode'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        detected_faces = fr.detect_faces_rekognition(detect_bytes)
+        height, width = rgb_frame.shape[:2]
+        fr.scale_faces_to_frame(detected_faces, height, width)
+        timings['detect'] = time.perf_counter() - started
+
+        if matched_student_id:
+            started = time.perf_counter()
+            student = Student.objects.filter(student_id=matched_student_id, is_active=True).first()
+            if student and session.class_session.students.filter(id=student.id).exists():
+                if not AttendanceRecord.objects.filter(student=student, session=session).exists():
+                    arrival_time = datetime.now().time()
+                    AttendanceRecord.objects.get_or_create(
+                        student=student, session=session,
+                        defaults={'arrival_time': arrival_time,
+                                  'is_late': arrival_time > session.start_time}
+                    )
+                AttendanceRecord.objects.filter(session=session).count()
+            timings['attendance_write'] = time.perf_counter() - started
+
+        return timings
+
+    def _run_attendance(self, session, images, frames, workers):
+        samples = {stage: [] for stage in STAGES}
+        errors = []
+
+        def task(i):
+            close_old_connections()
+            try:
+                return self._process_frame(session, images[i % len(images)])
+            except Exception as e:
+                errors.append(str(e))
+                return {}
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        if workers == 1:
+            frame_timings = [self._process_frame(session, images[i % len(images)]) for i in range(frames)]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                frame_timings = list(pool.map(task, range(frames)))
+        elapsed = time.perf_counter() - started
+
+        for timings in frame_timings:
+            for stage, value in timings.items():
+                samples[stage].append(value)
+
+        return {
+            'concurrency': workers,
+            'frames': frames,
+            'elapsed_s': round(elapsed, 3),
+            'fps': round(frames / elapsed, 2) if elapsed else None,
+            'errors': len(errors),
+            'error_samples': errors[:5],
+            'peak_rss_mb': peak_rss_mb(),
+            'stages': {stage: percentile_summary(values) for stage, values in samples.items()},
+        }
+
+    def _print_run(self, run):
+        self.stdout.write(
+            f"\ngallery={run['gallery_size']} concurrency={run['concurrency']} "
+            f"fps={run['fps']} peak_rss={run['peak_rss_mb']}MB errors={run['errors']}"
+        )
+        for stage in STAGES:
+            stats = run['stages'][stage]
+            if stats.get('count'):
+                self.stdout.write(
+                    f"  {stage:<17} n={stats['count']:<6} p50={stats['p50_ms']:>9.3f}ms "
+                    f"p95={stats['p95_ms']:>9.3f}ms p99={stats['p99_ms']:>9.3f}ms"
+                )
+
+    def _cleanup(self, teacher):
+        Student.objects.filter(classes__teacher=teacher).delete()
+        teacher.delete()
+        self._delete_indexed_faces()
+
+    def _delete_indexed_faces(self):
+        """Remove the faces this run indexed from the collection (the stub's in-memory one included)"""
+        faces, self.indexed_faces = self.indexed_faces, []
+        failed = 0
+        for start in range(0, len(faces), DELETE_BATCH):
+            batch = faces[start:start + DELETE_BATCH]
+            try:
+                fr.rekognition_client.delete_faces(CollectionId=getattr(fr, 'AWS_COLLECTION_ID', ''), FaceIds=batch)
+            except Exception as e:
+                failed += len(batch)
+                self.stderr.write(f"Could not delete {len(batch)} benchmark face(s): {e}")
+        if failed:
+            self.stderr.write(f"{failed} indexed benchmark face(s) remain in the collection")
@@ -0,0 +1,74 @@
+"""
+Write the records created since a consumer's last export to a file.
+
+The consumer is named per teacher (see faceapp.incremental). Its watermark
+only advances once the file has been written completely. When there is
+nothing new, no file is written.
+
+Examples:
+    python manage.py incremental_export nightly --teacher admin --type parquet
+    python manage.py incremental_export nightly --teacher admin --output /data/attendance.csv
+    python manage.py incremental_export nightly --teacher admin --reset latest
+"""
+import os
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_slug
+
+from faceapp import incremental
+from faceapp.models import Teacher
+from faceapp.views.dashboard_views import EXPORT_EXTENSIONS, incremental_export_stream
+
+
+class Command(BaseCommand):
+    help = "Export the attendance records created since a consumer's watermark"
+
+    def add_arguments(self, parser):
+        parser.add_argument('consumer', help='Consumer name (letters, digits, - and _)')
+        parser.add_argument('--teacher', required=True, help='Username owning the consumer; admins export every record')
+        parser.add_argument('--type', choices=['csv', 'parquet', 'arrow'], default='parquet')
+        parser.add_argument('--output', help='File to write (default MEDIA_ROOT/exports/<consumer>-<from>-<to>.<ext>)')
+        parser.add_argument('--reset', metavar='WATERMARK',
+                            help="Set the watermark (a record id, 0 or 'latest') instead of exporting")
+
+    def handle(self, *args, **options):
+        try:
+            validate_slug(options['consumer'])
+        except ValidationError:
+            raise CommandError(f"Invalid consumer name {options['consumer']!r}")
+        teacher = Teacher.objects.filter(username=options['teacher']).first()
+        if teacher is None:
+            raise CommandError(f"No teacher {options['teacher']!r}")
+        consumer = incremental.consumer_for(teacher, options['consumer'])
+
+        if options['reset'] is not None:
+            try:
+                incremental.reset(consumer, options['reset'])
+            except ValueError as e:
+                raise CommandError(f"Invalid watermark {options['reset']!r}: {e}")
+            self.stdout.write(self.style.SUCCESS(f"{consumer.name}: watermark set to {consumer.watermark}"))
+            return
+
+        chunks, start, high = incremental_export_stream(consumer, options['type'])
+        if high == start:
+            self.stdout.write(f"{consumer.name}: no records after {start}")
+            return
+
+        extension = EXPORT_EXTENSIONS[options['type']]
+        path = options['output'] or os.path.join(
+            settings.MEDIA_ROOT, 'exports', f"{consumer.name}-{start}-{high}.{extension}")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        try:
+            with open(path, 'wb') as fh:
+                for chunk in chunks:
+                    fh.write(chunk)
+        except BaseException:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        consumer.refresh_from_db()
+        if consumer.watermark != high:
+            raise CommandError(f"{consumer.name}: another export moved the watermark; {path} may repeat its rows")
+        self.stdout.write(self.style.SUCCESS(f"{consumer.name}: records {start + 1}..{high} written to {path}"))
@@ -0,0 +1,29 @@
+"""
+Delete old delta-sync change log entries.
+
+The newest entry is always kept, so clients with older cursors are told
+to reset instead of silently missing changes.
+
+Example:
+    python manage.py prune_change_log --days 30
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from faceapp.changelog import latest_cursor
+from faceapp.models import ChangeLogEntry
+
+
+class Command(BaseCommand):
+    help = 'Delete change log entries older than --days (keeping the newest entry)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='Keep entries from the last N days (default 30)')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted, _ = ChangeLogEntry.objects.filter(created_at__lt=cutoff).exclude(id=latest_cursor()).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} change log entr{'y' if deleted == 1 else 'ies'}"))
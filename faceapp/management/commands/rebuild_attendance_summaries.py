@@ -0,0 +1,39 @@
+"""
+Backfill or check the materialized attendance summaries.
+
+Examples:
+    python manage.py rebuild_attendance_summaries           # recompute everything
+    python manage.py rebuild_attendance_summaries --verify  # report drift, change nothing
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from faceapp.payload_cache import bump_data_version, shared_cache_error
+from faceapp.summaries import rebuild_summaries, verify_summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild StudentClassSummary/SessionSummary from attendance records, or verify them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Compare stored summaries with recomputed ones without writing')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            problems = verify_summaries()
+            for problem in problems[:50]:
+                self.stderr.write(problem)
+            if problems:
+                raise CommandError(f"{len(problems)} summary row(s) out of date; run without --verify to rebuild")
+            self.stdout.write(self.style.SUCCESS("Attendance summaries are up to date"))
+            return
+
+        error = shared_cache_error('rebuild_attendance_summaries')
+        if error:
+            raise CommandError(error)
+        student_rows, session_rows = rebuild_summaries()
+        # Summaries feed the dashboard and report payloads
+        bump_data_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {student_rows} student/class summaries and {session_rows} session summaries"
+        ))
@@ -0,0 +1,53 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from faceapp import metrics
+from faceapp import tasks  # noqa: F401 - registers job handlers
+from faceapp.jobs import run_pending, worker_name
+from faceapp.payload_cache import shared_cache_error
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (uploads, face indexing, deletes, exports)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Process the jobs that are runnable now, then exit')
+        parser.add_argument('--sleep', type=float, default=None,
+                            help='Seconds to wait between polls when the queue is empty')
+        parser.add_argument('--max-jobs', type=int, default=None,
+                            help='Exit after processing this many jobs')
+
+    def handle(self, *args, **options):
+        error = shared_cache_error('run_jobs')
+        if error:
+            raise CommandError(error)
+        sleep = options['sleep'] if options['sleep'] is not None else getattr(settings, 'JOBS_POLL_INTERVAL', 2.0)
+        worker = worker_name()
+        if not options['once']:
+            metrics.registry().enable_snapshots()
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self.stdout.write(f"Job worker {worker} started")
+        processed = 0
+        while not self.stopping:
+            close_old_connections()
+            ran = run_pending(worker, limit=1)
+            processed += ran
+            if options['max_jobs'] is not None and processed >= options['max_jobs']:
+                break
+            if not ran:
+                if options['once']:
+                    break
+                time.sleep(sleep)
+
+        self.stdout.write(self.style.SUCCESS(f"Job worker {worker} stopped after {processed} job(s)"))
+
+    def _stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,341 @@
+"""
+Lightweight in-process metrics with Prometheus text exposition.
+
+Counters, gauges and fixed-bucket histograms keep one preallocated
+``array('d')`` per label combination, so recording a value is a dict lookup
+plus an in-place add. Each worker process periodically snapshots its values
+to ``METRICS_DIR/metrics_<pid>.json``; the /metrics endpoint merges the
+snapshots of all workers (counters and histograms are summed, gauges are
+summed over live workers only) so gunicorn's multiple or recycled workers
+report one consistent set of series. Only serving processes (the request
+middleware and the job worker call ``enable_snapshots()``) write snapshots;
+one-off management commands keep their values in memory.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: snapshots are still written, merges are not locked
+    fcntl = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SIZE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760, 104857600)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _slots(self):
+        return 1
+
+    def _get(self, labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        values = self._series.get(key)
+        if values is None:
+            with self._lock:
+                values = self._series.setdefault(key, array('d', [0.0] * self._slots()))
+        return values
+
+    def snapshot(self):
+        with self._lock:
+            return {'|'.join(key): list(values) for key, values in self._series.items()}
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1.0, **labels):
+        values = self._get(labels)
+        with self._lock:
+            values[0] += amount
+        _registry.maybe_flush()
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        values = self._get(labels)
+        with self._lock:
+            values[0] = value
+        _registry.maybe_flush()
+
+    def inc(self, amount=1.0, **labels):
+        values = self._get(labels)
+        with self._lock:
+            values[0] += amount
+        _registry.maybe_flush()
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram; slots are [bucket_0 .. bucket_n, +Inf, sum]"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(float(b) for b in buckets)
+
+    def _slots(self):
+        return len(self.buckets) + 2
+
+    def observe(self, value, **labels):
+        values = self._get(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            values[index] += 1
+            values[-1] += value
+        _registry.maybe_flush()
+
+    def time(self, **labels):
+        return _HistogramTimer(self, labels)
+
+
+class _HistogramTimer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+        self.snapshots_enabled = False
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    @property
+    def directory(self):
+        return getattr(settings, 'METRICS_DIR', None)
+
+    def _snapshot_path(self, pid=None):
+        return os.path.join(self.directory, f"metrics_{pid or os.getpid()}.json")
+
+    def enable_snapshots(self):
+        """Mark this process as one whose values /metrics should report"""
+        self.snapshots_enabled = True
+
+    def maybe_flush(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5.0)
+        if self.snapshots_enabled and self.directory and time.monotonic() - self._last_flush >= interval:
+            self.flush()
+
+    def flush_at_exit(self):
+        if self.snapshots_enabled:
+            self.flush()
+
+    def flush(self):
+        """Write this process' values to its snapshot file"""
+        if not self.directory or not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_flush = time.monotonic()
+            os.makedirs(self.directory, exist_ok=True)
+            payload = {'pid': os.getpid(), 'metrics': {
+                name: metric.snapshot() for name, metric in self.metrics.items()
+            }}
+            path = self._snapshot_path()
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as fh:
+                json.dump(payload, fh)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+        finally:
+            self._flush_lock.release()
+
+    def collect(self):
+        """Merge the snapshots of all worker processes into {name: {labels: values}}"""
+        if not self.directory:
+            return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+        self.flush()
+        os.makedirs(self.directory, exist_ok=True)
+        lock_path = os.path.join(self.directory, '.lock')
+        with open(lock_path, 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                return self._merge_snapshots()
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _merge_snapshots(self):
+        merged = {}
+        dead_path = os.path.join(self.directory, 'metrics_dead.json')
+        dead = _read_json(dead_path) or {'metrics': {}}
+        dead_changed = False
+
+        for filename in os.listdir(self.directory):
+            if not (filename.startswith('metrics_') and filename.endswith('.json')) or filename == 'metrics_dead.json':
+                continue
+            path = os.path.join(self.directory, filename)
+            snapshot = _read_json(path)
+            if snapshot is None:
+                continue
+            if _pid_alive(snapshot.get('pid')):
+                self._add_snapshot(merged, snapshot['metrics'], include_gauges=True)
+            else:
+                # Fold counters of recycled workers into one file so totals stay monotonic
+                self._add_snapshot(dead['metrics'], snapshot['metrics'], include_gauges=False)
+                dead_changed = True
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+        if dead_changed:
+            with open(dead_path, 'w') as fh:
+                json.dump(dead, fh)
+        self._add_snapshot(merged, dead['metrics'], include_gauges=False)
+        return merged
+
+    def _add_snapshot(self, target, metrics, include_gauges):
+        for name, series in metrics.items():
+            metric = self.metrics.get(name)
+            if metric is None or (metric.kind == 'gauge' and not include_gauges):
+                continue
+            bucket = target.setdefault(name, {})
+            for labels, values in series.items():
+                current = bucket.get(labels)
+                if current is None or len(current) != len(values):
+                    bucket[labels] = list(values)
+                else:
+                    bucket[labels] = [a + b for a, b in zip(current, values)]
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        collected = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for label_key, values in sorted(collected.get(name, {}).items()):
+                label_values = label_key.split('|') if metric.labelnames else []
+                pairs = list(zip(metric.labelnames, label_values))
+                if metric.kind == 'histogram':
+                    cumulative = 0.0
+                    for bound, count in zip(metric.buckets, values):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(pairs + [('le', _num(bound))])} {_num(cumulative)}")
+                    cumulative += values[len(metric.buckets)]
+                    lines.append(f"{name}_bucket{_labels(pairs + [('le', '+Inf')])} {_num(cumulative)}")
+                    lines.append(f"{name}_sum{_labels(pairs)} {_num(values[-1])}")
+                    lines.append(f"{name}_count{_labels(pairs)} {_num(cumulative)}")
+                else:
+                    lines.append(f"{name}{_labels(pairs)} {_num(values[0])}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _num(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _read_json(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_registry = MetricsRegistry()
+atexit.register(_registry.flush_at_exit)
+
+
+def registry():
+    return _registry
+
+
+def counter(name, documentation, labelnames=()):
+    return _registry.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return _registry.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return _registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# Application metrics
+http_requests = counter(
+    'faceapp_http_requests_total', 'HTTP requests by view and status code', ['view', 'method', 'status'])
+http_request_seconds = histogram(
+    'faceapp_http_request_duration_seconds', 'HTTP request latency by view', ['view'])
+http_requests_in_flight = gauge(
+    'faceapp_http_requests_in_flight', 'Requests currently being served')
+db_queries = counter(
+    'faceapp_db_queries_total', 'Database queries executed, by view', ['view'])
+db_queries_per_request = histogram(
+    'faceapp_db_queries_per_request', 'Database queries per request, by view', ['view'],
+    buckets=QUERY_COUNT_BUCKETS)
+recognition_calls = counter(
+    'faceapp_recognition_calls_total', 'Face recognition backend calls by operation and outcome',
+    ['operation', 'outcome'])
+recognition_seconds = histogram(
+    'faceapp_recognition_call_duration_seconds', 'Face recognition backend latency', ['operation'])
+cache_requests = counter(
+    'faceapp_cache_requests_total', 'Cache lookups by cache and result (hit/miss)', ['cache', 'result'])
+ai_assistant_seconds = histogram(
+    'faceapp_ai_assistant_duration_seconds', 'AI assistant completion latency', ['outcome'])
+export_bytes = histogram(
+    'faceapp_export_size_bytes', 'Size of generated exports', ['format'], buckets=SIZE_BUCKETS)
+cloudinary_upload_seconds = histogram(
+    'faceapp_cloudinary_upload_duration_seconds', 'Cloudinary upload latency', ['outcome'])
@@ -0,0 +1,106 @@
+"""
+Request middleware for the attendance system
+"""
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from . import metrics
+from .logging_utils import set_request_id, reset_request_id
+
+
+class RequestIdMiddleware:
+    """Bind a request id (incoming X-Request-ID or a new one) to all log records of the request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        incoming = request.headers.get('X-Request-ID', '')[:64]
+        request_id, token = set_request_id(incoming if incoming.isprintable() else None)
+        request.request_id = request_id
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_request_id(token)
+        response['X-Request-ID'] = request_id
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Record request counts, latency and database queries per view. Queries
+    are counted on every database alias. A streaming response is recorded
+    when the server closes it, so the queries its iterator runs are counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        metrics.registry().enable_snapshots()
+
+    def __call__(self, request):
+        query_count = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            query_count[0] += 1
+            return execute(sql, params, many, context)
+
+        def finish(response):
+            metrics.http_requests_in_flight.dec()
+            match = getattr(request, 'resolver_match', None)
+            view = (match.url_name or match.view_name) if match else 'unmatched'
+            metrics.http_requests.inc(view=view, method=request.method, status=response.status_code)
+            metrics.http_request_seconds.observe(time.perf_counter() - started, view=view)
+            metrics.db_queries.inc(query_count[0], view=view)
+            metrics.db_queries_per_request.observe(query_count[0], view=view)
+
+        metrics.http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            with _counting(count_queries):
+                response = self.get_response(request)
+        except BaseException:
+            metrics.http_requests_in_flight.dec()
+            raise
+
+        if response.streaming and not response.is_async:
+            response.streaming_content = _CountedStream(response.streaming_content, count_queries,
+                                                        lambda: finish(response))
+        else:
+            finish(response)
+        return response
+
+
+def _counting(execute_wrapper):
+    """Install `execute_wrapper` on every database connection of this thread"""
+    stack = ExitStack()
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(execute_wrapper))
+    return stack
+
+
+class _CountedStream:
+    """Streaming content that counts the queries run while producing each chunk and reports on close"""
+
+    def __init__(self, content, execute_wrapper, on_close):
+        self.content = iter(content)
+        self.execute_wrapper = execute_wrapper
+        self.on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with _counting(self.execute_wrapper):
+            return next(self.content)
+
+    def close(self):
+        # Called once by the response when the server is done with it
+        try:
+            if hasattr(self.content, 'close'):
+                self.content.close()
+        finally:
+            if self.on_close is not None:
+                on_close, self.on_close = self.on_close, None
+                on_close()
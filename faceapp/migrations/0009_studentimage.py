@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('faceapp', '0008_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('original', models.CharField(max_length=255)),
+                ('thumbnail', models.CharField(blank=True, default='', max_length=255)),
+                ('face_crop', models.CharField(blank=True, default='', max_length=255)),
+                ('width', models.PositiveIntegerField(default=0)),
+                ('height', models.PositiveIntegerField(default=0)),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='image',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='students', to='faceapp.studentimage'),
+        ),
+    ]
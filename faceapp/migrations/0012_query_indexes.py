@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('faceapp', '0011_changelog'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendancerecord',
+            index=models.Index(fields=['session', 'is_late'], name='faceapp_rec_session_late'),
+        ),
+        migrations.AddIndex(
+            model_name='attendancerecord',
+            index=models.Index(fields=['date'], name='faceapp_rec_date'),
+        ),
+        migrations.AddIndex(
+            model_name='attendancerecord',
+            index=models.Index(fields=['student', 'date'], name='faceapp_rec_student_date'),
+        ),
+        migrations.AddIndex(
+            model_name='attendancesession',
+            index=models.Index(fields=['teacher', 'date', 'start_time'], name='faceapp_sess_teacher_date'),
+        ),
+        migrations.AddIndex(
+            model_name='attendancesession',
+            index=models.Index(fields=['class_session', 'date'], name='faceapp_sess_class_date'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['name'], name='faceapp_student_active_name'),
+        ),
+    ]
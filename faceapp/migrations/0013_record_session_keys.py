@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_record_keys(apps, schema_editor):
+    from faceapp.record_keys import backfill_record_keys
+    backfill_record_keys(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('faceapp', '0012_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancerecord',
+            name='class_session',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='attendance_records', to='faceapp.class'),
+        ),
+        migrations.AddField(
+            model_name='attendancerecord',
+            name='session_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='attendancerecord',
+            name='teacher',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='attendance_records', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='attendancerecord',
+            index=models.Index(fields=['teacher', 'session_date'], name='faceapp_rec_teacher_date'),
+        ),
+        migrations.AddIndex(
+            model_name='attendancerecord',
+            index=models.Index(fields=['class_session', 'session_date'], name='faceapp_rec_class_date'),
+        ),
+        migrations.RunPython(fill_record_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('faceapp', '0013_record_session_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('academic_year', models.CharField(max_length=20)),
+                ('semester', models.CharField(max_length=20)),
+                ('path', models.CharField(max_length=255)),
+                ('date_from', models.DateField()),
+                ('date_to', models.DateField()),
+                ('session_count', models.PositiveIntegerField(default=0)),
+                ('record_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('academic_year', 'semester')},
+            },
+        ),
+    ]
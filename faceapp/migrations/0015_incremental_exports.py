@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('faceapp', '0014_archived_term'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportConsumer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.SlugField(max_length=100)),
+                ('watermark', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='attendancerecord',
+            index=models.Index(fields=['teacher', 'id'], name='faceapp_rec_teacher_id'),
+        ),
+        migrations.AddField(
+            model_name='exportconsumer',
+            name='teacher',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_consumers', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='exportconsumer',
+            unique_together={('teacher', 'name')},
+        ),
+    ]
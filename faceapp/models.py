@@ -43,12 +43,40 @@ class Student(models.Model):
     image_path = models.CharField(max_length=255)
     face_encoding = models.TextField(null=True, blank=True, help_text="AWS Rekognition Face ID stored as JSON")
     classes = models.ManyToManyField(Class, related_name='students', blank=True)
+    image = models.ForeignKey(
+        'StudentImage',
+        on_delete=models.SET_NULL,
+        related_name='students',
+        null=True,
+        blank=True
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            # Only active students are listed; deactivated ones stay for history
+            models.Index(fields=['name'], condition=models.Q(is_active=True), name='faceapp_student_active_name'),
+        ]
     
     def __str__(self):
         return self.name
 
+
+class StudentImage(models.Model):
+    """An enrollment photo stored once per content hash, with its derivatives"""
+    content_hash = models.CharField(max_length=64, unique=True)  # sha256 of the stored JPEG
+    original = models.CharField(max_length=255)  # MEDIA_ROOT-relative path or Cloudinary URL
+    thumbnail = models.CharField(max_length=255, blank=True, default='')
+    face_crop = models.CharField(max_length=255, blank=True, default='')
+    width = models.PositiveIntegerField(default=0)
+    height = models.PositiveIntegerField(default=0)
+    size = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.content_hash[:12]
+
 # Helper function to get today's date (not datetime)
 def get_today():
     return date.today()
@@ -75,6 +103,14 @@ class AttendanceSession(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Teacher's sessions by date range, ordered by (date, start_time) either way
+            models.Index(fields=['teacher', 'date', 'start_time'], name='faceapp_sess_teacher_date'),
+            # Sessions of a class (eligible-session counts, class/date windows)
+            models.Index(fields=['class_session', 'date'], name='faceapp_sess_class_date'),
+        ]
+    
     def __str__(self):
         class_name = self.class_session.name if self.class_session else "No Class"
         return f"{self.name} - {class_name} - {self.date}"
@@ -88,18 +124,179 @@ class AttendanceRecord(models.Model):
     time = models.TimeField(auto_now_add=True)  # This is when the record was created
     arrival_time = models.TimeField(null=True, blank=True)  # NEW: This is the exact time student arrived
     is_late = models.BooleanField(default=False)
+    # Copies of the session's keys (faceapp.record_keys), so teacher/class scoped
+    # queries read this table alone; the composite indexes below lead with them
+    class_session = models.ForeignKey(
+        'Class',
+        on_delete=models.CASCADE,
+        related_name='attendance_records',
+        null=True,
+        blank=True,
+        db_index=False
+    )
+    teacher = models.ForeignKey(
+        Teacher,
+        on_delete=models.CASCADE,
+        related_name='attendance_records',
+        null=True,
+        blank=True,
+        db_index=False
+    )
+    session_date = models.DateField(null=True, blank=True)
     
     class Meta:
         unique_together = ['student', 'session']  # Prevent duplicate attendance per session
+        indexes = [
+            # Per-teacher and per-class date ranges without joining the session
+            models.Index(fields=['teacher', 'session_date'], name='faceapp_rec_teacher_date'),
+            models.Index(fields=['class_session', 'session_date'], name='faceapp_rec_class_date'),
+            # Present/late counts per session without touching the table
+            models.Index(fields=['session', 'is_late'], name='faceapp_rec_session_late'),
+            # Date-window exports and per-student history
+            models.Index(fields=['date'], name='faceapp_rec_date'),
+            models.Index(fields=['student', 'date'], name='faceapp_rec_student_date'),
+            # Incremental exports: a teacher's records after a watermark id
+            models.Index(fields=['teacher', 'id'], name='faceapp_rec_teacher_id'),
+        ]
     
     def __str__(self):
         arrival_str = f" (arrived at {self.arrival_time})" if self.arrival_time else ""
         return f"{self.student.name} - {self.date} {self.time}{arrival_str}"
 
+class StudentClassSummary(models.Model):
+    """Attendance counts of one student in one class, kept current by faceapp.signals"""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='class_summaries')
+    class_session = models.ForeignKey(Class, on_delete=models.CASCADE, related_name='student_summaries')
+    enrolled = models.BooleanField(default=False)
+    attended = models.PositiveIntegerField(default=0)  # distinct sessions attended
+    late = models.PositiveIntegerField(default=0)
+    on_time = models.PositiveIntegerField(default=0)
+    eligible_sessions = models.PositiveIntegerField(default=0)  # sessions in the class while enrolled
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['student', 'class_session']
+
+    def __str__(self):
+        return f"{self.student_id}@{self.class_session_id}: {self.attended}/{self.eligible_sessions}"
+
+
+class SessionSummary(models.Model):
+    """Attendance counts of one session, kept current by faceapp.signals"""
+    session = models.OneToOneField(AttendanceSession, on_delete=models.CASCADE, related_name='summary')
+    present = models.PositiveIntegerField(default=0)
+    late = models.PositiveIntegerField(default=0)
+    eligible = models.PositiveIntegerField(default=0)  # active students enrolled in the class
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Session {self.session_id}: {self.present}/{self.eligible}"
+
+class ChangeLogEntry(models.Model):
+    """An insert/update or delete of attendance data, read by delta syncs (faceapp.changelog)"""
+    KIND_RECORD = 'record'
+    KIND_SESSION = 'session'
+    KIND_ENROLLMENT = 'enrollment'
+    ACTION_UPSERT = 'upsert'
+    ACTION_DELETE = 'delete'
+
+    kind = models.CharField(max_length=20)
+    action = models.CharField(max_length=10)
+    object_id = models.BigIntegerField()  # record / session id; student id for enrollments
+    class_id = models.BigIntegerField(null=True, blank=True)  # enrollments only
+    teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE, related_name='change_log')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['teacher', 'id'], name='faceapp_changelog_teacher_id'),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.action} {self.kind} {self.object_id}"
+
+
+class ArchivedTerm(models.Model):
+    """Sessions and records of a closed term, moved to Parquet files (faceapp.archive)"""
+    academic_year = models.CharField(max_length=20)
+    semester = models.CharField(max_length=20)
+    path = models.CharField(max_length=255)  # directory relative to ARCHIVE_ROOT
+    date_from = models.DateField()  # first and last archived session date
+    date_to = models.DateField()
+    session_count = models.PositiveIntegerField(default=0)
+    record_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['academic_year', 'semester']
+
+    def __str__(self):
+        return f"{self.academic_year} {self.semester}: {self.session_count} sessions, {self.record_count} records"
+
+
+class ExportConsumer(models.Model):
+    """A named incremental export of a teacher's records (faceapp.incremental)"""
+    name = models.SlugField(max_length=100)
+    teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE, related_name='export_consumers')
+    watermark = models.BigIntegerField(default=0)  # highest AttendanceRecord id exported
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['teacher', 'name']
+
+    def __str__(self):
+        return f"{self.name} ({self.teacher.username}) at record {self.watermark}"
+
+
 class AIQuery(models.Model):
     query = models.TextField()
     response = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
-        return f"Query at {self.timestamp}"
\ No newline at end of file
+        return f"Query at {self.timestamp}"
+
+class BackgroundJob(models.Model):
+    """A unit of slow work (uploads, face indexing, deletes, exports) run by the job worker"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_by = models.ForeignKey(
+        Teacher,
+        on_delete=models.SET_NULL,
+        related_name='jobs',
+        null=True,
+        blank=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='faceapp_job_status_run_after'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
@@ -0,0 +1,175 @@
+"""
+Versioned cache for the dashboard and analytics JSON payloads.
+
+Payloads are stored already serialized, keyed by payload name, user,
+today's date (payloads include it) and the data version the user sees.
+There is a version per teacher, bumped by faceapp.signals after every
+committed change to that teacher's records, sessions or classes, and a
+shared version for writes that are not one teacher's (students, bulk
+commands); a teacher's payloads key on both, so another teacher taking
+attendance does not invalidate them. Admin payloads span every teacher
+and key on a global version that every write bumps. Older entries become
+unreachable and expire through PAYLOAD_CACHE_TIMEOUT. When a version key
+itself is missing (cache restart or eviction) it is re-created from the
+current time in milliseconds, so a version number is never reused for
+different data.
+
+Payloads are built on the primary database even in views that read from
+the replica (faceapp.db_router). An entry lives until the next version
+bump, so one built from a lagging replica would outlast the lag.
+
+The same key doubles as an HTTP validator: @conditional_payload answers
+If-None-Match with 304 Not Modified while the data version is unchanged,
+before the view builds or serializes anything.
+
+The version lives in the cache, so every process that writes data must
+share the web process's cache. With the process-local LocMemCache a bump
+made by `run_jobs` or another management command never reaches the web
+process; shared_cache_error() lets those commands refuse to run unless
+PAYLOAD_CACHE_ENABLED is False, which turns off both the payload cache
+and the ETags, so no response depends on the version.
+"""
+import hashlib
+import json
+import time
+from datetime import date
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+
+from . import metrics
+from .columnar import wants_columnar
+from .db_router import primary_reads
+
+VERSION_KEY = 'faceapp:data_version'
+SHARED_VERSION_KEY = 'faceapp:data_version:shared'
+
+
+def teacher_version_key(teacher_id):
+    return f"{VERSION_KEY}:{teacher_id}"
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def data_version(user=None):
+    """Version of the data `user` sees: global for admins (and None), shared + own for teachers"""
+    if user is None or user.is_admin:
+        return _version(VERSION_KEY)
+    keys = (SHARED_VERSION_KEY, teacher_version_key(user.id))
+    versions = cache.get_many(keys)
+    return '.'.join(str(versions.get(key) or _version(key)) for key in keys)
+
+
+def _bump(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = int(time.time() * 1000)
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def bump_data_version(*teacher_ids):
+    """Invalidate the payloads of `teacher_ids` (everyone's when none, or one is None) and of admins"""
+    _bump(VERSION_KEY)
+    if not teacher_ids or None in teacher_ids:
+        _bump(SHARED_VERSION_KEY)
+        return
+    for teacher_id in set(teacher_ids):
+        _bump(teacher_version_key(teacher_id))
+
+
+def bump_data_version_on_commit(*teacher_ids):
+    """bump_data_version(*teacher_ids) once the current transaction commits"""
+    transaction.on_commit(lambda: bump_data_version(*teacher_ids))
+
+
+def shared_cache_error(process):
+    """Why `process`, running apart from the web process, cannot invalidate its payloads; None if it can"""
+    if not getattr(settings, 'PAYLOAD_CACHE_ENABLED', True) or not isinstance(caches['default'], LocMemCache):
+        return None
+    return (f"{process} writes attendance data outside the web process, but the payload cache is "
+            "process-local (LocMemCache), so the web process would keep serving stale payloads. "
+            "Set REDIS_URL or CACHE_BACKEND=file, or turn payload caching and ETags off with "
+            "PAYLOAD_CACHE_ENABLED=False.")
+
+
+def payload_key(name, user):
+    return f"faceapp:payload:{name}:{user.id}:{date.today().isoformat()}:{data_version(user)}"
+
+
+def payload_etag(name, user):
+    """Strong ETag of payload `name` for `user`; changes whenever its cache key does"""
+    return '"%s"' % hashlib.md5(payload_key(name, user).encode('utf-8')).hexdigest()
+
+
+def _encode(data):
+    return json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+
+
+def cached_json(name, user, build, encode=_encode):
+    """JSON bytes for payload `name` of `user`, calling encode(build()) on the primary on a miss"""
+    if not getattr(settings, 'PAYLOAD_CACHE_ENABLED', True):
+        return encode(build())
+
+    key = payload_key(name, user)
+    body = cache.get(key)
+    if body is not None:
+        metrics.cache_requests.inc(cache='payload', result='hit')
+        return body
+
+    metrics.cache_requests.inc(cache='payload', result='miss')
+    with primary_reads():
+        body = encode(build())
+    cache.set(key, body, timeout=getattr(settings, 'PAYLOAD_CACHE_TIMEOUT', 3600))
+    return body
+
+
+def conditional_payload(name, vary_on_query=False, columnar=False):
+    """
+    Decorator for GET endpoints whose response only depends on the user,
+    today's date and the user's data version (plus the query string when
+    vary_on_query, and the requested format when the view also serves
+    the columnar encoding). Successful responses carry an ETag and
+    "Cache-Control: private, no-cache", so browsers revalidate every poll;
+    a matching If-None-Match returns 304 without calling the view. With
+    PAYLOAD_CACHE_ENABLED=False the view answers every request.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not getattr(settings, 'PAYLOAD_CACHE_ENABLED', True):
+                return view(request, *args, **kwargs)
+
+            payload_name = f"{name}:{request.GET.urlencode()}" if vary_on_query else name
+            if columnar and wants_columnar(request):
+                payload_name += ':columnar'
+            etag = payload_etag(payload_name, request.user)
+            if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+                metrics.cache_requests.inc(cache='http_etag', result='hit')
+                response = HttpResponseNotModified()
+            else:
+                metrics.cache_requests.inc(cache='http_etag', result='miss')
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response['ETag'] = etag
+            patch_cache_control(response, private=True, no_cache=True)
+            if columnar:
+                patch_vary_headers(response, ['Accept'])
+            return response
+        return wrapper
+    return decorator
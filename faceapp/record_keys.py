@@ -0,0 +1,63 @@
+"""
+Denormalized session keys on AttendanceRecord.
+
+Each record carries its session's teacher, class and date (teacher_id,
+class_session_id, session_date), so teacher- and class-scoped queries are
+index range scans on the record table instead of joins through
+AttendanceSession and Class. The keys are also what a partitioning scheme
+by term would use. faceapp.signals fills them when a record is saved and
+rewrites them when its session moves to another teacher, class or date.
+backfill_record_keys() fills existing rows; migration 0013 runs it and so
+does the backfill_record_keys command.
+"""
+from django.apps import apps as django_apps
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def session_keys(session):
+    """Record field values copied from `session` (None for records without a session)"""
+    if session is None:
+        return {'teacher_id': None, 'class_session_id': None, 'session_date': None}
+    return {'teacher_id': session.teacher_id, 'class_session_id': session.class_session_id, 'session_date': session.date}
+
+
+def stale_records(apps=django_apps):
+    """Records with a session whose keys are missing or differ from the session's"""
+    AttendanceRecord = apps.get_model('faceapp', 'AttendanceRecord')
+    # Coalesce so records and sessions without a teacher/class compare equal
+    return AttendanceRecord.objects.filter(session__isnull=False).alias(
+        record_teacher=Coalesce('teacher_id', 0),
+        session_teacher=Coalesce('session__teacher_id', 0),
+        record_class=Coalesce('class_session_id', 0),
+        session_class=Coalesce('session__class_session_id', 0),
+    ).filter(
+        Q(session_date__isnull=True)
+        | ~Q(session_date=F('session__date'))
+        | ~Q(record_teacher=F('session_teacher'))
+        | ~Q(record_class=F('session_class'))
+    )
+
+
+def backfill_record_keys(apps=django_apps, batch_size=5000):
+    """
+    Copy the session keys onto stale records in id-ordered batches of
+    `batch_size`. Returns the number of records updated.
+    """
+    AttendanceRecord = apps.get_model('faceapp', 'AttendanceRecord')
+    AttendanceSession = apps.get_model('faceapp', 'AttendanceSession')
+    session = AttendanceSession.objects.filter(id=OuterRef('session_id'))
+    records = stale_records(apps)
+
+    updated = 0
+    last_id = 0
+    while True:
+        batch = list(records.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not batch:
+            return updated
+        updated += AttendanceRecord.objects.filter(id__in=batch).update(
+            teacher_id=Subquery(session.values('teacher_id')[:1]),
+            class_session_id=Subquery(session.values('class_session_id')[:1]),
+            session_date=Subquery(session.values('date')[:1]),
+        )
+        last_id = batch[-1]
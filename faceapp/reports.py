@@ -0,0 +1,273 @@
+"""
+XLSX and DOCX attendance reports.
+
+Both cover the scope of the CSV export: a teacher's data (everything for
+admins), optionally limited to a date range. Archived terms are merged in
+when a range is given.
+
+write_xlsx() builds the workbook with openpyxl's write-only mode. Rows go
+straight to per-sheet temporary files, so memory stays flat however many
+records are exported. The first sheet is a per-class summary. It is followed
+by one sheet per class, with that class's records read in chunks in class
+order.
+
+write_docx() is a summary report. It is built only from the pre-aggregated
+SessionSummary and StudentClassSummary rows and never reads the record
+table.
+
+export_row_count() sizes an export. Views use it to hand large workbooks to
+a build_export job instead of building them during the request.
+"""
+import re
+from collections import defaultdict
+
+from django.db.models import Count, Sum
+from django.utils import timezone
+from docx import Document
+from openpyxl import Workbook
+
+from .archive import archived_records, archived_sessions
+from .models import AttendanceRecord, Class, SessionSummary, Student, StudentClassSummary
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+CHUNK_SIZE = 2000  # records fetched per database round trip
+LOW_ATTENDANCE_PERCENT = 75  # DOCX lists enrolled students below this rate
+SUMMARY_HEADER = ['Class', 'Code', 'Students', 'Sessions', 'Present', 'Late', 'Eligible', 'Attendance %']
+RECORD_HEADER = ['Student Name', 'Student ID', 'Session', 'Date', 'Time', 'Arrival Time', 'Late']
+NO_CLASS = ('No class', '')
+
+
+def export_row_count(teacher=None, date_from=None, date_to=None):
+    """Number of hot records an export of this scope would write"""
+    return _records(teacher, date_from, date_to).count()
+
+
+def _records(teacher, date_from, date_to, using='default'):
+    records = AttendanceRecord.objects.using(using)
+    if teacher:
+        records = records.filter(teacher=teacher)
+    if date_from and date_to:
+        records = records.filter(date__range=(date_from, date_to))
+    return records
+
+
+def _period(date_from, date_to):
+    if date_from and date_to:
+        return f"{date_from:%Y-%m-%d} to {date_to:%Y-%m-%d}"
+    return 'All sessions'
+
+
+def _percent(part, whole):
+    return round(100 * part / whole, 1) if whole else 0.0
+
+
+def class_statistics(teacher=None, date_from=None, date_to=None, using='default'):
+    """
+    One row per class: students, sessions, present, late, eligible and
+    attendance rate. Built from SessionSummary and active enrollments. The
+    sessions of archived terms are counted against current enrollments.
+    """
+    classes = Class.objects.using(using).order_by('name', 'id')
+    summaries = SessionSummary.objects.using(using)
+    if teacher:
+        classes = classes.filter(teacher=teacher)
+        summaries = summaries.filter(session__teacher=teacher)
+    if date_from and date_to:
+        summaries = summaries.filter(session__date__range=(date_from, date_to))
+    labels = {row['id']: (row['name'], row['code']) for row in classes.values('id', 'name', 'code')}
+
+    students = dict(Student.classes.through.objects.using(using).filter(
+        class_id__in=classes.values('id'), student__is_active=True
+    ).values('class_id').annotate(n=Count('id')).values_list('class_id', 'n'))
+
+    totals = defaultdict(lambda: {'sessions': 0, 'present': 0, 'late': 0, 'eligible': 0})
+    for row in summaries.values('session__class_session_id').annotate(
+        sessions=Count('id'), present=Sum('present'), late=Sum('late'), eligible=Sum('eligible')
+    ):
+        counts = totals[row['session__class_session_id']]
+        for field in counts:
+            counts[field] += row[field] or 0
+
+    if date_from and date_to:
+        old_sessions = archived_sessions(teacher, date_from, date_to)
+        old_records = archived_records(teacher, date_from, date_to)
+        for class_id, count in old_sessions['class_id'].value_counts(dropna=False).items():
+            class_id = None if class_id != class_id else int(class_id)  # NaN -> no class
+            totals[class_id]['sessions'] += int(count)
+            totals[class_id]['eligible'] += int(count) * students.get(class_id, 0)
+        for row in old_records.itertuples(index=False):
+            class_id = None if row.class_id != row.class_id else int(row.class_id)
+            totals[class_id]['present'] += 1
+            totals[class_id]['late'] += bool(row.is_late)
+
+    # Classes of other teachers or without a class can only come from sessions
+    extra = sorted((key for key in totals if key not in labels), key=lambda key: (key is None, key or 0))
+    rows = []
+    for class_id in list(labels) + extra:
+        counts = totals.get(class_id, {'sessions': 0, 'present': 0, 'late': 0, 'eligible': 0})
+        if class_id is None and not counts['sessions']:
+            continue
+        name, code = labels.get(class_id, NO_CLASS if class_id is None else (f"Class {class_id}", ''))
+        rows.append({
+            'class_id': class_id,
+            'name': name,
+            'code': code,
+            'students': students.get(class_id, 0),
+            **counts,
+            'attendance_rate': _percent(counts['present'], counts['eligible']),
+        })
+    return rows
+
+
+def _summary_totals(rows):
+    totals = {field: sum(row[field] for row in rows) for field in ('students', 'sessions', 'present', 'late', 'eligible')}
+    totals['attendance_rate'] = _percent(totals['present'], totals['eligible'])
+    return totals
+
+
+def _sheet_title(label, used):
+    """Excel sheet name: at most 31 characters, none of []:*?/\\, unique ignoring case"""
+    base = re.sub(r'[\[\]:*?/\\]', ' ', label).strip()[:31] or 'Class'
+    title, n = base, 2
+    while title.lower() in used:
+        suffix = f" ({n})"
+        title = base[:31 - len(suffix)] + suffix
+        n += 1
+    used.add(title.lower())
+    return title
+
+
+def _class_rows(teacher, date_from, date_to, using):
+    """(class_id, record row) pairs grouped by class; archived rows lead their class"""
+    archived = defaultdict(list)
+    if date_from and date_to:
+        frame = archived_records(teacher, date_from, date_to).sort_values(['session_date', 'session_id', 'time'])
+        for row in frame.itertuples(index=False):
+            # Archives are read by session date; exports filter on the record date
+            if date_from <= row.date <= date_to:
+                class_id = None if row.class_id != row.class_id else int(row.class_id)
+                archived[class_id].append((row.student_name, row.student_code, row.session_name,
+                                           row.date, row.time, row.arrival_time, bool(row.is_late)))
+
+    records = _records(teacher, date_from, date_to, using).order_by(
+        'class_session_id', 'session_date', 'session_id', 'time', 'id'
+    ).values_list('class_session_id', 'student__name', 'student__student_id', 'session__name',
+                  'date', 'time', 'arrival_time', 'is_late')
+    current = object()
+    for class_id, *row in records.iterator(chunk_size=CHUNK_SIZE):
+        if class_id != current:
+            for old in archived.pop(class_id, ()):
+                yield class_id, old
+            current = class_id
+        yield class_id, tuple(row)
+    for class_id, rows in archived.items():
+        for old in rows:
+            yield class_id, old
+
+
+def write_xlsx(fh, teacher=None, date_from=None, date_to=None, title='Attendance Report', using='default'):
+    """Write the workbook to the binary file `fh`; returns the number of records written"""
+    workbook = Workbook(write_only=True)
+    used = {'summary'}
+    statistics = class_statistics(teacher, date_from, date_to, using)
+    labels = {row['class_id']: (row['name'], row['code']) for row in statistics}
+
+    summary = workbook.create_sheet('Summary')
+    summary.column_dimensions['A'].width = 32
+    summary.append([title])
+    summary.append([_period(date_from, date_to)])
+    summary.append([f"Generated {timezone.localtime():%Y-%m-%d %H:%M}"])
+    summary.append([])
+    summary.append(SUMMARY_HEADER)
+    for row in statistics:
+        summary.append([row['name'], row['code'], row['students'], row['sessions'], row['present'],
+                        row['late'], row['eligible'], row['attendance_rate']])
+    totals = _summary_totals(statistics)
+    summary.append(['Total', '', totals['students'], totals['sessions'], totals['present'],
+                    totals['late'], totals['eligible'], totals['attendance_rate']])
+
+    sheet = None
+    current = object()
+    written = 0
+    for class_id, (student_name, student_code, session_name, day, time, arrival_time, is_late) \
+            in _class_rows(teacher, date_from, date_to, using):
+        if class_id != current:
+            name, code = labels.get(class_id, NO_CLASS if class_id is None else (f"Class {class_id}", ''))
+            sheet = workbook.create_sheet(_sheet_title(f"{code} {name}".strip(), used))
+            for column, width in zip('ABCDEFG', (28, 14, 28, 12, 10, 12, 6)):
+                sheet.column_dimensions[column].width = width
+            sheet.append(RECORD_HEADER)
+            current = class_id
+        sheet.append([student_name, student_code, session_name or 'N/A', day, time, arrival_time,
+                      'Yes' if is_late else 'No'])
+        written += 1
+
+    workbook.save(fh)
+    return written
+
+
+def _table(document, header, rows):
+    table = document.add_table(rows=1, cols=len(header))
+    table.style = 'Light Grid Accent 1'
+    for cell, text in zip(table.rows[0].cells, header):
+        cell.text = text
+    for row in rows:
+        for cell, value in zip(table.add_row().cells, row):
+            cell.text = str(value)
+    return table
+
+
+def low_attendance_students(teacher=None, using='default'):
+    """Enrolled students attending fewer than LOW_ATTENDANCE_PERCENT of their class's sessions (all time)"""
+    summaries = StudentClassSummary.objects.using(using).filter(
+        enrolled=True, eligible_sessions__gt=0, student__is_active=True
+    )
+    if teacher:
+        summaries = summaries.filter(class_session__teacher=teacher)
+    rows = []
+    for row in summaries.values('student__name', 'student__student_id', 'class_session__code',
+                                'attended', 'eligible_sessions', 'late'):
+        rate = _percent(row['attended'], row['eligible_sessions'])
+        if rate < LOW_ATTENDANCE_PERCENT:
+            rows.append({**row, 'attendance_rate': rate})
+    rows.sort(key=lambda row: (row['attendance_rate'], row['student__name']))
+    return rows
+
+
+def write_docx(fh, teacher=None, date_from=None, date_to=None, title='Attendance Report', using='default'):
+    """Write the summary report to the binary file `fh`"""
+    statistics = class_statistics(teacher, date_from, date_to, using)
+    totals = _summary_totals(statistics)
+
+    document = Document()
+    document.add_heading(title, 0)
+    document.add_paragraph(f"{_period(date_from, date_to)} · generated {timezone.localtime():%Y-%m-%d %H:%M}")
+    document.add_paragraph(
+        f"{totals['sessions']} sessions across {len(statistics)} classes; "
+        f"{totals['present']} attendances ({totals['late']} late) out of {totals['eligible']} expected, "
+        f"an attendance rate of {totals['attendance_rate']}%."
+    )
+
+    document.add_heading('Classes', level=1)
+    _table(document, SUMMARY_HEADER, [
+        [row['name'], row['code'], row['students'], row['sessions'], row['present'], row['late'],
+         row['eligible'], f"{row['attendance_rate']}%"]
+        for row in statistics
+    ])
+
+    # StudentClassSummary is not broken down by date, so only all-time reports list students
+    if not (date_from and date_to):
+        students = low_attendance_students(teacher, using)
+        document.add_heading(f"Students below {LOW_ATTENDANCE_PERCENT}% attendance", level=1)
+        if students:
+            _table(document, ['Student', 'Student ID', 'Class', 'Attended', 'Sessions', 'Late', 'Attendance %'], [
+                [row['student__name'], row['student__student_id'], row['class_session__code'], row['attended'],
+                 row['eligible_sessions'], row['late'], f"{row['attendance_rate']}%"]
+                for row in students
+            ])
+        else:
+            document.add_paragraph('None.')
+
+    document.save(fh)
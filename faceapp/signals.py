@@ -0,0 +1,223 @@
+"""
+Signal handlers that keep the attendance summary tables current,
+invalidate cached dashboard payloads, publish live attendance events,
+write the delta-sync change log and keep the session keys copied onto
+attendance records (faceapp.record_keys) in step with their session.
+
+Handlers run synchronously, so they share the transaction of the write
+that triggered them (record saves in take_attendance, M2M add/remove and
+cascading deletes are atomic).
+"""
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .changelog import log_change, log_changes
+from .events import attendance_event, broker
+from .models import AttendanceRecord, AttendanceSession, ChangeLogEntry, Class, Student, Teacher
+from .payload_cache import bump_data_version_on_commit
+from .record_keys import session_keys
+from .summaries import refresh_class, refresh_session, refresh_student_class
+
+
+def _deleted_via(kwargs):
+    """Model whose delete() started this cascade (None for saves)"""
+    origin = kwargs.get('origin')
+    return getattr(origin, 'model', type(origin)) if origin is not None else None
+
+
+@receiver(pre_save, sender=AttendanceRecord)
+def fill_record_keys(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    session = instance.session if instance.session_id is not None else None
+    for field, value in session_keys(session).items():
+        setattr(instance, field, value)
+
+
+@receiver(post_save, sender=AttendanceSession)
+def sync_record_keys(sender, instance, created, raw=False, **kwargs):
+    # Connected before the summary handlers below, which read the copied keys
+    if created or raw:
+        return
+    AttendanceRecord.objects.filter(session=instance).update(**session_keys(instance))
+
+
+@receiver(post_save, sender=AttendanceRecord)
+@receiver(post_delete, sender=AttendanceRecord)
+def attendance_record_changed(sender, instance, **kwargs):
+    if instance.session_id is None:
+        return
+    via = _deleted_via(kwargs)
+    if via not in (None, AttendanceRecord, Student, AttendanceSession):
+        return  # class or teacher deletion; their summaries are removed by the same cascade
+
+    # Summary rows of the object being deleted cascade with it and must not be recreated;
+    # session deletions are handled in attendance_session_deleting
+    if via not in (Student, AttendanceSession):
+        if instance.class_session_id is not None:
+            refresh_student_class(instance.student_id, instance.class_session_id)
+    if via is not AttendanceSession:
+        refresh_session(instance.session_id)
+
+
+@receiver(post_save, sender=AttendanceSession)
+def attendance_session_saved(sender, instance, created, **kwargs):
+    if created:
+        refresh_session(instance.id)
+    refresh_class(instance.class_session_id)
+
+
+@receiver(pre_delete, sender=AttendanceSession)
+def attendance_session_deleting(sender, instance, **kwargs):
+    # The session row may be gone before its records' post_delete runs, so
+    # recompute the attendees' class summaries now, without this session
+    if instance.class_session_id is None or _deleted_via(kwargs) not in (None, AttendanceSession):
+        return
+    student_ids = AttendanceRecord.objects.filter(session=instance).values_list('student_id', flat=True).distinct()
+    for student_id in student_ids:
+        refresh_student_class(student_id, instance.class_session_id, exclude_session_id=instance.id)
+
+
+@receiver(post_delete, sender=AttendanceSession)
+def attendance_session_deleted(sender, instance, **kwargs):
+    refresh_class(instance.class_session_id)
+
+
+@receiver(m2m_changed, sender=Student.classes.through)
+def enrollment_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # pk_set is not provided for clear(); remember the affected ids first
+        related = instance.students if reverse else instance.classes
+        instance._cleared_enrollment_ids = set(related.values_list('id', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_enrollment_ids', set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+
+    if reverse:
+        pairs = [(student_id, instance.id) for student_id in pk_set]
+    else:
+        pairs = [(instance.id, class_id) for class_id in pk_set]
+    for student_id, class_id in pairs:
+        refresh_student_class(student_id, class_id)
+    for class_id in {class_id for _, class_id in pairs}:
+        refresh_class(class_id)
+
+
+@receiver(post_save, sender=Student)
+def student_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Activating or deactivating a student changes the eligible counts of their classes
+    if created or (update_fields is not None and 'is_active' not in update_fields):
+        return
+    for class_id in instance.classes.values_list('id', flat=True):
+        refresh_class(class_id)
+
+
+@receiver(pre_delete, sender=Student)
+def student_deleting(sender, instance, **kwargs):
+    instance._enrolled_classes = list(instance.classes.values_list('id', 'teacher_id'))
+
+
+@receiver(post_delete, sender=Student)
+def student_deleted(sender, instance, **kwargs):
+    # Cascaded enrollment rows are deleted without m2m_changed
+    enrolled_classes = getattr(instance, '_enrolled_classes', [])
+    for class_id, _ in enrolled_classes:
+        refresh_class(class_id)
+    log_changes([
+        (ChangeLogEntry.KIND_ENROLLMENT, ChangeLogEntry.ACTION_DELETE, instance.id, teacher_id, class_id)
+        for class_id, teacher_id in enrolled_classes
+    ])
+
+
+@receiver(post_save, sender=AttendanceRecord)
+@receiver(post_delete, sender=AttendanceRecord)
+@receiver(post_save, sender=AttendanceSession)
+@receiver(post_delete, sender=AttendanceSession)
+@receiver(post_delete, sender=Class)
+def teacher_data_changed(sender, instance, **kwargs):
+    # Records and sessions without a teacher invalidate everyone's payloads
+    bump_data_version_on_commit(instance.teacher_id)
+
+
+@receiver(post_save, sender=Class)
+def class_saved(sender, instance, created, **kwargs):
+    # An edit may have moved the class to another teacher (admin), whose payloads change too
+    bump_data_version_on_commit(*((instance.teacher_id,) if created else ()))
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def student_changed(sender, **kwargs):
+    # Students are shared between the teachers of their classes
+    bump_data_version_on_commit()
+
+
+@receiver(m2m_changed, sender=Student.classes.through)
+def enrollment_data_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_enrollment_ids', set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if reverse:
+        teacher_ids = [instance.teacher_id]
+    else:
+        teacher_ids = list(Class.objects.filter(id__in=pk_set).values_list('teacher_id', flat=True).distinct())
+    if teacher_ids:
+        bump_data_version_on_commit(*teacher_ids)
+
+
+@receiver(post_save, sender=Teacher)
+def teacher_saved(sender, instance, update_fields=None, **kwargs):
+    # Payloads include the teacher's profile; logins only touch last_login
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        bump_data_version_on_commit(instance.id)
+
+
+@receiver(post_save, sender=AttendanceRecord)
+def attendance_record_created(sender, instance, created, **kwargs):
+    if not created or instance.session_id is None:
+        return
+    record_id = instance.id
+
+    def publish():
+        record = AttendanceRecord.objects.select_related('student', 'session').filter(id=record_id).first()
+        if record is not None:
+            broker.publish(record.teacher_id, record.session_id, attendance_event(record))
+    transaction.on_commit(publish)
+
+
+@receiver(post_save, sender=AttendanceRecord)
+@receiver(post_delete, sender=AttendanceRecord)
+def log_record_change(sender, instance, **kwargs):
+    # Records cascading with their session, class or teacher are covered by the session tombstone
+    if instance.session_id is None or _deleted_via(kwargs) not in (None, AttendanceRecord, Student):
+        return
+    action = ChangeLogEntry.ACTION_UPSERT if 'created' in kwargs else ChangeLogEntry.ACTION_DELETE
+    log_change(ChangeLogEntry.KIND_RECORD, action, instance.id, instance.teacher_id)
+
+
+@receiver(post_save, sender=AttendanceSession)
+@receiver(post_delete, sender=AttendanceSession)
+def log_session_change(sender, instance, **kwargs):
+    if _deleted_via(kwargs) is Teacher:
+        return
+    action = ChangeLogEntry.ACTION_UPSERT if 'created' in kwargs else ChangeLogEntry.ACTION_DELETE
+    log_change(ChangeLogEntry.KIND_SESSION, action, instance.id, instance.teacher_id)
+
+
+@receiver(m2m_changed, sender=Student.classes.through)
+def log_enrollment_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_enrollment_ids', set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+    pairs = [(student_id, instance.id) for student_id in pk_set] if reverse else [(instance.id, class_id) for class_id in pk_set]
+    teachers = dict(Class.objects.filter(id__in={class_id for _, class_id in pairs}).values_list('id', 'teacher_id'))
+    change = ChangeLogEntry.ACTION_UPSERT if action == 'post_add' else ChangeLogEntry.ACTION_DELETE
+    log_changes([
+        (ChangeLogEntry.KIND_ENROLLMENT, change, student_id, teachers.get(class_id), class_id)
+        for student_id, class_id in pairs
+    ])
@@ -0,0 +1,202 @@
+"""
+Content-addressed storage for student enrollment photos.
+
+Each photo is normalised to an RGB JPEG and stored once under its sha256
+(MEDIA_ROOT/students/<aa>/<hash>.jpg locally, public_id <hash> on
+Cloudinary), so enrolling the same photo again, or retrying a failed
+upload, reuses the existing StudentImage instead of writing a new copy.
+A thumbnail and a face crop are generated at enrollment and served by
+hash with immutable cache headers; if the local derivative files are gone
+(ephemeral disk) they are rebuilt from the original on first request.
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from PIL import Image
+
+from .image_cache import image_fetcher, write_atomic
+from .models import StudentImage
+
+logger = logging.getLogger('faceapp.image_cache')
+
+VARIANTS = ('thumbnail', 'face_crop')
+
+_cascade = None
+_cascade_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def normalize_photo(image_bytes):
+    """Return (jpeg_bytes, width, height); JPEG uploads already in RGB are kept byte-for-byte"""
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.format == 'JPEG' and image.mode == 'RGB':
+        return image_bytes, image.width, image.height
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=_setting('STUDENT_IMAGE_QUALITY', 90))
+    return buffer.getvalue(), image.width, image.height
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def local_original_path(digest):
+    return os.path.join('students', digest[:2], f"{digest}.jpg")
+
+
+def derivative_path(digest, variant):
+    return os.path.join('students', 'derived', digest[:2], f"{digest}_{variant}.jpg")
+
+
+def store_photo(image_bytes):
+    """Store a photo by content hash; returns (StudentImage, jpeg_bytes, created)"""
+    jpeg_bytes, width, height = normalize_photo(image_bytes)
+    digest = content_hash(jpeg_bytes)
+
+    existing = StudentImage.objects.filter(content_hash=digest).first()
+    if existing:
+        return existing, jpeg_bytes, False
+
+    relative_path = local_original_path(digest)
+    full_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    if not os.path.exists(full_path):
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        write_atomic(full_path, jpeg_bytes)
+
+    try:
+        with transaction.atomic():
+            student_image = StudentImage.objects.create(
+                content_hash=digest,
+                original=relative_path,
+                width=width,
+                height=height,
+                size=len(jpeg_bytes),
+            )
+    except IntegrityError:
+        return StudentImage.objects.get(content_hash=digest), jpeg_bytes, False
+    return student_image, jpeg_bytes, True
+
+
+def build_derivatives(student_image, rgb=None):
+    """Write the thumbnail and face crop for a stored photo and record their paths"""
+    if rgb is None:
+        rgb = image_fetcher.load_rgb(student_image.original)
+        if rgb is None:
+            raise FileNotFoundError(f"Original image for {student_image.content_hash} is missing")
+
+    images = {
+        'thumbnail': _thumbnail(rgb),
+        'face_crop': _face_crop(rgb),
+    }
+    for variant, image in images.items():
+        relative_path = derivative_path(student_image.content_hash, variant)
+        full_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        write_atomic(full_path, _encode_jpeg(image))
+        setattr(student_image, variant, relative_path)
+    student_image.save(update_fields=list(VARIANTS))
+    return student_image
+
+
+def derivative_bytes(student_image, variant):
+    """Bytes of a derivative, regenerating it from the original when the file is missing"""
+    relative_path = getattr(student_image, variant) or derivative_path(student_image.content_hash, variant)
+    full_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    if not os.path.exists(full_path):
+        logger.info(f"Rebuilding {variant} for image {student_image.content_hash[:12]}")
+        build_derivatives(student_image)
+        full_path = os.path.join(settings.MEDIA_ROOT, getattr(student_image, variant))
+    with open(full_path, 'rb') as fh:
+        return fh.read()
+
+
+def original_bytes(student_image):
+    """Bytes of the stored original, from local disk or the remote image cache"""
+    if student_image.original.startswith('http'):
+        return image_fetcher.fetch_bytes(student_image.original)[0]
+    with open(os.path.join(settings.MEDIA_ROOT, student_image.original), 'rb') as fh:
+        return fh.read()
+
+
+def remove_local_files(student_image):
+    """Delete the local original (if any) and derivative files of a photo"""
+    paths = [derivative_path(student_image.content_hash, variant) for variant in VARIANTS]
+    if not student_image.original.startswith('http'):
+        paths.append(student_image.original)
+    for relative_path in paths:
+        try:
+            os.remove(os.path.join(settings.MEDIA_ROOT, relative_path))
+        except OSError:
+            pass
+
+
+def image_url(student_image, variant='thumbnail'):
+    if student_image is None:
+        return None
+    return f"/student_image/{student_image.content_hash}/{variant}/"
+
+
+def _thumbnail(rgb):
+    size = _setting('STUDENT_THUMBNAIL_SIZE', 160)
+    image = Image.fromarray(np.asarray(rgb))
+    image.thumbnail((size, size), Image.LANCZOS)
+    return image
+
+
+def _face_cascade():
+    global _cascade
+    if _cascade is None:
+        with _cascade_lock:
+            if _cascade is None:
+                _cascade = cv2.CascadeClassifier(
+                    os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')
+                )
+    return _cascade
+
+
+def _face_crop(rgb):
+    """Square crop around the largest detected face (center crop when none is found)"""
+    size = _setting('STUDENT_FACE_CROP_SIZE', 224)
+    height, width = rgb.shape[:2]
+    gray = cv2.cvtColor(np.asarray(rgb), cv2.COLOR_RGB2GRAY)
+    faces = _face_cascade().detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5,
+                                             minSize=(max(24, width // 10), max(24, height // 10)))
+    if len(faces):
+        x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+        side = int(max(w, h) * 1.4)
+        cx, cy = x + w // 2, y + h // 2
+    else:
+        side = min(width, height)
+        cx, cy = width // 2, height // 2
+    side = min(side, width, height)
+    left = min(max(cx - side // 2, 0), width - side)
+    top = min(max(cy - side // 2, 0), height - side)
+    crop = Image.fromarray(np.asarray(rgb)[top:top + side, left:left + side])
+    return crop.resize((size, size), Image.LANCZOS)
+
+
+def _encode_jpeg(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85, optimize=True)
+    return buffer.getvalue()
+
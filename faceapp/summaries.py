@@ -0,0 +1,205 @@
+"""
+Materialized attendance summaries.
+
+StudentClassSummary holds per-student-per-class counts and SessionSummary
+per-session counts, so dashboards read O(students + sessions) rows
+instead of aggregating every AttendanceRecord. The refresh_* functions
+recompute the rows touched by one write with a few indexed aggregates;
+faceapp.signals calls them from the same transaction as the write.
+
+Each refresh first locks the row it rewrites (select_for_update; creating
+it if needed) and only then aggregates. Two transactions writing to the
+same session or student/class, e.g. concurrent check-ins, therefore
+refresh one after the other, and the second one's aggregate sees the
+first one's committed records. Without the lock both would count only
+their own insert and the later write would win. refresh_class() locks the
+class row the same way (FOR NO KEY UPDATE, which does not wait on the key
+locks taken by inserts of its sessions).
+expected_summaries() recomputes everything from the raw tables and backs
+the rebuild_attendance_summaries command.
+"""
+from django.apps import apps as django_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+
+
+def _models(apps=django_apps):
+    get = lambda name: apps.get_model('faceapp', name)
+    return (get('Student'), get('AttendanceSession'), get('AttendanceRecord'),
+            get('StudentClassSummary'), get('SessionSummary'))
+
+
+def _record_counts(records):
+    return records.aggregate(
+        attended=Count('session_id', distinct=True),
+        late=Count('id', filter=Q(is_late=True)),
+        total=Count('id'),
+    )
+
+
+def _locked_summary(model, **key):
+    """The summary row of `key`, created if missing and locked until the transaction ends"""
+    row = model.objects.select_for_update().filter(**key).first()
+    if row is None:
+        try:
+            with transaction.atomic():
+                model.objects.create(**key)
+        except IntegrityError:
+            pass  # created by a concurrent refresh, which holds it until it commits
+        row = model.objects.select_for_update().get(**key)
+    return row
+
+
+@transaction.atomic
+def refresh_student_class(student_id, class_id, exclude_session_id=None):
+    """Recompute the summary row of one student in one class (optionally ignoring a session being deleted)"""
+    Student, AttendanceSession, AttendanceRecord, StudentClassSummary, _ = _models()
+    summary = _locked_summary(StudentClassSummary, student_id=student_id, class_session_id=class_id)
+    enrolled = Student.classes.through.objects.filter(student_id=student_id, class_id=class_id).exists()
+    records = AttendanceRecord.objects.filter(student_id=student_id, class_session_id=class_id)
+    if exclude_session_id is not None:
+        records = records.exclude(session_id=exclude_session_id)
+    counts = _record_counts(records)
+    if not enrolled and not counts['total']:
+        summary.delete()
+        return
+    summary.enrolled = enrolled
+    summary.attended = counts['attended']
+    summary.late = counts['late']
+    summary.on_time = counts['total'] - counts['late']
+    summary.eligible_sessions = AttendanceSession.objects.filter(class_session_id=class_id).count() if enrolled else 0
+    summary.save()
+
+
+@transaction.atomic
+def refresh_session(session_id):
+    """Recompute the summary row of one session"""
+    Student, AttendanceSession, AttendanceRecord, _, SessionSummary = _models()
+    session = AttendanceSession.objects.filter(id=session_id).values('class_session_id').first()
+    if session is None:
+        return
+    summary = _locked_summary(SessionSummary, session_id=session_id)
+    counts = _record_counts(AttendanceRecord.objects.filter(session_id=session_id))
+    summary.present = counts['total']
+    summary.late = counts['late']
+    summary.eligible = _eligible_students(session['class_session_id'])
+    summary.save()
+
+
+def session_summary(session_id):
+    """The SessionSummary of a session, computed on first use if it does not exist yet"""
+    SessionSummary = _models()[4]
+    summary = SessionSummary.objects.filter(session_id=session_id).first()
+    if summary is None:
+        refresh_session(session_id)
+        summary = SessionSummary.objects.get(session_id=session_id)
+    return summary
+
+
+@transaction.atomic
+def refresh_class(class_id):
+    """Recompute the class-wide counts: eligible sessions of enrolled students, eligible students of sessions"""
+    Student, AttendanceSession, _, StudentClassSummary, SessionSummary = _models()
+    if class_id is None:
+        return
+    Class = django_apps.get_model('faceapp', 'Class')
+    list(Class.objects.select_for_update(no_key=True).filter(id=class_id).values_list('id', flat=True))
+    session_count = AttendanceSession.objects.filter(class_session_id=class_id).count()
+    StudentClassSummary.objects.filter(class_session_id=class_id, enrolled=True).update(eligible_sessions=session_count)
+    SessionSummary.objects.filter(session__class_session_id=class_id).update(eligible=_eligible_students(class_id))
+
+
+def _eligible_students(class_id):
+    if class_id is None:
+        return 0
+    Student = _models()[0]
+    return Student.classes.through.objects.filter(class_id=class_id, student__is_active=True).count()
+
+
+def expected_summaries(apps=django_apps):
+    """Summary rows recomputed from raw data: ({(student_id, class_id): fields}, {session_id: fields})"""
+    Student, AttendanceSession, AttendanceRecord, _, _ = _models(apps)
+
+    sessions_per_class = dict(
+        AttendanceSession.objects.filter(class_session__isnull=False)
+        .values('class_session_id').annotate(count=Count('id')).values_list('class_session_id', 'count')
+    )
+    eligible_per_class = dict(
+        Student.classes.through.objects.filter(student__is_active=True)
+        .values('class_id').annotate(count=Count('id')).values_list('class_id', 'count')
+    )
+
+    student_rows = {}
+    for student_id, class_id in Student.classes.through.objects.values_list('student_id', 'class_id'):
+        student_rows[(student_id, class_id)] = {
+            'enrolled': True, 'attended': 0, 'late': 0, 'on_time': 0,
+            'eligible_sessions': sessions_per_class.get(class_id, 0),
+        }
+    grouped = AttendanceRecord.objects.filter(session__class_session__isnull=False).values(
+        'student_id', 'session__class_session_id'
+    ).annotate(
+        attended=Count('session_id', distinct=True),
+        late=Count('id', filter=Q(is_late=True)),
+        total=Count('id'),
+    )
+    for row in grouped:
+        key = (row['student_id'], row['session__class_session_id'])
+        fields = student_rows.setdefault(key, {'enrolled': False, 'eligible_sessions': 0})
+        fields.update(attended=row['attended'], late=row['late'], on_time=row['total'] - row['late'])
+
+    session_rows = {
+        session_id: {'present': 0, 'late': 0, 'eligible': eligible_per_class.get(class_id, 0)}
+        for session_id, class_id in AttendanceSession.objects.values_list('id', 'class_session_id')
+    }
+    grouped = AttendanceRecord.objects.filter(session__isnull=False).values('session_id').annotate(
+        present=Count('id'),
+        late=Count('id', filter=Q(is_late=True)),
+    )
+    for row in grouped:
+        session_rows[row['session_id']].update(present=row['present'], late=row['late'])
+
+    return student_rows, session_rows
+
+
+def rebuild_summaries(apps=django_apps):
+    """Replace all summary rows with freshly computed ones; returns (student rows, session rows)"""
+    _, _, _, StudentClassSummary, SessionSummary = _models(apps)
+    student_rows, session_rows = expected_summaries(apps)
+    with transaction.atomic():
+        StudentClassSummary.objects.all().delete()
+        SessionSummary.objects.all().delete()
+        StudentClassSummary.objects.bulk_create([
+            StudentClassSummary(student_id=student_id, class_session_id=class_id, **fields)
+            for (student_id, class_id), fields in student_rows.items()
+        ], batch_size=1000)
+        SessionSummary.objects.bulk_create([
+            SessionSummary(session_id=session_id, **fields)
+            for session_id, fields in session_rows.items()
+        ], batch_size=1000)
+    return len(student_rows), len(session_rows)
+
+
+def verify_summaries():
+    """Differences between stored and recomputed summaries, as human-readable strings"""
+    _, _, _, StudentClassSummary, SessionSummary = _models()
+    student_rows, session_rows = expected_summaries()
+    problems = []
+
+    stored = {
+        (row.pop('student_id'), row.pop('class_session_id')): row
+        for row in StudentClassSummary.objects.values(
+            'student_id', 'class_session_id', 'enrolled', 'attended', 'late', 'on_time', 'eligible_sessions'
+        )
+    }
+    for key in sorted(set(stored) | set(student_rows)):
+        if stored.get(key) != student_rows.get(key):
+            problems.append(f"student {key[0]} class {key[1]}: stored {stored.get(key)} expected {student_rows.get(key)}")
+
+    stored = {
+        row.pop('session_id'): row
+        for row in SessionSummary.objects.values('session_id', 'present', 'late', 'eligible')
+    }
+    for key in sorted(set(stored) | set(session_rows)):
+        if stored.get(key) != session_rows.get(key):
+            problems.append(f"session {key}: stored {stored.get(key)} expected {session_rows.get(key)}")
+    return problems
@@ -0,0 +1,223 @@
+"""
+Background job handlers (see faceapp.jobs)
+"""
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+import cloudinary
+import cloudinary.uploader
+from django.conf import settings
+
+from . import metrics
+from .db_router import replica_reads
+from .jobs import job_handler, enqueue, PermanentJobError
+from .models import Student, StudentImage, Teacher
+from .student_images import build_derivatives, original_bytes, remove_local_files
+
+logger = logging.getLogger('faceapp.jobs')
+
+NO_FACE_MESSAGE = (
+    "No face detected. Please ensure:\n• Your face is clearly visible\n• Good lighting (no shadows)\n"
+    "• Look directly at camera\n• Remove sunglasses/masks"
+)
+
+
+def cloudinary_configured():
+    return bool(cloudinary.config().cloud_name and cloudinary.config().api_key)
+
+
+def cloudinary_public_id(image_url):
+    """Extract the public_id from a Cloudinary delivery URL (.../upload/v<ver>/<folder>/<name>.<ext>)"""
+    if not (isinstance(image_url, str) and image_url.startswith('http') and 'res.cloudinary.com' in image_url):
+        return None
+    parts = image_url.split('/upload/')
+    if len(parts) != 2:
+        return None
+    tail = parts[1]
+    # Remove version segment if present (e.g., v1729989999/)
+    if tail.startswith('v'):
+        tail = '/'.join(tail.split('/')[1:])
+    return tail.rsplit('.', 1)[0]
+
+
+def _discard_unused_image(student_image):
+    """Remove a stored photo once no student refers to it any more"""
+    if student_image is None or student_image.students.filter(is_active=True).exists():
+        return False
+    remove_local_files(student_image)
+    student_image.delete()
+    return True
+
+
+def _remove_unindexed_student(job):
+    """index_student_face failed for good: drop the pending enrollment so it cannot linger unrecognizable"""
+    student = Student.objects.filter(id=job.payload['student_pk'], face_encoding__isnull=True).first()
+    if student is None:
+        return
+    logger.warning(f"Face indexing failed for {student.name}; removing pending enrollment")
+    student_image = student.image
+    student.delete()
+    _discard_unused_image(student_image)
+
+
+@job_handler('index_student_face', on_failure=_remove_unindexed_student)
+def index_student_face(job):
+    """Index a newly enrolled student's photo in Rekognition, then queue the upload"""
+    from .views.face_recognition_utils import AWS_CONFIGURED, index_face_rekognition
+
+    student = Student.objects.filter(id=job.payload['student_pk']).first()
+    if student is None:
+        raise PermanentJobError("Student no longer exists")
+    if not AWS_CONFIGURED:
+        raise RuntimeError("Face recognition service not configured")
+
+    student_image = student.image
+    if student_image is None:
+        raise PermanentJobError("Student has no stored photo")
+    image_bytes = original_bytes(student_image)
+
+    face_id = index_face_rekognition(image_bytes, student.student_id, student.name)
+    if face_id is None:
+        logger.warning(f"No face detected for {student.name}; removing pending enrollment")
+        student.delete()
+        _discard_unused_image(student_image)
+        raise PermanentJobError(NO_FACE_MESSAGE)
+
+    student.face_encoding = json.dumps({
+        'face_id': face_id,
+        'student_id': student.student_id,
+        'indexed_at': datetime.now().isoformat(),
+        'service': 'aws_rekognition'
+    })
+    student.save(update_fields=['face_encoding'])
+    logger.info(f"Face indexed for {student.name} (Face ID: {face_id})")
+
+    if not student_image.thumbnail:
+        build_derivatives(student_image)
+
+    upload_job = enqueue(
+        'upload_student_image',
+        {'image_id': student_image.id},
+        idempotency_key=f"upload_student_image:{student_image.content_hash}",
+        created_by=job.created_by,
+    )
+    return {
+        'student_pk': student.id,
+        'face_id': face_id,
+        'upload_job_id': upload_job.id,
+        'message': f"Student {student.name} added successfully!",
+    }
+
+
+@job_handler('upload_student_image')
+def upload_student_image(job):
+    """Move a locally stored photo to Cloudinary under its content hash"""
+    student_image = StudentImage.objects.filter(id=job.payload['image_id']).first()
+    if student_image is None:
+        raise PermanentJobError("Image no longer exists")
+    if student_image.original.startswith('http'):
+        return {'image_path': student_image.original, 'stored': 'cloudinary'}
+    if not cloudinary_configured():
+        return {'image_path': student_image.original, 'stored': 'local'}
+
+    local_path = os.path.join(settings.MEDIA_ROOT, student_image.original)
+    upload_started = time.perf_counter()
+    try:
+        # overwrite=False makes a retried or repeated upload of the same hash a no-op
+        upload_result = cloudinary.uploader.upload(
+            local_path,
+            folder="attendance_students",
+            public_id=student_image.content_hash,
+            overwrite=False,
+            resource_type="image"
+        )
+    except Exception:
+        metrics.cloudinary_upload_seconds.observe(time.perf_counter() - upload_started, outcome='error')
+        raise
+    metrics.cloudinary_upload_seconds.observe(time.perf_counter() - upload_started, outcome='ok')
+
+    url = upload_result['secure_url']
+    StudentImage.objects.filter(id=student_image.id).update(original=url)
+    Student.objects.filter(image=student_image).update(image_path=url)
+    try:
+        os.remove(local_path)
+    except OSError:
+        pass
+    logger.info(f"Uploaded image {student_image.content_hash[:12]} to Cloudinary: {url}")
+    return {'image_path': url, 'stored': 'cloudinary'}
+
+
+@job_handler('delete_student_assets')
+def delete_student_assets(job):
+    """Remove a deleted student's face from Rekognition and photo from Cloudinary"""
+    from .views.face_recognition_utils import AWS_CONFIGURED, delete_face_rekognition
+
+    result = {}
+    face_id = job.payload.get('face_id')
+    if face_id:
+        if not AWS_CONFIGURED:
+            raise RuntimeError("Face recognition service not configured")
+        if not delete_face_rekognition(face_id):
+            raise RuntimeError(f"Failed to delete face {face_id}")
+        result['face_deleted'] = face_id
+
+    student_image = StudentImage.objects.filter(id=job.payload.get('image_id')).first()
+    if student_image is not None and student_image.students.filter(is_active=True).exists():
+        # Another enrolled student uses the same photo
+        return result
+
+    public_id = cloudinary_public_id(job.payload.get('image_path'))
+    if public_id:
+        cloudinary.uploader.destroy(public_id, resource_type='image')
+        result['cloudinary_deleted'] = public_id
+        logger.info(f"Deleted Cloudinary asset {public_id}")
+    if _discard_unused_image(student_image):
+        result['image_deleted'] = student_image.content_hash
+    return result
+
+
+@job_handler('build_export')
+def build_export(job):
+    """Render an export to MEDIA_ROOT/exports for later download"""
+    from .views.dashboard_views import generate_export_file
+
+    payload = job.payload
+    teacher = None
+    if payload.get('teacher_id'):
+        teacher = Teacher.objects.filter(id=payload['teacher_id']).first()
+        if teacher is None:
+            raise PermanentJobError("Teacher no longer exists")
+
+    extension = payload.get('extension', 'csv')
+    export_dir = os.path.join(settings.MEDIA_ROOT, 'exports')
+    os.makedirs(export_dir, exist_ok=True)
+    file_path = os.path.join(export_dir, f"export_{job.id}.{extension}")
+    # Streaming exports query while their content is consumed, so write the file inside the block
+    with replica_reads():
+        response = generate_export_file(
+            payload.get('type', 'csv'),
+            payload.get('date_from'),
+            payload.get('date_to'),
+            payload.get('title', 'Attendance Report'),
+            teacher,
+        )
+        if response.status_code != 200:
+            raise PermanentJobError(json.loads(response.content).get('error', 'Export failed'))
+
+        with open(file_path, 'wb') as fh:
+            if response.streaming:
+                for chunk in response.streaming_content:
+                    fh.write(chunk)
+            else:
+                fh.write(response.content)
+
+    return {
+        'path': os.path.relpath(file_path, settings.MEDIA_ROOT),
+        'filename': f"{payload.get('title', 'Attendance Report')}.{extension}",
+        'content_type': response['Content-Type'],
+        'size': os.path.getsize(file_path),
+        'download_url': f"/jobs/{job.id}/download/",
+    }
@@ -1,3 +1,1534 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import random
+import tempfile
+from datetime import date, time, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import pyarrow as pa
+import pyarrow.parquet as pq
+from docx import Document
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from .db_router import PIN_COOKIE, ReplicaRouter, ReplicaRoutingMiddleware, read_from_replica, replica_reads
+from . import incremental, metrics
+from .analytics import WEEKDAYS, build_attendance_matrix, compute_analytics
+from .archive import archive_term, archived_records
+from .bulk_export import DICTIONARY_COLUMNS, EXPORT_SCHEMA, record_batches, stream_export
+from .changelog import changes_since, latest_cursor
+from .checks import check_worker_cache
+from .columnar import COLUMNAR_MEDIA_TYPE
+from .events import EventBroker, TooManySubscribers, broker
+from .image_cache import ImageFetcher
+from .jobs import enqueue, run_pending
+from .management.commands.benchmark_recognition import StubRekognitionClient
+from .middleware import MetricsMiddleware
+from .payload_cache import cached_json, data_version
+from .models import (
+    AIQuery, AttendanceRecord, AttendanceSession, BackgroundJob, ChangeLogEntry, Class, ExportConsumer, Student,
+    StudentClassSummary, StudentImage, Teacher,
+)
+from .record_keys import session_keys
+from .reports import RECORD_HEADER, SUMMARY_HEADER, _sheet_title, write_docx, write_xlsx
+from .summaries import rebuild_summaries, refresh_session, verify_summaries
+from .views.dashboard_views import _format_record, _format_session, export_rows, get_complete_attendance_data
+from .views.event_views import _event_stream
+
+_metrics_dir = tempfile.TemporaryDirectory()
+_metrics_settings = override_settings(METRICS_DIR=_metrics_dir.name)
+
+
+def setUpModule():
+    # Keep the snapshots the test client's requests write out of BASE_DIR/metrics
+    _metrics_settings.enable()
+
+
+def tearDownModule():
+    _metrics_settings.disable()
+    metrics.registry().snapshots_enabled = False
+    _metrics_dir.cleanup()
+
+
+def seed_attendance(teachers, prefix, start, students=100, days=10, classes_per_teacher=4,
+                    sessions_per_day=4, records_per_session=15, seed=42):
+    """
+    Bulk-create classes, students (1-3 classes each, every tenth inactive),
+    sessions from `start` on and their records, then rebuild the summaries
+    and change log the signals would have written. `prefix` keeps codes unique.
+    """
+    rng = random.Random(seed)
+    classes = Class.objects.bulk_create([
+        Class(name=f"Class {prefix}{t}-{c}", code=f"{prefix}{t}{c}", teacher=teacher)
+        for t, teacher in enumerate(teachers) for c in range(classes_per_teacher)
+    ])
+    students = Student.objects.bulk_create([
+        Student(name=f"Student {prefix}{i:04d}", student_id=f"{prefix}{i:04d}", image_path='', is_active=i % 10 != 0)
+        for i in range(students)
+    ])
+    Membership = Student.classes.through
+    Membership.objects.bulk_create([
+        Membership(student_id=student.id, class_id=klass.id)
+        for student in students for klass in rng.sample(classes, rng.randint(1, 3))
+    ])
+    sessions = AttendanceSession.objects.bulk_create([
+        AttendanceSession(name=f"Session {prefix}{day}-{slot}", date=start + timedelta(days=day),
+                          start_time=time(8 + 2 * slot), teacher=klass.teacher, class_session=klass)
+        for day in range(days) for slot, klass in enumerate(rng.sample(classes, sessions_per_day))
+    ])
+    records = AttendanceRecord.objects.bulk_create([
+        AttendanceRecord(student=student, session=session, is_late=rng.random() < 0.2, **session_keys(session))
+        for session in sessions for student in rng.sample(students, records_per_session)
+    ])
+    # auto_now_add fields ignore constructor values; move the records to their session dates
+    for session in sessions:
+        AttendanceRecord.objects.filter(session=session).update(date=session.date)
+
+    rebuild_summaries()
+    ChangeLogEntry.objects.bulk_create([
+        ChangeLogEntry(kind=ChangeLogEntry.KIND_RECORD, action=ChangeLogEntry.ACTION_UPSERT,
+                       object_id=record.id, teacher_id=record.session.teacher_id)
+        for record in records
+    ])
+    return {'classes': classes, 'students': students, 'sessions': sessions, 'records': records}
+
+
+def expand_columnar(payload):
+    """Row payload rebuilt from its columnar encoding (faceapp.columnar), by following every index"""
+    data = dict(payload)
+    del data['format'], data['format_version']
+    listed = data.pop('listed_students')
+    columns = lambda table: [dict(zip(table, values)) for values in zip(*table.values())]
+    students = columns(data.pop('students'))
+    sessions = columns(data.pop('sessions'))
+    records = data.pop('records')
+    student_positions, session_positions = records.pop('student'), records.pop('session')
+    details = data.pop('session_details')
+    statistics = data.pop('student_statistics')
+    names = lambda positions: [students[i]['name'] for i in positions]
+
+    data['all_students'] = students[:listed]
+    data['all_sessions'] = sessions
+    data['all_attendance_records'] = [
+        {**record, 'student_id': students[student]['id'], 'student__name': students[student]['name'],
+         'session_id': sessions[session]['id'], 'session__name': sessions[session]['name']}
+        for record, student, session in zip(columns(records), student_positions, session_positions)
+    ]
+    data['session_details'] = {}
+    for key, session, present, absent, late, eligible in zip(
+            details['key'], details['session'], details['present'], details['absent'], details['late'],
+            details['eligible_count']):
+        present = names(present)
+        data['session_details'][key] = {
+            'session_info': sessions[session],
+            'present_students': present,
+            'absent_students': names(absent),
+            'present_count': len(present),
+            'absent_count': len(absent),
+            'eligible_count': eligible,
+            'late_students': [present[i] for i in late],
+            'on_time_students': [name for i, name in enumerate(present) if i not in late],
+        }
+    data['student_statistics'] = {row.pop('name'): row for row in columns(statistics)}
+    return data
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN the hot dashboard / analytics / export queries against a seeded
+    dataset and fail when one of them falls back to a full table scan.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teachers = [
+            Teacher.objects.create_user(username=f"plan-teacher-{i}", password='x') for i in range(3)
+        ]
+        start = date(2024, 9, 1)
+        data = seed_attendance(cls.teachers, 'PLAN', start, students=400, days=60)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        cls.teacher = cls.teachers[0]
+        cls.klass = data['classes'][0]
+        cls.student = data['students'][1]
+        cls.session = data['sessions'][len(data['sessions']) // 2]
+        cls.window = (start + timedelta(days=20), start + timedelta(days=27))
+        cls.watermark = data['records'][len(data['records']) * 9 // 10].id
+
+    def hot_queries(self):
+        teacher, klass, student, session = self.teacher, self.klass, self.student, self.session
+        date_from, date_to = self.window
+        return {
+            'teacher sessions, newest first': AttendanceSession.objects.filter(
+                teacher=teacher).order_by('-date', '-start_time'),
+            'teacher sessions in a date window': AttendanceSession.objects.filter(
+                teacher=teacher, date__range=self.window).order_by('-date', '-start_time'),
+            'sessions of a class': AttendanceSession.objects.filter(class_session=klass).values('id'),
+            'records of a teacher': AttendanceRecord.objects.filter(
+                teacher=teacher).values('student_id', 'session_id', 'is_late'),
+            'records of a teacher in a date window': AttendanceRecord.objects.filter(
+                teacher=teacher, session_date__range=(date_from, date_to)).values('id'),
+            'records of a class in a date window': AttendanceRecord.objects.filter(
+                class_session=klass, session_date__range=(date_from, date_to)).values('id'),
+            'late count of a session': AttendanceRecord.objects.filter(session=session, is_late=True).values('id'),
+            'records of a student in a class': AttendanceRecord.objects.filter(
+                student=student, class_session=klass).values('session_id'),
+            'records of a teacher after a watermark': AttendanceRecord.objects.filter(
+                teacher=teacher, id__gt=self.watermark).order_by('id').values('id'),
+            'records by record date': AttendanceRecord.objects.filter(
+                date__range=(date_from, date_to)).values('id'),
+            'history of a student': AttendanceRecord.objects.filter(
+                student=student, date__gte=date_from).values('session_id', 'date'),
+            'active students of a teacher': Student.objects.filter(
+                is_active=True, classes__teacher=teacher).values('id', 'name'),
+            'active students by name': Student.objects.filter(is_active=True).order_by('name').values('id', 'name'),
+            'memberships of classes': Student.classes.through.objects.filter(
+                class_id__in=[klass.id], student__is_active=True).values('student_id'),
+            'change log since cursor': ChangeLogEntry.objects.filter(
+                teacher=teacher, id__gt=100).order_by('id').values('id'),
+            'summaries of a teacher': StudentClassSummary.objects.filter(
+                class_session__teacher=teacher).values('student_id', 'attended'),
+        }
+
+    def full_scans(self, queryset):
+        """Tables the query plan reads without an index"""
+        if connection.vendor == 'sqlite':
+            plan = queryset.explain()
+            # "SCAN t" is a full scan, "SCAN t USING [COVERING] INDEX" is an ordered index walk
+            return [line.strip() for line in plan.splitlines()
+                    if ' SCAN ' in f" {line.strip(' |-`')} " and 'USING' not in line]
+        if connection.vendor == 'postgresql':
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    # Seq scans win on tiny tables; only report those with no usable index
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                plan = json.loads(queryset.explain(format='json'))
+            scans = []
+
+            def walk(node):
+                if node.get('Node Type') == 'Seq Scan':
+                    scans.append(node.get('Relation Name'))
+                for child in node.get('Plans', []):
+                    walk(child)
+
+            walk(plan[0]['Plan'])
+            return scans
+        self.skipTest(f"No plan check for {connection.vendor}")
+
+    def test_hot_queries_use_indexes(self):
+        for name, queryset in self.hot_queries().items():
+            with self.subTest(query=name):
+                self.assertEqual(self.full_scans(queryset), [], f"{name}:\n{queryset.explain()}")
+
+
+@override_settings(CHANGE_LOG_SAFETY_SECONDS=0)
+class QueryBudgetTests(TestCase):
+    """
+    Every JSON view runs a fixed number of queries: growing the data must
+    not change the count, and the count must stay within its budget.
+    """
+
+    # Session and user lookups plus the session save (SESSION_SAVE_EVERY_REQUEST)
+    REQUEST_QUERIES = 5
+    # Queries of the view itself
+    BUDGETS = {
+        '/get_all_students/': 2,
+        '/get_teacher_students/': 2,
+        '/get_teacher_classes/': 1,
+        '/get_sessions/': 1,
+        '/dashboard_data/': 7,
+        '/dashboard_data/?format=columnar': 7,
+        '/dashboard_summary/': 6,
+        '/dashboard_summary/?class_id={class_id}': 7,
+        '/attendance_records/': 1,
+        '/session_details/': 3,
+        '/advanced_analytics_data/': 7,
+        '/analytics_changes/?cursor=0': 11,
+        'export': 1,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Teacher.objects.create_user(username='budget-teacher', password='x')
+        cls.admin = Teacher.objects.create_user(username='budget-admin', password='x', is_admin=True)
+
+    def setUp(self):
+        self.batches = 0
+        # Budgets count the queries of one connection; keep replica views on it
+        patcher = mock.patch('faceapp.db_router.replica_configured', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def grow(self):
+        """Add another batch of classes, students, sessions and records around today"""
+        self.batches += 1
+        data = seed_attendance([self.teacher], f"B{self.batches}X", date.today() - timedelta(days=10),
+                               students=40 * self.batches, days=14, seed=self.batches)
+        self.class_id = data['classes'][0].id
+
+    def count_queries(self, user, url):
+        cache.clear()  # payloads are cached between requests
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            if url == 'export':
+                response = self.client.post('/export_data/', json.dumps({'type': 'csv'}),
+                                            content_type='application/json')
+                b''.join(response.streaming_content)  # rows are read as the response streams
+            else:
+                response = self.client.get(url.format(class_id=self.class_id))
+        self.assertEqual(response.status_code, 200, url)
+        return len(queries)
+
+    def assert_constant(self, user, urls):
+        self.grow()
+        small = {url: self.count_queries(user, url) for url in urls}
+        self.grow()
+        self.grow()
+        large = {url: self.count_queries(user, url) for url in urls}
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(small[url], large[url], f"{url} query count grows with the data")
+                self.assertLessEqual(large[url] - self.REQUEST_QUERIES, self.BUDGETS[url])
+
+    def test_teacher_views(self):
+        self.assert_constant(self.teacher, list(self.BUDGETS))
+
+    def test_admin_views(self):
+        self.assert_constant(self.admin, list(self.BUDGETS))
+
+
+class AttendanceDataTests(TestCase):
+    """get_complete_attendance_data() matches the per-record computation it replaced, order included"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teachers = [Teacher.objects.create_user(username=f"complete-{i}", password='x') for i in range(2)]
+        data = seed_attendance(cls.teachers, 'CMP', date(2024, 9, 2), students=40, days=6, classes_per_teacher=3,
+                               sessions_per_day=3, records_per_session=8)
+        # A session without a class, on the same date and time as a seeded one, and a record without a session
+        seeded = data['sessions'][0]
+        session = AttendanceSession.objects.create(name='Unscheduled', teacher=seeded.teacher, date=seeded.date,
+                                                   start_time=seeded.start_time)
+        AttendanceRecord.objects.create(student=data['students'][1], session=session, is_late=True)
+        AttendanceRecord.objects.create(student=data['students'][2])
+
+    def per_record_data(self, teacher):
+        """The old computation: every statistic from a scan of the records, queries in the documented order"""
+        students = Student.objects.filter(is_active=True)
+        sessions = AttendanceSession.objects.all()
+        records = AttendanceRecord.objects.all()
+        if teacher:
+            students = students.filter(classes__teacher=teacher).distinct()
+            sessions = sessions.filter(teacher=teacher)
+            records = records.filter(session__teacher=teacher)
+        all_students = list(students.order_by('id').values('id', 'name', 'student_id', 'email'))
+        all_sessions = [_format_session(session) for session in sessions.order_by('-date', '-start_time', '-id').values(
+            'id', 'name', 'date', 'start_time', 'end_time', 'class_session__name')]
+        all_records = [_format_record(record) for record in records.order_by('id').values(
+            'student__name', 'student_id', 'session__name', 'session_id', 'date', 'time', 'arrival_time', 'is_late',
+            'timestamp', 'id')]
+
+        student_stats = {}
+        for student in all_students:
+            student_records = [r for r in all_records if r['student_id'] == student['id']]
+            attended = len(set(r['session_id'] for r in student_records))
+            available = AttendanceSession.objects.filter(class_session__students__id=student['id'])
+            if teacher:
+                available = available.filter(teacher=teacher)
+            available = max(attended, available.count())
+            student_stats[student['name']] = {
+                'total_sessions_attended': attended,
+                'available_sessions': available,
+                'times_late': len([r for r in student_records if r['is_late']]),
+                'times_on_time': len([r for r in student_records if not r['is_late']]),
+                'attendance_percentage': min(round(attended / available * 100, 1), 100.0) if available else 0,
+            }
+
+        session_details = {}
+        for session in all_sessions:
+            session_records = [r for r in all_records if r['session_id'] == session['id']]
+            present = [r['student__name'] for r in session_records]
+            if teacher:
+                eligible = list(Student.objects.filter(classes__sessions__id=session['id'], is_active=True)
+                                .order_by('id').values_list('name', flat=True))
+            else:
+                eligible = [s['name'] for s in all_students]
+            eligible = eligible or present
+            absent = [name for name in eligible if name not in present]
+            session_details[f"{session['name']}_{session['date']}"] = {
+                'session_info': session,
+                'present_students': present,
+                'absent_students': absent,
+                'present_count': len(present),
+                'absent_count': len(absent),
+                'eligible_count': len(eligible),
+                'late_students': [r['student__name'] for r in session_records if r['is_late']],
+                'on_time_students': [r['student__name'] for r in session_records if not r['is_late']],
+            }
+
+        return {
+            'total_students': len(all_students),
+            'total_sessions': len(all_sessions),
+            'today_date': date.today().strftime('%Y-%m-%d'),
+            'all_students': all_students,
+            'all_sessions': all_sessions,
+            'all_attendance_records': all_records,
+            'student_statistics': student_stats,
+            'session_details': session_details,
+            'sessions_list': sorted(set(session['name'] for session in all_sessions)),
+            'unique_dates': sorted(set(session['date'] for session in all_sessions)),
+        }
+
+    def assertSameData(self, teacher):
+        expected = self.per_record_data(teacher)
+        actual = get_complete_attendance_data(teacher)
+        # Compare lists as lists, so a difference in order fails too
+        for key in ('student_statistics', 'session_details'):
+            self.assertEqual(list(actual.pop(key).items()), list(expected.pop(key).items()), key)
+        self.assertEqual(actual, expected)
+
+    def test_teacher_data(self):
+        for teacher in self.teachers:
+            self.assertSameData(teacher)
+
+    def test_admin_data(self):
+        self.assertSameData(None)
+
+    def per_record_csv(self, teacher, date_from=None, date_to=None):
+        """The old CSV export: the dashboard's records, filtered by date in Python, written to a StringIO"""
+        records = self.per_record_data(teacher)['all_attendance_records']
+        if date_from and date_to:
+            records = [record for record in records if date_from <= record['date'] <= date_to]
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(['Student Name', 'Session', 'Date', 'Time', 'Status', 'Late'])
+        for record in records:
+            writer.writerow([record['student__name'], record['session__name'] if record['session__name'] else 'N/A',
+                             record['date'], record['time'], 'Present', 'Yes' if record['is_late'] else 'No'])
+        return output.getvalue().encode('utf-8')
+
+    @mock.patch('faceapp.views.dashboard_views.EXPORT_CHUNK_SIZE', 7)
+    def test_csv_export_streams_the_old_output(self):
+        admin = Teacher.objects.create_user(username='complete-admin', password='x', is_admin=True)
+        for user, teacher in [(self.teachers[0], self.teachers[0]), (admin, None)]:
+            self.client.force_login(user)
+            for window in [{}, {'date_from': '2024-09-03', 'date_to': '2024-09-05'}]:
+                with self.subTest(user=user.username, **window):
+                    response = self.client.post('/export_data/', json.dumps({'type': 'csv', **window}),
+                                                content_type='application/json')
+                    self.assertIsInstance(response, StreamingHttpResponse)
+                    self.assertEqual(response['Content-Type'], 'text/csv')
+                    body = b''.join(response.streaming_content)
+                    self.assertEqual(body, self.per_record_csv(teacher, window.get('date_from'), window.get('date_to')))
+                    self.assertGreater(body.count(b'\n'), 7)
+
+
+class DashboardPaginationTests(TestCase):
+    """Cursor pages of records and sessions cover everything once; summaries cache on the parsed filters"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Teacher.objects.create_user(username='pages-teacher', password='x')
+        seed_attendance([cls.teacher], 'PG', date(2024, 4, 1), students=12, days=2, classes_per_teacher=3,
+                        sessions_per_day=2, records_per_session=3)
+        cls.record_ids = list(AttendanceRecord.objects.order_by('-id').values_list('id', flat=True))
+        cls.session_ids = list(AttendanceSession.objects.order_by('-date', '-start_time', '-id')
+                               .values_list('id', flat=True))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.teacher)
+
+    def pages(self, url, limit, key):
+        ids, cursors, cursor = [], [], None
+        while True:
+            response = self.client.get(url, {'limit': limit, **({'cursor': cursor} if cursor is not None else {})})
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertLessEqual(len(page[key]), limit)
+            ids += [row['session_info']['id'] if key == 'sessions' else row['id'] for row in page[key]]
+            cursor = page['next_cursor']
+            self.assertEqual(page['has_more'], cursor is not None)
+            if cursor is None:
+                return ids, cursors
+            cursors.append(cursor)
+
+    def test_record_pages(self):
+        ids, cursors = self.pages('/attendance_records/', 5, 'records')
+        self.assertEqual(ids, self.record_ids)
+        self.assertEqual(len(cursors), 2)  # 12 records: 5 + 5 + 2
+        self.assertEqual(cursors[0], str(self.record_ids[4]))
+
+    def test_session_pages(self):
+        ids, cursors = self.pages('/session_details/', 3, 'sessions')
+        self.assertEqual(ids, self.session_ids)
+        self.assertEqual(len(cursors), 1)  # 4 sessions: 3 + 1
+
+    def test_cursor_zero_is_a_cursor(self):
+        self.assertEqual(self.client.get('/attendance_records/', {'cursor': 0}).json()['records'], [])
+
+    def test_invalid_cursor(self):
+        for url, cursor in (('/attendance_records/', 'abc'), ('/session_details/', '2024-04-01|08:00:00'),
+                            ('/session_details/', 'x|y|z')):
+            self.assertEqual(self.client.get(url, {'cursor': cursor}).status_code, 400, cursor)
+
+    @override_settings(PAYLOAD_CACHE_ENABLED=True)
+    def test_summary_cache_ignores_parameter_order(self):
+        with mock.patch('faceapp.views.dashboard_views.get_attendance_summary', return_value={}) as build:
+            self.client.get('/dashboard_summary/?date_from=2024-04-01&date_to=2024-04-02')
+            self.client.get('/dashboard_summary/?date_to=2024-04-02&date_from=2024-04-01&_=1')
+            self.client.get('/dashboard_summary/?date_from=2024-04-01')
+        self.assertEqual(build.call_count, 2)
+
+
+class SummarySignalTests(TestCase):
+    """Every write path keeps the summaries equal to a full recompute"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Teacher.objects.create_user(username='summary-teacher', password='x')
+        cls.classes = [Class.objects.create(name=f"Summary {i}", code=f"SUM{i}", teacher=cls.teacher) for i in range(2)]
+        cls.students = [Student.objects.create(name=f"Summary {i}", student_id=f"SUM{i}", image_path='') for i in range(4)]
+        for student in cls.students:
+            student.classes.add(*cls.classes)
+        cls.sessions = [
+            AttendanceSession.objects.create(name=f"Summary session {i}", class_session=cls.classes[i % 2],
+                                             teacher=cls.teacher, date=date.today(), start_time=time(8 + i))
+            for i in range(3)
+        ]
+        for session in cls.sessions:
+            for student in cls.students[:3]:
+                AttendanceRecord.objects.create(student=student, session=session, is_late=student is cls.students[0])
+
+    def assertSummariesCurrent(self):
+        self.assertEqual(verify_summaries(), [])
+
+    def test_seeded_summaries_are_current(self):
+        self.assertSummariesCurrent()
+        summary = StudentClassSummary.objects.get(student=self.students[0], class_session=self.classes[0])
+        self.assertEqual((summary.attended, summary.late, summary.eligible_sessions), (2, 2, 2))
+
+    def test_record_save_and_delete(self):
+        record = AttendanceRecord.objects.create(student=self.students[3], session=self.sessions[0])
+        self.assertSummariesCurrent()
+        record.is_late = True
+        record.save()
+        self.assertSummariesCurrent()
+        record.delete()
+        self.assertSummariesCurrent()
+
+    def test_session_delete(self):
+        self.sessions[0].delete()
+        self.assertSummariesCurrent()
+
+    def test_enrollment_clear(self):
+        self.students[0].classes.clear()
+        self.assertSummariesCurrent()
+        self.classes[1].students.clear()
+        self.assertSummariesCurrent()
+
+    def test_student_delete(self):
+        self.students[1].delete()
+        self.assertSummariesCurrent()
+
+    def test_refresh_locks_the_summary_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            refresh_session(self.sessions[0].id)
+        locks = [query['sql'] for query in queries if 'sessionsummary' in query['sql'].lower()]
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', locks[0])
+        self.assertTrue(locks[0].lstrip().upper().startswith('SELECT'))
+        self.assertSummariesCurrent()
+
+
+@override_settings(CHANGE_LOG_SAFETY_SECONDS=0)
+class ChangeLogTests(TestCase):
+    """Delta syncs return upserts and tombstones after a cursor, and never skip an entry"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Teacher.objects.create_user(username='log-teacher', password='x')
+        cls.other = Teacher.objects.create_user(username='log-other', password='x')
+        cls.klass = Class.objects.create(name='Log', code='LOG1', teacher=cls.teacher)
+        cls.students = [Student.objects.create(name=f"Log {i}", student_id=f"LOG{i}", image_path='') for i in range(3)]
+        cls.session = AttendanceSession.objects.create(
+            name='Log session', class_session=cls.klass, teacher=cls.teacher,
+            date=date.today(), start_time=time(9), end_time=time(10))
+
+    def write(self, action):
+        """Run `action` and the change log inserts it schedules on commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            return action()
+
+    def attend(self, student):
+        return self.write(lambda: AttendanceRecord.objects.create(student=student, session=self.session))
+
+    def test_upserts_then_tombstones(self):
+        cursor = latest_cursor()
+        record = self.attend(self.students[0])
+        self.write(lambda: self.students[1].classes.add(self.klass))
+
+        changes = changes_since(self.teacher, cursor)
+        self.assertEqual(list(changes['records']), [record.id])
+        self.assertEqual(changes['records'][record.id]['student_id'], self.students[0].id)
+        self.assertEqual(changes['enrollments']['added'], [[self.students[1].id, self.klass.id]])
+        self.assertFalse(changes['reset'])
+        self.assertEqual(changes_since(self.teacher, changes['cursor'])['cursor'], changes['cursor'])
+        self.assertEqual(changes_since(self.other, cursor)['records'], {})
+
+        cursor = changes['cursor']
+        record_id = record.id
+        self.write(record.delete)
+        self.write(lambda: self.students[1].classes.remove(self.klass))
+        changes = changes_since(self.teacher, cursor)
+        self.assertEqual(changes['records'], {})
+        self.assertEqual(changes['deleted']['records'], [record_id])
+        self.assertEqual(changes['enrollments']['removed'], [[self.students[1].id, self.klass.id]])
+
+        cursor = changes['cursor']
+        session_id = self.session.id
+        self.write(self.session.delete)
+        self.assertEqual(changes_since(self.teacher, cursor)['deleted']['sessions'], [session_id])
+
+    def test_pages_follow_the_limit(self):
+        cursor = latest_cursor()
+        records = [self.attend(student) for student in self.students]
+        first = changes_since(self.teacher, cursor, limit=2)
+        self.assertTrue(first['has_more'])
+        self.assertEqual(list(first['records']), [record.id for record in records[:2]])
+        rest = changes_since(self.teacher, first['cursor'], limit=2)
+        self.assertFalse(rest['has_more'])
+        self.assertEqual(list(rest['records']), [records[2].id])
+
+    def test_pruned_cursor_resets(self):
+        for student in self.students:
+            self.attend(student)
+        newest = latest_cursor()
+        ChangeLogEntry.objects.filter(id__lt=newest).delete()
+        self.assertTrue(changes_since(self.teacher, 0)['reset'])
+        self.assertFalse(changes_since(self.teacher, newest - 1)['reset'])
+
+    @override_settings(CHANGE_LOG_SAFETY_SECONDS=60)
+    def test_recent_entries_and_their_successors_wait(self):
+        cursor = latest_cursor()
+        settled, fresh, after = [self.attend(student) for student in self.students]
+        old = timezone.now() - timedelta(minutes=5)
+        ChangeLogEntry.objects.filter(object_id__in=[settled.id, after.id], kind='record').update(created_at=old)
+
+        changes = changes_since(self.teacher, cursor)
+        # `after` is old enough, but an entry before it is not: it waits too
+        self.assertEqual(list(changes['records']), [settled.id])
+        self.assertFalse(changes['has_more'])
+
+        ChangeLogEntry.objects.filter(object_id=fresh.id, kind='record').update(created_at=old)
+        self.assertEqual(list(changes_since(self.teacher, changes['cursor'])['records']), [fresh.id, after.id])
+
+
+@override_settings(EXPORT_WATERMARK_LAG_SECONDS=0)
+class IncrementalExportTests(TestCase):
+    """Incremental exports send each record once, in id order, and only advance after a full export"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Teacher.objects.create_user(username='inc-teacher', password='x')
+        cls.other = Teacher.objects.create_user(username='inc-other', password='x')
+        cls.admin = Teacher.objects.create_user(username='inc-admin', password='x', is_admin=True)
+        cls.students = [Student.objects.create(name=f"Inc {i}", student_id=f"INC{i}", image_path='') for i in range(4)]
+        cls.sessions = {
+            teacher: AttendanceSession.objects.create(
+                name=f"Inc {teacher.username}", teacher=teacher, date=date.today(),
+                start_time=time(9), end_time=time(10))
+            for teacher in (cls.teacher, cls.other)
+        }
+
+    def attend(self, student, teacher=None):
+        return AttendanceRecord.objects.create(student=student, session=self.sessions[teacher or self.teacher])
+
+    def export(self, name='nightly', export_type='csv'):
+        self.client.force_login(self.teacher)
+        return self.client.post(f'/exports/{name}/', json.dumps({'type': export_type}), content_type='application/json')
+
+    def test_export_sends_new_records_once(self):
+        first = [self.attend(student) for student in self.students[:2]]
+        self.attend(self.students[0], self.other)
+
+        response = self.export(export_type='arrow')
+        table = pa.ipc.open_stream(b''.join(response.streaming_content)).read_all()
+        self.assertEqual(table['id'].to_pylist(), [record.id for record in first])
+        self.assertEqual(response['X-Export-Watermark-From'], '0')
+        self.assertEqual(response['X-Export-Watermark'], str(first[-1].id))
+        self.assertEqual(ExportConsumer.objects.get(name='nightly').watermark, first[-1].id)
+
+        response = self.export()
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines()[1:], [])
+
+        later = self.attend(self.students[2])
+        response = self.export()
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn(self.students[2].name, lines[1])
+        self.assertEqual(ExportConsumer.objects.get(name='nightly').watermark, later.id)
+
+    def test_admins_export_every_teacher(self):
+        records = [self.attend(self.students[0]), self.attend(self.students[1], self.other)]
+        consumer = incremental.consumer_for(self.admin, 'all')
+        pending, high = incremental.pending_records(consumer)
+        self.assertEqual(list(pending.values_list('id', flat=True)), [record.id for record in records])
+        self.assertEqual(high, records[-1].id)
+
+    def test_interrupted_export_keeps_the_watermark(self):
+        self.attend(self.students[0])
+        response = self.export()
+        next(iter(response.streaming_content))
+        response.close()
+        self.assertEqual(ExportConsumer.objects.get(name='nightly').watermark, 0)
+
+    def test_concurrent_exports_advance_once(self):
+        records = [self.attend(student) for student in self.students[:2]]
+        consumer = incremental.consumer_for(self.teacher, 'nightly')
+        racer = ExportConsumer.objects.get(id=consumer.id)
+        _, high = incremental.pending_records(consumer)
+        self.attend(self.students[2])
+        _, racer_high = incremental.pending_records(racer)
+
+        self.assertTrue(incremental.advance(racer, 0, racer_high))
+        self.assertFalse(incremental.advance(consumer, 0, high))
+        self.assertEqual(ExportConsumer.objects.get(id=consumer.id).watermark, racer_high)
+        self.assertGreater(racer_high, records[-1].id)
+
+    def test_reset(self):
+        records = [self.attend(student) for student in self.students[:3]]
+        consumer = incremental.consumer_for(self.teacher, 'nightly')
+        self.assertEqual(incremental.reset(consumer, incremental.RESET_LATEST).watermark, records[-1].id)
+        self.assertEqual(incremental.pending_records(consumer)[1], records[-1].id)
+        self.assertEqual(incremental.reset(consumer, records[0].id).watermark, records[0].id)
+        self.assertEqual(list(incremental.pending_records(consumer)[0]), records[1:])
+        with self.assertRaises(ValueError):
+            incremental.reset(consumer, -1)
+
+        self.client.force_login(self.teacher)
+        response = self.client.post('/exports/nightly/reset/', json.dumps({}), content_type='application/json')
+        self.assertEqual(json.loads(response.content), {'consumer': 'nightly', 'watermark': 0})
+
+    @override_settings(EXPORT_WATERMARK_LAG_SECONDS=60)
+    def test_recent_records_and_their_successors_wait(self):
+        settled, recent, after = [self.attend(student) for student in self.students[:3]]
+        AttendanceRecord.objects.filter(id__in=[settled.id, after.id]).update(
+            timestamp=timezone.now() - timedelta(minutes=5))
+        consumer = incremental.consumer_for(self.teacher, 'nightly')
+        # `after` is old enough, but `recent` before it may stand for a transaction still open
+        self.assertEqual(incremental.pending_records(consumer)[1], settled.id)
+
+
+@override_settings(JOBS_MODE='worker')
+class JobQueueTests(TestCase):
+    """Failed jobs can be queued again and clean up after themselves"""
+
+    def setUp(self):
+        self.student = Student.objects.create(name='Pending', student_id='JOB1', image_path='')
+
+    def fail(self, job):
+        with mock.patch('faceapp.views.face_recognition_utils.AWS_CONFIGURED', False):
+            run_pending(limit=1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, BackgroundJob.STATUS_FAILED)
+
+    def test_final_failure_removes_unindexed_student(self):
+        job = enqueue('index_student_face', {'student_pk': self.student.id},
+                      idempotency_key=f"index_student_face:{self.student.id}", max_attempts=1)
+        self.fail(job)
+        self.assertFalse(Student.objects.filter(id=self.student.id).exists())
+
+    def test_failed_key_is_queued_again(self):
+        key = 'index_student_face:retry'
+        job = enqueue('index_student_face', {'student_pk': 0}, idempotency_key=key)
+        self.fail(job)
+        again = enqueue('index_student_face', {'student_pk': self.student.id}, idempotency_key=key)
+        self.assertEqual(again.id, job.id)
+        self.assertEqual((again.status, again.attempts, again.payload), (BackgroundJob.STATUS_QUEUED, 0,
+                                                                         {'student_pk': self.student.id}))
+        # Keys of queued or finished jobs still deduplicate
+        self.assertEqual(enqueue('index_student_face', {'student_pk': 1}, idempotency_key=key).payload,
+                         {'student_pk': self.student.id})
+
+
+class StudentPhotoTests(TestCase):
+    """Photos shared by content hash stay scoped to each teacher's students"""
+    PHOTO = 'data:image/jpeg;base64,' + 'A' * 8
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Teacher.objects.create_user(username='photo-teacher', password='x')
+        cls.other = Teacher.objects.create_user(username='photo-other', password='x')
+        cls.admin = Teacher.objects.create_user(username='photo-admin', password='x', is_admin=True)
+        cls.klass = Class.objects.create(name='Photos', code='PH1', teacher=cls.teacher)
+        other_class = Class.objects.create(name='Other photos', code='PH2', teacher=cls.other)
+        cls.image = StudentImage.objects.create(content_hash='ab' * 32, original='students/ab/photo.jpg')
+        cls.theirs = Student.objects.create(name='Their student', student_id='PH-T', image_path=cls.image.original,
+                                            image=cls.image)
+        cls.theirs.classes.add(other_class)
+
+    def enroll(self):
+        self.client.force_login(self.teacher)
+        with mock.patch.multiple('faceapp.views.student_views', AWS_CONFIGURED=True,
+                                 store_photo=mock.Mock(return_value=(self.image, b'', False))):
+            return self.client.post('/add_student/', json.dumps({'name': 'New student', 'image': self.PHOTO}),
+                                    content_type='application/json')
+
+    def test_photo_of_another_teachers_student_is_enrolled_again(self):
+        response = self.enroll()
+        self.assertEqual(response.status_code, 202)
+        self.assertNotIn('Their student', response.content.decode())
+        student = Student.objects.get(id=response.json()['student_id'])
+        self.assertEqual((student.name, student.image_id), ('New student', self.image.id))
+        self.assertEqual(list(student.classes.all()), [self.klass])
+
+    def test_photo_of_own_student_is_not_enrolled_twice(self):
+        mine = Student.objects.create(name='My student', student_id='PH-M', image_path=self.image.original,
+                                      image=self.image)
+        mine.classes.add(self.klass)
+        response = self.enroll()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['student_id'], mine.id)
+        self.assertEqual(Student.objects.filter(image=self.image).count(), 2)
+
+    def test_photos_are_served_to_the_students_teachers_and_admins(self):
+        url = f"/student_image/{self.image.content_hash}/thumbnail/"
+        with mock.patch('faceapp.views.student_views.derivative_bytes', return_value=b'jpeg'):
+            for user, status in ((self.teacher, 404), (self.other, 200), (self.admin, 200)):
+                self.client.force_login(user)
+                self.assertEqual(self.client.get(url).status_code, status, user.username)
+
+
+class ImageCacheTests(TestCase):
+    """Remote photos are revalidated once stale and evicted least recently used first"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(IMAGE_CACHE_DIR=directory.name, IMAGE_CACHE_MAX_BYTES=250)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.fetcher = ImageFetcher()
+        self.fetcher._session = mock.Mock()
+
+    def respond(self, status=200, body=b'', etag=None):
+        response = mock.Mock(status_code=status, content=body, headers={'ETag': etag} if etag else {})
+        self.fetcher.session.get.return_value = response
+
+    def body_path(self, name):
+        return self.fetcher._paths(f'https://images.test/{name}.jpg')[0]
+
+    def fetch(self, name, body=None):
+        if body is not None:
+            self.respond(body=body, etag=f'"{name}"')
+        return self.fetcher.fetch_bytes(f'https://images.test/{name}.jpg')
+
+    def test_stale_entry_is_revalidated(self):
+        self.assertEqual(self.fetch('a', b'a' * 10), (b'a' * 10, '"a"'))
+        with override_settings(IMAGE_CACHE_FRESH_SECONDS=0):
+            self.respond(status=304)
+            self.assertEqual(self.fetch('a'), (b'a' * 10, '"a"'))
+        self.assertEqual(self.fetcher.session.get.call_args.kwargs['headers'], {'If-None-Match': '"a"'})
+
+        self.fetcher.session.get.reset_mock()
+        self.assertEqual(self.fetch('a'), (b'a' * 10, '"a"'))
+        self.assertFalse(self.fetcher.session.get.called)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        with mock.patch.object(self.fetcher, '_evict', wraps=self.fetcher._evict) as evict:
+            self.fetch('a', b'a' * 100)
+            self.fetch('b', b'b' * 100)
+            self.assertEqual(evict.call_count, 1)  # the first write scans, later ones count
+
+            for mtime, name in enumerate(['a', 'b'], start=1000):
+                os.utime(self.body_path(name), (mtime, mtime))
+            self.fetch('a')
+            self.fetch('c', b'c' * 100)
+            self.assertEqual(evict.call_count, 2)
+        self.assertEqual([os.path.exists(self.body_path(name)) for name in 'abc'], [True, False, True])
+        self.assertEqual(self.fetcher._cache_bytes, 200)
+
+
+class MetricsTests(TestCase):
+    """/metrics is private, and request metrics include every query of a streamed response"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Teacher.objects.create_user(username='metrics-teacher', password='x')
+        cls.admin = Teacher.objects.create_user(username='metrics-admin', password='x', is_admin=True)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_without_token_only_admins_read_metrics(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.client.force_login(self.teacher)
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_token_scrape(self):
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret').status_code, 200)
+
+    def test_streamed_queries_are_counted_on_close(self):
+        def stream():
+            yield str(Teacher.objects.count())
+            yield str(Student.objects.count())
+
+        middleware = MetricsMiddleware(lambda request: StreamingHttpResponse(stream()))
+        with mock.patch.object(metrics.db_queries, 'inc') as counted:
+            response = middleware(RequestFactory().get('/'))
+            self.assertFalse(counted.called)
+            self.assertEqual(b''.join(response), b'20')
+            response.close()
+        counted.assert_called_once_with(2, view='unmatched')
+
+    def test_only_serving_processes_write_snapshots(self):
+        registry = metrics.MetricsRegistry()
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            registry.maybe_flush()
+            registry.flush_at_exit()
+            self.assertEqual(os.listdir(directory), [])
+            registry.enable_snapshots()
+            registry.flush_at_exit()
+            self.assertEqual(os.listdir(directory), [f"metrics_{os.getpid()}.json"])
+
+
+class ServerTimingTests(TestCase):
+    """Timed views report their stages in a Server-Timing header"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Teacher.objects.create_user(username='timing-teacher', password='x')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.teacher)
+
+    def stage_names(self, response):
+        parts = response['Server-Timing'].split(', ')
+        for part in parts:
+            self.assertRegex(part, r'^\w+;dur=\d+\.\d$')
+        return [part.split(';')[0] for part in parts]
+
+    @override_settings(PAYLOAD_CACHE_ENABLED=True)
+    def test_stages_are_sent_and_logged(self):
+        with self.assertLogs('faceapp.performance', 'INFO') as logs:
+            response = self.client.get('/advanced_analytics_data/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stage_names(response), ['db_lookup', 'analytics', 'cache', 'total'])
+        self.assertIn('advanced_analytics_data GET 200 user=timing-teacher total=', logs.output[0])
+
+        response = self.client.get('/advanced_analytics_data/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.stage_names(response), ['total'])
+
+
+class BenchmarkCommandTests(TestCase):
+    """benchmark_recognition leaves no faces behind and keeps off live collections"""
+
+    def test_aws_backend_refuses_live_collection(self):
+        with mock.patch.multiple('faceapp.views.face_recognition_utils', create=True, AWS_CONFIGURED=True,
+                                 AWS_COLLECTION_ID='attendance-faces'):
+            with self.assertRaisesMessage(CommandError, '--allow-live'):
+                call_command('benchmark_recognition', '--backend', 'aws', stdout=io.StringIO())
+
+    def test_cleanup_deletes_indexed_faces(self):
+        deleted = []
+        delete_faces = lambda self, CollectionId, FaceIds: deleted.extend(FaceIds)
+        with mock.patch.object(StubRekognitionClient, 'delete_faces', delete_faces):
+            call_command('benchmark_recognition', '--gallery-sizes', '3', '--concurrency', '1', '--frames', '2',
+                         stdout=io.StringIO())
+        self.assertEqual(len(deleted), 3)
+        self.assertFalse(Student.objects.filter(student_id__startswith='BENCH').exists())
+
+
+class EventBrokerTests(TestCase):
+    """Live feed resume, overflow and subscriber limits"""
+
+    def publish(self, broker, count, teacher_id=1):
+        return [broker.publish(teacher_id, 10, {'n': n}).id for n in range(count)]
+
+    def test_resume_from_ring_buffer(self):
+        broker = EventBroker(buffer_size=3)
+        self.publish(broker, 5)  # ids 1-5; 3-5 stay buffered
+        subscription, backlog, complete = broker.subscribe(last_event_id=3)
+        self.assertEqual(([event.id for event in backlog], complete), ([4, 5], True))
+        # Event 2 was buffered and evicted, so the gap is reported
+        subscription, backlog, complete = broker.subscribe(last_event_id=1)
+        self.assertEqual(([event.id for event in backlog], complete), ([3, 4, 5], False))
+        subscription, backlog, complete = broker.subscribe(teacher_id=2, last_event_id=3)
+        self.assertEqual((backlog, complete), ([], True))
+        # An id from another process or before a restart cannot be resumed
+        self.assertFalse(broker.subscribe(last_event_id=99)[2])
+
+    def test_overflow_ends_stream_and_resume_catches_up(self):
+        broker = EventBroker(buffer_size=10)
+        subscription, _, _ = broker.subscribe(queue_size=2)
+        ids = self.publish(broker, 3)
+        self.assertTrue(subscription.overflowed)
+        self.assertEqual([subscription.get(0).id, subscription.get(0).id, subscription.get(0)], [1, 2, None])
+
+        chunks = list(_event_stream(subscription, [], True))
+        self.assertEqual(len(chunks), 1)  # just the retry hint: the stream closes at once
+        self.assertEqual(broker.subscriber_count(), 0)
+        _, backlog, complete = broker.subscribe(last_event_id=ids[0])
+        self.assertEqual(([event.id for event in backlog], complete), (ids[1:], True))
+
+    def test_subscriber_limit(self):
+        limited = EventBroker(max_subscribers=1)
+        first, _, _ = limited.subscribe()
+        with self.assertRaises(TooManySubscribers):
+            limited.subscribe()
+        first.close()
+        limited.subscribe()
+
+        teacher = Teacher.objects.create_user(username='events-teacher', password='x')
+        self.client.force_login(teacher)
+        open_streams = broker.subscriber_count()
+        with mock.patch.object(broker, 'max_subscribers', open_streams + 1):
+            stream = self.client.get('/events/attendance/')
+            self.assertEqual(next(iter(stream.streaming_content)), b'retry: %d\n\n' % settings.SSE_RETRY_MS)
+            self.assertEqual(self.client.get('/events/attendance/').status_code, 503)
+            stream.close()
+            self.assertEqual(broker.subscriber_count(), open_streams)
+            self.assertEqual(self.client.get('/events/attendance/?session_id=0').status_code, 404)
+
+
+class AnalyticsTests(TestCase):
+    """compute_analytics on a small hand-made attendance matrix"""
+    MONDAY = date(2024, 3, 4)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Teacher.objects.create_user(username='analytics-teacher', password='x')
+        cls.empty = Teacher.objects.create_user(username='analytics-empty', password='x')
+        klass = Class.objects.create(name='Analytics', code='AN1', teacher=cls.teacher)
+        # Always there; there for the first four days only; always there but late
+        cls.steady, cls.dropping, cls.late = [
+            Student.objects.create(name=name, student_id=f"AN{i}", image_path='')
+            for i, name in enumerate(['A steady', 'B dropping', 'C late'])
+        ]
+        for student in (cls.steady, cls.dropping, cls.late):
+            student.classes.add(klass)
+        for day in range(8):  # Monday to the next Monday, one 9:00 session a day
+            session = AttendanceSession.objects.create(name=f"AN day {day}", class_session=klass, teacher=cls.teacher,
+                                                       date=cls.MONDAY + timedelta(days=day), start_time=time(9))
+            AttendanceRecord.objects.create(student=cls.steady, session=session)
+            AttendanceRecord.objects.create(student=cls.late, session=session, is_late=True)
+            if day < 4:
+                AttendanceRecord.objects.create(student=cls.dropping, session=session)
+
+    def test_empty_dataset(self):
+        analytics = compute_analytics(self.empty)
+        self.assertEqual(analytics['overall'], {'students': 0, 'sessions': 0, 'attendance_rate': None,
+                                                'late_rate': None, 'at_risk_count': 0, 'truncated': False})
+        self.assertEqual(analytics['students']['id'], [])
+        self.assertEqual(analytics['daily']['date'], [])
+        self.assertEqual(analytics['heatmap']['weekdays'], [])
+        self.assertEqual(analytics['at_risk'], [])
+
+    def test_risk_scores_and_at_risk(self):
+        analytics = compute_analytics(self.teacher)
+        students = analytics['students']
+        self.assertEqual(students['id'], [self.steady.id, self.dropping.id, self.late.id])
+        self.assertEqual(students['attendance_rate'], [100.0, 50.0, 100.0])
+        self.assertEqual(students['recent_rate'], [100.0, 20.0, 100.0])
+        self.assertEqual(students['current_streak'], [8, -4, 8])
+        self.assertEqual(students['longest_streak'], [8, 4, 8])
+        # 55% overall shortfall + 30% recent shortfall; 15% for lateness
+        self.assertEqual(students['risk_score'], [0, 85, 15])
+        self.assertEqual(students['at_risk'], [False, True, False])
+        self.assertEqual(analytics['at_risk'], [self.dropping.id])
+        self.assertEqual(analytics['overall']['attendance_rate'], 83.3)
+
+    def test_weekday_heatmap(self):
+        heatmap = compute_analytics(self.teacher)['heatmap']
+        self.assertEqual(heatmap['weekdays'], WEEKDAYS)
+        self.assertEqual(heatmap['slots'], ['09:00'])
+        self.assertEqual(heatmap['sessions'], [[2], [1], [1], [1], [1], [1], [1]])
+        # Monday: 3 of 3, then 2 of 3 a week later
+        self.assertEqual(heatmap['weekday_attendance_rate'], [83.3, 100.0, 100.0, 100.0, 66.7, 66.7, 66.7])
+
+    def test_rolling_daily_rate(self):
+        daily = compute_analytics(self.teacher)['daily']
+        self.assertEqual(daily['attendance_rate'], [100.0] * 4 + [66.7] * 4)
+        self.assertEqual(daily['rolling_attendance_rate'], [100.0, 100.0, 100.0, 100.0, 93.3, 88.9, 85.7, 81.0])
+        window = compute_analytics(self.teacher, self.MONDAY + timedelta(days=4), self.MONDAY + timedelta(days=7))
+        self.assertEqual(window['daily']['rolling_attendance_rate'], [66.7] * 4)
+
+    @override_settings(ANALYTICS_MAX_SESSIONS=3)
+    def test_matrix_keeps_the_newest_sessions(self):
+        analytics = compute_analytics(self.teacher)
+        self.assertEqual((analytics['overall']['sessions'], analytics['overall']['truncated']), (3, True))
+        self.assertEqual(analytics['daily']['date'], [str(self.MONDAY + timedelta(days=day)) for day in range(5, 8)])
+        self.assertEqual(analytics['students']['attended'], [3, 0, 3])
+
+    def test_endpoint_sends_analytics_without_raw_lists(self):
+        self.client.force_login(self.teacher)
+        payload = self.client.get('/advanced_analytics_data/').json()
+        self.assertEqual(set(payload), {'today_date', 'classes', 'analytics', 'analytics_filters', 'change_cursor',
+                                        'analytics_ready'})
+        self.assertEqual(payload['classes'], ['Analytics'])
+        self.assertEqual(payload['analytics']['students']['id'], [self.steady.id, self.dropping.id, self.late.id])
+
+
+class ColumnarPayloadTests(TestCase):
+    """The columnar dashboard payload expands back to the row payload"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Teacher.objects.create_user(username='columnar-rows', password='x')
+        klass = Class.objects.create(name='Columnar', code='COL1', teacher=cls.teacher)
+        # Two students share a name; the last one leaves and only appears through a record
+        cls.students = [Student.objects.create(name=name, student_id=f"COL{i}", image_path='')
+                        for i, name in enumerate(['Ada', 'Ben', 'Ben', 'Cy'])]
+        for student in cls.students:
+            student.classes.add(klass)
+        for day in range(3):
+            session = AttendanceSession.objects.create(name=f"COL day {day}", class_session=klass, teacher=cls.teacher,
+                                                       date=date(2024, 5, 6) + timedelta(days=day), start_time=time(9))
+            for i, student in enumerate(cls.students[day % 2:]):
+                AttendanceRecord.objects.create(student=student, session=session, is_late=(i + day) % 2 == 1)
+        # Only the second Ben attends, late; then only Ada, so both Bens are absent
+        cls.ben_session, cls.ada_session = [
+            AttendanceSession.objects.create(name=name, class_session=klass, teacher=cls.teacher,
+                                             date=date(2024, 5, 9), start_time=time(9))
+            for name in ['COL second Ben', 'COL only Ada']
+        ]
+        AttendanceRecord.objects.create(student=cls.students[2], session=cls.ben_session, is_late=True)
+        AttendanceRecord.objects.create(student=cls.students[0], session=cls.ada_session)
+        cls.students[3].is_active = False
+        cls.students[3].save()
+
+    def test_columnar_round_trip(self):
+        self.client.force_login(self.teacher)
+        rows = json.loads(self.client.get('/dashboard_data/').content)
+        response = self.client.get('/dashboard_data/?format=columnar')
+        self.assertEqual(response['Content-Type'], COLUMNAR_MEDIA_TYPE)
+        payload = json.loads(response.content)
+
+        self.assertEqual(payload['listed_students'], 3)
+        self.assertEqual(len(payload['students']['id']), 4)
+        self.assertTrue(any(payload['session_details']['late']))
+        self.assertEqual(expand_columnar(payload), rows)
+
+    def test_details_follow_records(self):
+        self.client.force_login(self.teacher)
+        payload = json.loads(self.client.get('/dashboard_data/?format=columnar').content)
+        student_ids, records, details = payload['students']['id'], payload['records'], payload['session_details']
+        for session, present, late in zip(details['session'], details['present'], details['late']):
+            positions = [i for i, s in enumerate(records['session']) if s == session]
+            # Present students are the session's records in record (id) order, late ones index into them
+            self.assertEqual(present, [records['student'][i] for i in positions])
+            self.assertEqual(late, [n for n, i in enumerate(positions) if records['is_late'][i]])
+
+        detail = details['key'].index(f"COL second Ben_{self.ben_session.date}")
+        self.assertEqual([student_ids[i] for i in details['present'][detail]], [self.students[2].id])
+        self.assertEqual(details['late'][detail], [0])
+        # Absent students are known by name only: the first Ben stands for every Ben
+        detail = details['key'].index(f"COL only Ada_{self.ada_session.date}")
+        self.assertEqual([student_ids[i] for i in details['absent'][detail]], [self.students[1].id] * 2)
+
+
+class ColumnarExportTests(TestCase):
+    """Parquet and Arrow IPC exports read back with pyarrow"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Teacher.objects.create_user(username='columnar-teacher', password='x')
+        seed_attendance([cls.teacher], 'CX', date(2024, 3, 4), students=20, days=3, classes_per_teacher=3,
+                        sessions_per_day=2, records_per_session=5)
+
+    def read(self, export_type, **scope):
+        data = b''.join(stream_export(export_type, self.teacher, **scope))
+        if export_type == 'parquet':
+            return pq.read_table(pa.BufferReader(data))
+        return pa.ipc.open_stream(data).read_all()
+
+    @mock.patch('faceapp.bulk_export.BATCH_ROWS', 7)
+    def test_schema_dictionaries_and_rows(self):
+        for export_type in ('parquet', 'arrow'):
+            with self.subTest(export_type):
+                table = self.read(export_type)
+                self.assertEqual(table.schema.names, EXPORT_SCHEMA.names)
+                self.assertEqual(table.num_rows, 30)
+                for name in DICTIONARY_COLUMNS:
+                    self.assertTrue(pa.types.is_dictionary(table.schema.field(name).type), name)
+                    self.assertEqual(table.schema.field(name).type.value_type, pa.string())
+                self.assertEqual(table.schema.field('date').type, pa.date32())
+                self.assertEqual(table.schema.field('is_late').type, pa.bool_())
+                self.assertEqual(sorted(table['id'].to_pylist()),
+                                 sorted(AttendanceRecord.objects.values_list('id', flat=True)))
+                self.assertEqual(set(table['student_code'].to_pylist()),
+                                 set(AttendanceRecord.objects.values_list('student__student_id', flat=True)))
+
+    def test_empty_export_keeps_its_schema(self):
+        for export_type in ('parquet', 'arrow'):
+            with self.subTest(export_type):
+                table = self.read(export_type, date_from=date(2020, 1, 1), date_to=date(2020, 1, 2))
+                self.assertEqual(table.num_rows, 0)
+                self.assertEqual(table.schema.names, EXPORT_SCHEMA.names)
+
+
+class ReportTests(TestCase):
+    """The XLSX and DOCX reports, read back from the written files"""
+    FIRST, LAST = date(2023, 2, 6), date(2023, 2, 8)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Teacher.objects.create_user(username='report-teacher', password='x')
+        cls.old = Class.objects.create(name='Reports A', code='RPA', teacher=cls.teacher,
+                                       academic_year='2022-2023', semester='Spring')
+        cls.current = Class.objects.create(name='Reports B', code='RPB', teacher=cls.teacher)
+        cls.students = [Student.objects.create(name=f"Report {i}", student_id=f"RP{i}", image_path='')
+                        for i in range(4)]
+        for student in cls.students:
+            student.classes.add(cls.old, cls.current)
+        # Class A: student i attends days 0..i, so Report 0 and Report 1 fall below 75%
+        for day in range(3):
+            session = AttendanceSession.objects.create(name=f"RPA day {day}", class_session=cls.old, teacher=cls.teacher,
+                                                       date=cls.FIRST + timedelta(days=day), start_time=time(9))
+            for student in cls.students[day:]:
+                AttendanceRecord.objects.create(student=student, session=session, is_late=day == 2)
+            AttendanceRecord.objects.filter(session=session).update(date=session.date)
+        session = AttendanceSession.objects.create(name='RPB day 0', class_session=cls.current, teacher=cls.teacher,
+                                                   date=cls.LAST, start_time=time(11))
+        for student in cls.students:
+            AttendanceRecord.objects.create(student=student, session=session)
+        AttendanceRecord.objects.filter(session=session).update(date=session.date)
+
+    def workbook(self, **scope):
+        fh = io.BytesIO()
+        written = write_xlsx(fh, self.teacher, **scope)
+        return written, load_workbook(fh, read_only=True)
+
+    def test_xlsx_summary_and_class_sheets(self):
+        written, workbook = self.workbook()
+        self.assertEqual(written, 13)
+        self.assertEqual(workbook.sheetnames, ['Summary', 'RPA Reports A', 'RPB Reports B'])
+
+        rows = list(workbook['Summary'].values)
+        header = rows.index(tuple(SUMMARY_HEADER))
+        self.assertEqual(rows[header + 1], ('Reports A', 'RPA', 4, 3, 9, 2, 12, 75.0))
+        self.assertEqual(rows[header + 2], ('Reports B', 'RPB', 4, 1, 4, 0, 4, 100.0))
+        self.assertEqual(rows[header + 3], ('Total', None, 8, 4, 13, 2, 16, 81.2))
+
+        sheet = list(workbook['RPA Reports A'].values)
+        self.assertEqual(sheet[0], tuple(RECORD_HEADER))
+        self.assertEqual(len(sheet) - 1, 9)
+        self.assertEqual(sum(row[6] == 'Yes' for row in sheet[1:]), 2)
+        self.assertEqual(len(list(workbook['RPB Reports B'].values)) - 1, 4)
+
+    def test_sheet_titles(self):
+        used = {'summary'}
+        self.assertEqual(_sheet_title('Summary', used), 'Summary (2)')
+        self.assertEqual(_sheet_title('A/B: [x]?', used), 'A B   x')
+        self.assertEqual(_sheet_title('X' * 40, used), 'X' * 31)
+        # Excel compares sheet names ignoring case; the suffix still fits in 31 characters
+        self.assertEqual(_sheet_title('x' * 40, used), 'x' * 27 + ' (2)')
+        self.assertTrue(all(len(title) <= 31 for title in used))
+        self.assertEqual(_sheet_title('***', used), 'Class')
+
+    def test_xlsx_merges_archived_rows_in_range(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(ARCHIVE_ROOT=directory):
+            sheets = lambda workbook: {sheet.title: list(sheet.values) for sheet in workbook}
+            before = sheets(self.workbook(date_from=self.FIRST, date_to=self.LAST)[1])
+            archive_term('2022-2023', 'Spring')
+            written, workbook = self.workbook(date_from=self.FIRST, date_to=self.LAST)
+            after = sheets(workbook)
+        self.assertEqual(written, 13)
+        # Only the "Generated" line of the summary may differ
+        del before['Summary'][2], after['Summary'][2]
+        self.assertEqual(after, before)
+
+    def test_docx_low_attendance_table(self):
+        fh = io.BytesIO()
+        write_docx(fh, self.teacher)
+        tables = Document(fh).tables
+        classes = [[cell.text for cell in row.cells] for row in tables[0].rows]
+        self.assertEqual(classes[1], ['Reports A', 'RPA', '4', '3', '9', '2', '12', '75.0%'])
+        students = [[cell.text for cell in row.cells] for row in tables[1].rows]
+        self.assertEqual(students[1:], [
+            ['Report 0', 'RP0', 'RPA', '1', '3', '0', '33.3%'],
+            ['Report 1', 'RP1', 'RPA', '2', '3', '0', '66.7%'],
+        ])
+
+
+class ArchiveTests(TestCase):
+    """Archiving a term moves exactly its rows, and windowed reads still see them"""
+    FIRST, LAST = date(2023, 2, 6), date(2023, 2, 8)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Teacher.objects.create_user(username='archive-teacher', password='x')
+        cls.other = Teacher.objects.create_user(username='archive-other', password='x')
+        cls.klass = Class.objects.create(name='Archived', code='ARC1', teacher=cls.teacher,
+                                         academic_year='2022-2023', semester='Spring')
+        current = Class.objects.create(name='Current', code='ARC2', teacher=cls.other)
+        cls.students = [Student.objects.create(name=f"Archive {i}", student_id=f"ARC{i}", image_path='')
+                        for i in range(4)]
+        for student in cls.students:
+            student.classes.add(cls.klass, current)
+        for klass, teacher in ((cls.klass, cls.teacher), (current, cls.other)):
+            for day in range(3):
+                session = AttendanceSession.objects.create(
+                    name=f"{klass.code} day {day}", class_session=klass, teacher=teacher,
+                    date=cls.FIRST + timedelta(days=day), start_time=time(9))
+                for student in cls.students[day:]:
+                    AttendanceRecord.objects.create(student=student, session=session, is_late=day == 1)
+                AttendanceRecord.objects.filter(session=session).update(date=session.date)
+        # AI queries belong to no teacher, so archiving a term must leave them alone
+        query = AIQuery.objects.create(query='How many?', response='Some.')
+        AIQuery.objects.filter(id=query.id).update(timestamp=timezone.now().replace(year=2023, month=2, day=7))
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(ARCHIVE_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def windowed(self):
+        matrix = build_attendance_matrix(self.teacher, self.FIRST, self.LAST)
+        return {
+            'sessions': list(matrix.sessions['date']),
+            'present': matrix.present.tolist(),
+            'late': matrix.late.tolist(),
+            'csv': sorted(export_rows(self.teacher, self.FIRST, self.LAST)),
+            'arrow': sum(batch.num_rows for batch in record_batches(self.teacher, self.FIRST, self.LAST)),
+        }
+
+    def test_archive_term_moves_only_the_term(self):
+        other_records = AttendanceRecord.objects.filter(teacher=self.other).count()
+        term = archive_term('2022-2023', 'Spring')
+
+        self.assertEqual((term.session_count, term.record_count), (3, 9))
+        self.assertEqual((term.date_from, term.date_to), (self.FIRST, self.LAST))
+        self.assertFalse(AttendanceSession.objects.filter(class_session=self.klass).exists())
+        self.assertEqual(AttendanceRecord.objects.filter(teacher=self.other).count(), other_records)
+        self.assertEqual(AIQuery.objects.count(), 1)
+        self.assertEqual(len(archived_records(self.teacher, self.FIRST, self.LAST)), 9)
+        self.assertEqual(len(archived_records(self.other, self.FIRST, self.LAST)), 0)
+        self.assertEqual(verify_summaries(), [])
+        self.assertIsNone(archive_term('2022-2023', 'Spring'))
+
+    def test_windowed_reads_merge_the_archive(self):
+        before = self.windowed()
+        archive_term('2022-2023', 'Spring')
+        self.assertEqual(self.windowed(), before)
+        self.assertEqual(before['arrow'], 9)
+
+
+class PayloadVersionTests(TestCase):
+    """A teacher's writes invalidate that teacher's and the admins' payloads, not other teachers'"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Teacher.objects.create_user(username='version-teacher', password='x')
+        cls.other = Teacher.objects.create_user(username='version-other', password='x')
+        cls.admin = Teacher.objects.create_user(username='version-admin', password='x', is_admin=True)
+        cls.klass = Class.objects.create(name='Versions', code='VER1', teacher=cls.teacher)
+        cls.student = Student.objects.create(name='Versioned', student_id='VER1', image_path='')
+
+    def setUp(self):
+        cache.clear()
+
+    def changed(self, write):
+        users = (self.teacher, self.other, self.admin)
+        before = [data_version(user) for user in users]
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        return [data_version(user) != version for user, version in zip(users, before)]
+
+    def test_teacher_writes_stay_in_scope(self):
+        session = AttendanceSession(name='Versions', class_session=self.klass, teacher=self.teacher,
+                                    date=date.today(), start_time=time(9))
+        self.assertEqual(self.changed(session.save), [True, False, True])
+        self.assertEqual(self.changed(lambda: self.student.classes.add(self.klass)), [True, False, True])
+        record = AttendanceRecord(student=self.student, session=session)
+        self.assertEqual(self.changed(record.save), [True, False, True])
+        self.assertEqual(self.changed(record.delete), [True, False, True])
+
+    def test_shared_writes_reach_everyone(self):
+        self.assertEqual(self.changed(self.student.save), [True, True, True])
+        self.assertEqual(self.changed(lambda: self.klass.save(update_fields=['name'])), [True, True, True])
+
+
+@override_settings(PAYLOAD_CACHE_ENABLED=True)
+class ConditionalPayloadTests(TestCase):
+    """Polls revalidate with If-None-Match and get 304 until the teacher's data changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Teacher.objects.create_user(username='etag-teacher', password='x')
+        cls.other = Teacher.objects.create_user(username='etag-other', password='x')
+        cls.classes = {teacher: Class.objects.create(name='ETags', code=f"ET{i}", teacher=teacher)
+                       for i, teacher in enumerate((cls.teacher, cls.other))}
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.teacher)
+
+    def poll(self, etag=None):
+        return self.client.get('/dashboard_data/', **({'HTTP_IF_NONE_MATCH': etag} if etag else {}))
+
+    def add_session(self, teacher):
+        with self.captureOnCommitCallbacks(execute=True):
+            AttendanceSession.objects.create(name='ETag session', class_session=self.classes[teacher],
+                                             teacher=teacher, date=date.today(), start_time=time(9))
+
+    def test_unchanged_payload_is_not_modified(self):
+        response = self.poll()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        revalidated = self.poll(etag)
+        self.assertEqual((revalidated.status_code, revalidated['ETag'], revalidated.content), (304, etag, b''))
+        self.assertIn('no-cache', revalidated['Cache-Control'])
+
+    def test_only_the_teachers_writes_change_the_etag(self):
+        etag = self.poll()['ETag']
+        self.add_session(self.other)
+        self.assertEqual(self.poll(etag).status_code, 304)
+        self.add_session(self.teacher)
+        response = self.poll(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.poll(response['ETag']).status_code, 304)
+
+
+class SharedCacheTests(TestCase):
+    """Processes writing data apart from the web process need a cache it can see"""
+
+    @override_settings(PAYLOAD_CACHE_ENABLED=True, JOBS_MODE='worker')
+    def test_worker_refuses_process_local_cache(self):
+        with self.assertRaisesMessage(CommandError, 'process-local'):
+            call_command('run_jobs', '--once')
+        self.assertEqual([error.id for error in check_worker_cache(None)], ['faceapp.E001'])
+
+    @override_settings(PAYLOAD_CACHE_ENABLED=True, JOBS_MODE='worker')
+    def test_worker_runs_on_shared_cache(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory,
+        }}):
+            self.assertEqual(check_worker_cache(None), [])
+            call_command('run_jobs', '--once', stdout=io.StringIO())
+
+    @override_settings(PAYLOAD_CACHE_ENABLED=False, JOBS_MODE='worker')
+    def test_commands_run_without_payload_cache(self):
+        self.assertEqual(check_worker_cache(None), [])
+        call_command('rebuild_attendance_summaries', stdout=io.StringIO())
+        call_command('backfill_record_keys', stdout=io.StringIO())
+        out = io.StringIO()
+        call_command('archive_terms', '1999-2000:Fall', stdout=out)
+        self.assertIn('nothing to archive', out.getvalue())
+        # Without the cache nothing would invalidate an ETag, so none is sent
+        self.client.force_login(Teacher.objects.create_user(username='uncached-teacher', password='x'))
+        response = self.client.get('/dashboard_data/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+    @override_settings(PAYLOAD_CACHE_ENABLED=True)
+    def test_commands_refuse_process_local_cache(self):
+        for args in (['rebuild_attendance_summaries'], ['backfill_record_keys'], ['archive_terms', '1999-2000:Fall']):
+            with self.assertRaisesMessage(CommandError, 'PAYLOAD_CACHE_ENABLED=False'):
+                call_command(*args)
+
+
+class ReplicaRouterTests(TestCase):
+    """Reads of replica views go to the replica unless the request or client wrote recently"""
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        patcher = mock.patch('faceapp.db_router.replica_configured', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_use_replica_until_a_write(self):
+        self.assertEqual(self.router.db_for_read(Student), 'default')
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Student), 'replica')
+            # Session saves happen on every request and do not count
+            self.router.db_for_write(Session)
+            self.assertEqual(self.router.db_for_read(Student), 'replica')
+            self.assertEqual(self.router.db_for_write(AttendanceRecord), 'default')
+            self.assertEqual(self.router.db_for_read(Student), 'default')
+
+    def test_write_pins_client_to_primary(self):
+        reads = []
+
+        @read_from_replica
+        def view(request):
+            reads.append(self.router.db_for_read(Student))
+            if request.method == 'POST':
+                self.router.db_for_write(AttendanceRecord)
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(view)
+        factory = RequestFactory()
+        self.assertNotIn(PIN_COOKIE, middleware(factory.get('/')).cookies)
+        response = middleware(factory.post('/'))
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], settings.REPLICA_STICKY_SECONDS)
+
+        pinned = factory.get('/')
+        pinned.COOKIES[PIN_COOKIE] = '1'
+        middleware(pinned)
+        self.assertEqual(reads, ['replica', 'replica', 'default'])
+
+    @override_settings(PAYLOAD_CACHE_ENABLED=True)
+    def test_cached_payloads_build_on_primary(self):
+        cache.clear()
+        reads = []
+
+        def build():
+            reads.append(self.router.db_for_read(Student))
+            return {}
+
+        with replica_reads():
+            cached_json('replica-test', Teacher(id=1), build)
+            reads.append(self.router.db_for_read(Student))
+        self.assertEqual(reads, ['default', 'replica'])
+
+
+@skipUnless('replica' in settings.DATABASES, 'REPLICA_DATABASE_URL is not set')
+class ReplicaDatabaseTests(TransactionTestCase):
+    """
+    Route through a second database, e.g. REPLICA_DATABASE_URL=sqlite:///db_replica.sqlite3.
+    The test replica mirrors the test database; rows must be committed before the
+    replica connection can read them, hence TransactionTestCase.
+    """
+    databases = {'default', 'replica'} if 'replica' in settings.DATABASES else {'default'}
+
+    def test_views_read_from_replica_unless_pinned(self):
+        teacher = Teacher.objects.create_user(username='replica-teacher', password='x')
+        self.client.force_login(teacher)
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            response = self.client.get('/attendance_records/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(replica_queries), 0)
+
+        # Cached payloads are built on the primary
+        cache.clear()
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            response = self.client.get('/dashboard_summary/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(replica_queries), 0)
+
+        self.client.cookies[PIN_COOKIE] = '1'
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            response = self.client.get('/attendance_records/?page=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(replica_queries), 0)
@@ -0,0 +1,109 @@
+"""
+Per-stage request timing.
+
+A StageTimer collects named durations (decode, recognize, detect, db_lookup,
+db_write, serialize, ...) for the current request. Views opt in with the
+@server_timing decorator, which exposes the durations in a Server-Timing
+response header and logs them to the faceapp.performance logger. Code that
+has no access to the request (e.g. face_recognition_utils) records into the
+active timer through timed_stage() / @timed, which are no-ops outside a
+timed request.
+"""
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+performance_logger = logging.getLogger('faceapp.performance')
+
+_current_timer = contextvars.ContextVar('faceapp_stage_timer', default=None)
+
+
+class StageTimer:
+    """Accumulates wall-clock durations per named stage"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counts = {}
+
+    def record(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def header_value(self, total=None):
+        """Format stages as a Server-Timing header value (durations in ms)"""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={(self.total() if total is None else total) * 1000:.1f}")
+        return ", ".join(parts)
+
+    def log_summary(self, total=None):
+        total = self.total() if total is None else total
+        stages = " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.stages.items())
+        return f"total={total * 1000:.1f}ms {stages}".rstrip()
+
+
+def current_timer():
+    """Return the StageTimer of the request being served, if any"""
+    return _current_timer.get()
+
+
+@contextmanager
+def timed_stage(name):
+    """Time a block into the current request's timer (no-op when none is active)"""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def timed(name):
+    """Decorator recording each call of the wrapped function as stage `name`"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            timer = _current_timer.get()
+            if timer is None:
+                return func(*args, **kwargs)
+            with timer.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing(view_func):
+    """Time a view's stages, add a Server-Timing header and log to faceapp.performance"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        timer = StageTimer()
+        token = _current_timer.set(timer)
+        request.stage_timer = timer
+        try:
+            response = view_func(request, *args, **kwargs)
+        finally:
+            _current_timer.reset(token)
+
+        total = timer.total()
+        response['Server-Timing'] = timer.header_value(total)
+        user = getattr(request, 'user', None)
+        username = user.username if user is not None and user.is_authenticated else 'anonymous'
+        performance_logger.info(
+            f"{view_func.__name__} {request.method} {response.status_code} "
+            f"user={username} {timer.log_summary(total)}"
+        )
+        return response
+    return wrapper
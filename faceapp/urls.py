@@ -11,6 +11,7 @@ from .views import (
     get_all_students,
     get_teacher_students,
     delete_student,
+    student_image,
     # Attendance views
     take_attendance_with_session,
     detect_faces,
@@ -28,12 +29,25 @@ from .views import (
     advanced_analytics,
     advanced_analytics_data,
     dashboard_data,
+    dashboard_summary,
+    attendance_records,
+    session_details,
+    analytics_changes,
     mark_onboarding_complete,
     export_data,
     generate_export_file,
+    incremental_export,
+    reset_export_consumer,
     test_onboarding,
     # AI views
     ai_assistant,
+    # Metrics
+    metrics_view,
+    # Jobs
+    job_status,
+    job_download,
+    # Live events
+    attendance_events,
 )
 
 
@@ -49,6 +63,7 @@ urlpatterns = [
     path('get_all_students/', get_all_students, name='get_all_students'),
     path('get_teacher_students/', get_teacher_students, name='get_teacher_students'),
     path('delete_student/<int:student_id>/', delete_student, name='delete_student'),
+    path('student_image/<str:content_hash>/<str:variant>/', student_image, name='student_image'),
     
     # Attendance URLs
     path('take_attendance/', take_attendance_with_session, name='take_attendance'),
@@ -67,13 +82,29 @@ urlpatterns = [
     # Dashboard & Analytics URLs
     path('dashboard/', dashboard, name='dashboard'),
     path('dashboard_data/', dashboard_data, name='dashboard_data'),
+    path('dashboard_summary/', dashboard_summary, name='dashboard_summary'),
+    path('attendance_records/', attendance_records, name='attendance_records'),
+    path('session_details/', session_details, name='session_details'),
     path('records/', view_records, name='records'),
     path('advanced_analytics/', advanced_analytics, name='advanced_analytics'),
     path('advanced_analytics_data/', advanced_analytics_data, name='advanced_analytics_data'),
+    path('analytics_changes/', analytics_changes, name='analytics_changes'),
     path('export_data/', export_data, name='export_data'),
+    path('exports/<slug:consumer_name>/', incremental_export, name='incremental_export'),
+    path('exports/<slug:consumer_name>/reset/', reset_export_consumer, name='reset_export_consumer'),
     path('mark_onboarding_complete/', mark_onboarding_complete, name='mark_onboarding_complete'),
     path('test_onboarding/', test_onboarding, name='test_onboarding'),
     
     # AI Assistant URLs
     path('ai_assistant/', ai_assistant, name='ai_assistant'),
+    
+    # Background jobs
+    path('jobs/<int:job_id>/', job_status, name='job_status'),
+    path('jobs/<int:job_id>/download/', job_download, name='job_download'),
+    
+    # Live attendance feed (Server-Sent Events)
+    path('events/attendance/', attendance_events, name='attendance_events'),
+    
+    # Monitoring
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -13,6 +13,7 @@ from .student_views import (
     get_all_students,
     get_teacher_students,
     delete_student,
+    student_image,
 )
 
 from .attendance_views import (
@@ -30,6 +31,19 @@ from .class_views import (
     remove_student_from_class,
 )
 
+from .metrics_views import (
+    metrics_view,
+)
+
+from .job_views import (
+    job_status,
+    job_download,
+)
+
+from .event_views import (
+    attendance_events,
+)
+
 # Note: dashboard_views and ai_views imported here to avoid circular imports
 # Import dashboard views first (no deps)
 from . import dashboard_views
@@ -52,6 +66,7 @@ __all__ = [
     'get_all_students',
     'get_teacher_students',
     'delete_student',
+    'student_image',
     # Attendance
     'take_attendance_with_session',
     'detect_faces',
@@ -63,4 +78,11 @@ __all__ = [
     'get_teacher_classes',
     'assign_student_to_class',
     'remove_student_from_class',
+    # Metrics
+    'metrics_view',
+    # Jobs
+    'job_status',
+    'job_download',
+    # Live events
+    'attendance_events',
 ]
@@ -73,7 +73,8 @@ def format_attendance_data_for_ai(data: dict) -> str:
 def query_attendance_data_with_context(user_query: str, session_id: str, teacher=None) -> str:
     """Enhanced AI query with conversation context and FULL data access"""
     
-    data = get_complete_attendance_data(teacher)
+    with timed_stage('db_lookup'):
+        data = get_complete_attendance_data(teacher)
     
     if session_id not in conversation_contexts:
         conversation_contexts[session_id] = []
@@ -144,18 +145,26 @@ CRITICAL BOUNDARY RULE:
         messages = [{"role": "system", "content": system_prompt}]
         messages.extend(conversation_history[-6:])
         
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            temperature=0.1,
-            max_tokens=1000
-        )
+        completion_started = time.perf_counter()
+        try:
+            with timed_stage('ai_completion'):
+                response = client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    temperature=0.1,
+                    max_tokens=1000
+                )
+        except Exception:
+            metrics.ai_assistant_seconds.observe(time.perf_counter() - completion_started, outcome='error')
+            raise
+        metrics.ai_assistant_seconds.observe(time.perf_counter() - completion_started, outcome='ok')
         
         ai_response = response.choices[0].message.content
         conversation_history.append({"role": "assistant", "content": ai_response})
         conversation_contexts[session_id] = conversation_history
         
-        AIQuery.objects.create(query=user_query, response=ai_response)
+        with timed_stage('db_write'):
+            AIQuery.objects.create(query=user_query, response=ai_response)
         
         return ai_response
         
@@ -163,8 +172,10 @@ CRITICAL BOUNDARY RULE:
         return f"Sorry, I encountered an error: {str(e)}"
 
 
+@server_timing
 @login_required
 @csrf_exempt
+@read_from_replica
 def ai_assistant(request):
     """AI Assistant view"""
     if request.method == "POST":
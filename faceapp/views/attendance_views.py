@@ -2,15 +2,18 @@
 Attendance management views for taking and tracking attendance
 """
 from .common_imports import *
+from ..summaries import session_summary
 
 
+@server_timing
 @login_required
 @csrf_exempt
 def take_attendance_with_session(request):
     """Take attendance for a specific session using face recognition"""
     if request.method == "POST":
         try:
-            data = json.loads(request.body)
+            with timed_stage('parse'):
+                data = json.loads(request.body)
             image_data = data.get("image")
             session_id = data.get("session_id")
             
@@ -24,49 +27,32 @@ def take_attendance_with_session(request):
                 return JsonResponse({"error": "Face recognition service not configured"}, status=500)
 
             try:
-                session = AttendanceSession.objects.get(id=session_id, teacher=request.user)
+                with timed_stage('db_lookup'):
+                    session = AttendanceSession.objects.select_related('class_session').get(id=session_id, teacher=request.user)
             except AttendanceSession.DoesNotExist:
                 return JsonResponse({"error": "Session not found or you do not have permission"}, status=400)
 
             # Decode image
-            img_str = re.sub("^data:image/.+;base64,", "", image_data)
-            img_bytes = base64.b64decode(img_str)
+            img_bytes = decode_base64_image(image_data)
 
             # Search for face in AWS Rekognition
-            print("Searching for face in AWS Rekognition collection...")
+            logger.info(f"Searching face collection for session {session.id}")
             matched_student_id, similarity = search_face_rekognition(img_bytes, threshold=80)
             
             if not matched_student_id:
-                print("Trying with lower threshold (70%)...")
+                logger.info("No match at 80%, retrying with 70% threshold")
                 matched_student_id, similarity = search_face_rekognition(img_bytes, threshold=70)
             
             # Detect faces for visualization
-            nparr = np.frombuffer(img_bytes, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
-            pil_image = Image.fromarray(rgb_frame)
-            img_byte_arr = io.BytesIO()
-            pil_image.save(img_byte_arr, format='JPEG')
-            img_byte_arr.seek(0)
-            detect_bytes = img_byte_arr.read()
-            
+            rgb_frame, detect_bytes = prepare_detection_frame(img_bytes)
             detected_faces = detect_faces_rekognition(detect_bytes)
             
             # Convert to frontend format
             height, width = rgb_frame.shape[:2]
-            faces_for_js = []
-            for face in detected_faces:
-                faces_for_js.append({
-                    "top": int(face['top'] * height),
-                    "right": int((face['left'] + face['width']) * width),
-                    "bottom": int((face['top'] + face['height']) * height),
-                    "left": int(face['left'] * width)
-                })
+            faces_for_js = scale_faces_to_frame(detected_faces, height, width)
             
             if not matched_student_id:
-                print(f"\n❌ NO MATCH FOUND")
-                print(f"Best similarity: {similarity:.2f}%")
+                logger.info(f"No match found for session {session.id} (best similarity {similarity:.2f}%)")
                 return JsonResponse({
                     "message": f"No match found - Face not recognized\nBest similarity: {similarity:.1f}%\nThreshold: 70%",
                     "faces": faces_for_js,
@@ -79,41 +65,47 @@ def take_attendance_with_session(request):
 
             # Find student by student_id
             try:
-                best_match = Student.objects.get(student_id=matched_student_id, is_active=True)
+                with timed_stage('db_lookup'):
+                    best_match = Student.objects.get(student_id=matched_student_id, is_active=True)
             except Student.DoesNotExist:
-                print(f"❌ Student with ID {matched_student_id} not found in database")
+                logger.warning(f"Student with ID {matched_student_id} not found in database")
                 return JsonResponse({
                     "message": "Student record not found in database",
                     "faces": faces_for_js
                 })
             
             # Check if student is in this class
-            if not session.class_session.students.filter(id=best_match.id).exists():
+            with timed_stage('db_lookup'):
+                is_enrolled = session.class_session.students.filter(id=best_match.id).exists()
+            if not is_enrolled:
                 return JsonResponse({
                     "message": f"{best_match.name} is not enrolled in {session.class_session.name}",
                     "faces": faces_for_js
                 })
             
-            print(f"\n✅ MATCH FOUND: {best_match.name} ({similarity:.2f}%)")
+            logger.info(f"Match found: {best_match.name} ({similarity:.2f}%) for session {session.id}")
             
             # Process attendance
             current_time = datetime.now()
             
-            existing_record = AttendanceRecord.objects.filter(
-                student=best_match,
-                session=session
-            ).first()
+            with timed_stage('db_lookup'):
+                existing_record = AttendanceRecord.objects.filter(
+                    student=best_match,
+                    session=session
+                ).first()
             
             if not existing_record:
                 arrival_time = current_time.time()
                 is_late = arrival_time > session.start_time
                 
-                AttendanceRecord.objects.create(
-                    student=best_match,
-                    session=session,
-                    arrival_time=arrival_time,
-                    is_late=is_late
-                )
+                with timed_stage('db_write'), transaction.atomic():
+                    # Summary tables are refreshed by signals inside this transaction
+                    AttendanceRecord.objects.create(
+                        student=best_match,
+                        session=session,
+                        arrival_time=arrival_time,
+                        is_late=is_late
+                    )
                 
                 time_str = arrival_time.strftime("%H:%M:%S")
                 status = f" (Late - {time_str})" if is_late else f" (On time - {time_str})"
@@ -123,28 +115,30 @@ def take_attendance_with_session(request):
                 original_time = existing_record.arrival_time.strftime("%H:%M:%S")
                 message = f"{best_match.name} (Already marked at {original_time})"
             
-            total_attendance = AttendanceRecord.objects.filter(session=session).count()
-            total_students = session.class_session.students.filter(is_active=True).count()
+            with timed_stage('db_lookup'):
+                summary = session_summary(session.id)
+                total_attendance = summary.present
+                total_students = summary.eligible
 
-            return JsonResponse({
-                "message": message,
-                "faces": faces_for_js,
-                "attendance_count": total_attendance,
-                "total_students": total_students,
-                "session_name": session.name,
-                "class_name": session.class_session.name,
-                "confidence": float(similarity)
-            })
+            with timed_stage('serialize'):
+                return JsonResponse({
+                    "message": message,
+                    "faces": faces_for_js,
+                    "attendance_count": total_attendance,
+                    "total_students": total_students,
+                    "session_name": session.name,
+                    "class_name": session.class_session.name,
+                    "confidence": float(similarity)
+                })
 
         except Exception as e:
-            print(f"❌ ATTENDANCE ERROR: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Attendance error: {e}")
             return JsonResponse({"error": str(e)}, status=400)
             
     return JsonResponse({"message": "Use POST request."})
 
 
+@server_timing
 @csrf_exempt
 def detect_faces(request):
     """Detect faces in an image for visualization"""
@@ -155,23 +149,15 @@ def detect_faces(request):
             if not image_data:
                 return JsonResponse({"faces": []})
 
-            img_str = re.sub("^data:image/.+;base64,", "", image_data)
-            img_bytes = base64.b64decode(img_str)
+            img_bytes = decode_base64_image(image_data)
 
             detected_faces = detect_faces_rekognition(img_bytes)
             
-            nparr = np.frombuffer(img_bytes, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            with timed_stage('decode'):
+                nparr = np.frombuffer(img_bytes, np.uint8)
+                frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
             height, width = frame.shape[:2]
-            
-            faces_list = []
-            for face in detected_faces:
-                faces_list.append({
-                    "top": int(face['top'] * height),
-                    "right": int((face['left'] + face['width']) * width),
-                    "bottom": int((face['top'] + face['height']) * height),
-                    "left": int(face['left'] * width)
-                })
+            faces_list = scale_faces_to_frame(detected_faces, height, width)
 
             return JsonResponse({"faces": faces_list})
         except Exception as e:
@@ -237,7 +223,9 @@ def create_session(request):
     return JsonResponse({"error": "Use POST request"}, status=405)
 
 
+@server_timing
 @login_required
+@conditional_payload('sessions')
 @csrf_exempt
 def get_sessions(request):
     """Get sessions for the logged-in teacher"""
@@ -250,13 +238,13 @@ def get_sessions(request):
                 teacher=request.user,
                 date__gte=today,
                 date__lte=upcoming_date
-            ).order_by('date', 'start_time')
+            ).select_related('class_session', 'summary').order_by('date', 'start_time')
             
             session_data = []
             for session in sessions:
-                attendance_records = AttendanceRecord.objects.filter(session=session)
-                unique_attendees = attendance_records.values_list('student_id', flat=True).distinct().count()
-                total_students = session.class_session.students.filter(is_active=True).count()
+                summary = getattr(session, 'summary', None) or session_summary(session.id)
+                unique_attendees = summary.present
+                total_students = summary.eligible
                 
                 session_data.append({
                     'id': session.id,
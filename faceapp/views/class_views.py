@@ -60,16 +60,18 @@ def create_class(request):
 
 
 @login_required
+@conditional_payload('teacher_classes')
 def get_teacher_classes(request):
     """Get classes for the logged-in teacher"""
     try:
-        classes = Class.objects.filter(teacher=request.user, is_active=True)
+        # Both joins multiply rows, hence the distinct counts
+        classes = Class.objects.filter(teacher=request.user, is_active=True).annotate(
+            student_count=Count('students', filter=Q(students__is_active=True), distinct=True),
+            session_count=Count('sessions', distinct=True),
+        )
         classes_data = []
         
         for cls in classes:
-            student_count = cls.students.filter(is_active=True).count()
-            session_count = cls.sessions.count()
-            
             classes_data.append({
                 'id': cls.id,
                 'name': cls.name,
@@ -77,8 +79,8 @@ def get_teacher_classes(request):
                 'description': cls.description,
                 'academic_year': cls.academic_year,
                 'semester': cls.semester,
-                'student_count': student_count,
-                'session_count': session_count,
+                'student_count': cls.student_count,
+                'session_count': cls.session_count,
                 'created_at': cls.created_at.strftime('%Y-%m-%d')
             })
         
@@ -2,7 +2,7 @@ import base64
 import re
 import time
 import logging
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
@@ -10,7 +10,7 @@ from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
 from django.db import transaction
-from django.db.models import Count, Q
+from django.db.models import Count, Prefetch, Q, Sum
 from datetime import datetime, date, timedelta
 import os
 import json
@@ -47,18 +47,30 @@ cloudinary_config(
 )
 
 # Models
-from ..models import Student, AttendanceRecord, AttendanceSession, AIQuery, Teacher, Class
+from ..models import (
+    Student, AttendanceRecord, AttendanceSession, AIQuery, Teacher, Class,
+    StudentClassSummary, SessionSummary
+)
 
 # Set up loggers
 logger = logging.getLogger('faceapp')
 performance_logger = logging.getLogger('faceapp.performance')
 security_logger = logging.getLogger('faceapp.security')
 
+# Request timing and metrics
+from ..timing import server_timing, timed_stage
+from ..payload_cache import conditional_payload
+from ..db_router import read_from_replica
+from .. import metrics
+
 # Face recognition utilities
 from .face_recognition_utils import (
     AWS_CONFIGURED,
     detect_faces_rekognition,
     index_face_rekognition,
     search_face_rekognition,
-    delete_face_rekognition
+    delete_face_rekognition,
+    decode_base64_image,
+    prepare_detection_frame,
+    scale_faces_to_frame
 )
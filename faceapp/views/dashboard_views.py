@@ -2,100 +2,90 @@
 Dashboard views for analytics, reporting, and data visualization
 """
 from .common_imports import *
+from ..analytics import compute_analytics
+from ..archive import archived_records
+from ..bulk_export import ARROW_CONTENT_TYPE, PARQUET_CONTENT_TYPE, queryset_batches, stream_export, write_stream
+from ..changelog import changes_since, latest_cursor
+from .. import incremental
+from ..columnar import COLUMNAR_MEDIA_TYPE, columnar_attendance_data, encode_compact, wants_columnar
+from ..jobs import enqueue
+from ..payload_cache import cached_json
+from ..reports import DOCX_CONTENT_TYPE, XLSX_CONTENT_TYPE, export_row_count, write_docx, write_xlsx
 import csv
-from io import StringIO
+import tempfile
+from django.db import router
+from django.http import FileResponse
+
+EXPORT_EXTENSIONS = {'csv': 'csv', 'excel': 'xlsx', 'word': 'docx', 'parquet': 'parquet', 'arrow': 'arrows'}
 
 
 def get_complete_attendance_data(teacher=None):
-    """Get COMPLETE attendance data for dashboard and analytics"""
+    """
+    Get COMPLETE attendance data for dashboard and analytics.
+    Students and records are listed in id order and sessions newest first (ties by id);
+    the name lists of each session detail follow the same record and student order.
+    """
     
+    all_students = listed_students(teacher)
     if teacher:
-        all_students = list(Student.objects.filter(is_active=True, classes__teacher=teacher).distinct().values('id', 'name', 'student_id', 'email'))
-        all_sessions = list(AttendanceSession.objects.filter(teacher=teacher).order_by('-date', '-start_time').values(
+        all_sessions = list(AttendanceSession.objects.filter(teacher=teacher).order_by('-date', '-start_time', '-id').values(
             'id', 'name', 'date', 'start_time', 'end_time', 'class_session__name'
         ))
     else:
-        all_students = list(Student.objects.filter(is_active=True).values('id', 'name', 'student_id', 'email'))
-        all_sessions = list(AttendanceSession.objects.all().order_by('-date', '-start_time').values(
+        all_sessions = list(AttendanceSession.objects.all().order_by('-date', '-start_time', '-id').values(
             'id', 'name', 'date', 'start_time', 'end_time', 'class_session__name'
         ))
     
     for session in all_sessions:
-        session['date'] = session['date'].strftime('%Y-%m-%d')
-        session['start_time'] = session['start_time'].strftime('%H:%M:%S')
-        if session['end_time']:
-            session['end_time'] = session['end_time'].strftime('%H:%M:%S')
+        _format_session(session)
     
     if teacher:
-        all_records = list(AttendanceRecord.objects.filter(session__teacher=teacher).select_related('student', 'session').values(
+        all_records = list(AttendanceRecord.objects.filter(teacher=teacher).order_by('id').values(
             'student__name', 'student_id', 'session__name', 'session_id', 
-            'date', 'time', 'arrival_time', 'is_late', 'timestamp'
+            'date', 'time', 'arrival_time', 'is_late', 'timestamp', 'id'
         ))
     else:
-        all_records = list(AttendanceRecord.objects.select_related('student', 'session').values(
+        all_records = list(AttendanceRecord.objects.order_by('id').values(
             'student__name', 'student_id', 'session__name', 'session_id', 
-            'date', 'time', 'arrival_time', 'is_late', 'timestamp'
+            'date', 'time', 'arrival_time', 'is_late', 'timestamp', 'id'
         ))
     
     for record in all_records:
-        record['date'] = record['date'].strftime('%Y-%m-%d')
-        record['time'] = record['time'].strftime('%H:%M:%S')
-        record['timestamp'] = record['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
-        if record['arrival_time']:
-            record['arrival_time'] = record['arrival_time'].strftime('%H:%M:%S')
+        _format_record(record)
     
-    student_stats = {}
-    for student in all_students:
-        student_records = [r for r in all_records if r['student_id'] == student['id']]
-        sessions_attended = len(set(r['session_id'] for r in student_records))
-        times_late = len([r for r in student_records if r['is_late']])
-        times_on_time = len([r for r in student_records if not r['is_late']])
-        
-        student_session_ids = set(r['session_id'] for r in student_records)
-        
-        if teacher:
-            current_available_sessions = AttendanceSession.objects.filter(
-                teacher=teacher,
-                class_session__students__id=student['id']
-            ).values_list('id', flat=True)
-        else:
-            current_available_sessions = AttendanceSession.objects.filter(
-                class_session__students__id=student['id']
-            ).values_list('id', flat=True)
-        
-        available_session_count = max(len(student_session_ids), len(list(current_available_sessions)))
-        
-        if available_session_count > 0:
-            attendance_percentage = min(round((sessions_attended / available_session_count) * 100, 1), 100.0)
-        else:
-            attendance_percentage = 0
-        
-        student_stats[student['name']] = {
-            'total_sessions_attended': sessions_attended,
-            'available_sessions': available_session_count,
-            'times_late': times_late,
-            'times_on_time': times_on_time,
-            'attendance_percentage': attendance_percentage
-        }
+    student_stats = get_student_statistics(teacher, all_students)
+
+    # Active class membership, for the eligible students of each session
+    sessions = AttendanceSession.objects.filter(teacher=teacher) if teacher else AttendanceSession.objects.all()
+    class_student_names = {}
+    memberships = Student.classes.through.objects.filter(
+        class_id__in=sessions.values('class_session_id'), student__is_active=True
+    ).order_by('student_id').values_list('class_id', 'student__name')
+    for class_id, student_name in memberships:
+        class_student_names.setdefault(class_id, []).append(student_name)
+
+    records_by_session = {}
+    for record in all_records:
+        records_by_session.setdefault(record['session_id'], []).append(record)
+    session_class_ids = dict(sessions.values_list('id', 'class_session_id'))
+    all_student_names = [s['name'] for s in all_students]
     
     session_details = {}
     for session in all_sessions:
         session_key = f"{session['name']}_{session['date']}"
-        session_records = [r for r in all_records if r['session_id'] == session['id']]
+        session_records = records_by_session.get(session['id'], [])
         present_students = [r['student__name'] for r in session_records]
         
         if teacher:
-            eligible_students = list(Student.objects.filter(
-                classes__sessions__id=session['id'], 
-                is_active=True
-            ).values_list('name', flat=True))
+            eligible_students = class_student_names.get(session_class_ids.get(session['id']), [])
         else:
-            eligible_students = [s['name'] for s in all_students]
+            eligible_students = all_student_names
         
         if not eligible_students:
             eligible_students = present_students
         
-        absent_students = [name for name in eligible_students if name not in present_students]
+        present_set = set(present_students)
+        absent_students = [name for name in eligible_students if name not in present_set]
         
         session_details[session_key] = {
             'session_info': session,
@@ -108,7 +98,7 @@ def get_complete_attendance_data(teacher=None):
             'on_time_students': [r['student__name'] for r in session_records if not r['is_late']]
         }
     
-    sessions_list = list(set(session['name'] for session in all_sessions))
+    sessions_list = sorted(set(session['name'] for session in all_sessions))
     unique_dates = sorted(list(set(session['date'] for session in all_sessions)))
     
     return {
@@ -125,6 +115,221 @@ def get_complete_attendance_data(teacher=None):
     }
 
 
+def listed_students(teacher=None):
+    """Active students in the teacher's classes (all active students when None)"""
+    students = Student.objects.filter(is_active=True)
+    if teacher:
+        students = students.filter(classes__teacher=teacher).distinct()
+    return list(students.order_by('id').values('id', 'name', 'student_id', 'email'))
+
+
+def get_student_statistics(teacher, students, filters=None):
+    """Attendance statistics keyed by student name, optionally limited to a date range / class"""
+    if filters:
+        return _windowed_student_statistics(teacher, students, filters)
+
+    # Per-student totals from the materialized per-class summaries
+    summaries = StudentClassSummary.objects.filter(class_session__teacher=teacher) if teacher else StudentClassSummary.objects.all()
+    summary_totals = {
+        row['student_id']: row
+        for row in summaries.values('student_id').annotate(
+            attended=Sum('attended'),
+            late=Sum('late'),
+            on_time=Sum('on_time'),
+            eligible=Sum('eligible_sessions'),
+        )
+    }
+    # Legacy records without a session or class are not summarized
+    records = AttendanceRecord.objects.filter(teacher=teacher) if teacher else AttendanceRecord.objects.all()
+    unsummarized_counts = {
+        row['student_id']: row
+        for row in records.filter(class_session__isnull=True).values('student_id').annotate(
+            sessions=Count('session_id', distinct=True),
+            no_session=Count('id', filter=Q(session__isnull=True)),
+            late=Count('id', filter=Q(is_late=True)),
+            total=Count('id'),
+        )
+    }
+
+    student_stats = {}
+    for student in students:
+        totals = summary_totals.get(student['id'], {})
+        extra = unsummarized_counts.get(student['id'], {})
+        # Records without a session count as one extra attended "session"
+        sessions_attended = (totals.get('attended') or 0) + extra.get('sessions', 0) + (1 if extra.get('no_session') else 0)
+        times_late = (totals.get('late') or 0) + extra.get('late', 0)
+        times_on_time = (totals.get('on_time') or 0) + extra.get('total', 0) - extra.get('late', 0)
+        
+        available_session_count = max(sessions_attended, totals.get('eligible') or 0)
+        
+        if available_session_count > 0:
+            attendance_percentage = min(round((sessions_attended / available_session_count) * 100, 1), 100.0)
+        else:
+            attendance_percentage = 0
+        
+        student_stats[student['name']] = {
+            'total_sessions_attended': sessions_attended,
+            'available_sessions': available_session_count,
+            'times_late': times_late,
+            'times_on_time': times_on_time,
+            'attendance_percentage': attendance_percentage
+        }
+    
+    return student_stats
+
+
+def _windowed_student_statistics(teacher, students, filters):
+    # The summary tables are all-time, so windows aggregate the matching records
+    records = scoped_records(teacher, filters)
+    record_counts = {
+        row['student_id']: row
+        for row in records.filter(session__isnull=False).values('student_id').annotate(
+            sessions=Count('session_id', distinct=True),
+            late=Count('id', filter=Q(is_late=True)),
+            total=Count('id'),
+        )
+    }
+    class_session_counts = dict(
+        scoped_sessions(teacher, filters).filter(class_session__isnull=False)
+        .values('class_session_id').annotate(count=Count('id')).values_list('class_session_id', 'count')
+    )
+    available_by_student = {}
+    memberships = Student.classes.through.objects.filter(class_id__in=list(class_session_counts))
+    for student_id, class_id in memberships.values_list('student_id', 'class_id'):
+        available_by_student[student_id] = available_by_student.get(student_id, 0) + class_session_counts[class_id]
+
+    student_stats = {}
+    for student in students:
+        counts = record_counts.get(student['id'], {})
+        sessions_attended = counts.get('sessions', 0)
+        times_late = counts.get('late', 0)
+        available_session_count = max(sessions_attended, available_by_student.get(student['id'], 0))
+        student_stats[student['name']] = {
+            'total_sessions_attended': sessions_attended,
+            'available_sessions': available_session_count,
+            'times_late': times_late,
+            'times_on_time': counts.get('total', 0) - times_late,
+            'attendance_percentage': (
+                min(round((sessions_attended / available_session_count) * 100, 1), 100.0)
+                if available_session_count > 0 else 0
+            )
+        }
+    return student_stats
+
+
+def parse_dashboard_filters(params):
+    """date_from / date_to (YYYY-MM-DD) and class_id query parameters; raises ValueError"""
+    filters = {}
+    for name in ('date_from', 'date_to'):
+        if params.get(name):
+            filters[name] = datetime.strptime(params[name], '%Y-%m-%d').date()
+    if params.get('class_id'):
+        filters['class_id'] = int(params['class_id'])
+    return filters
+
+
+def filters_key(filters):
+    """Cache key part for parsed filters, independent of parameter order and unrelated parameters"""
+    return '&'.join(f"{name}={value}" for name, value in sorted(filters.items()))
+
+
+def scoped_sessions(teacher, filters):
+    sessions = AttendanceSession.objects.filter(teacher=teacher) if teacher else AttendanceSession.objects.all()
+    if 'date_from' in filters:
+        sessions = sessions.filter(date__gte=filters['date_from'])
+    if 'date_to' in filters:
+        sessions = sessions.filter(date__lte=filters['date_to'])
+    if 'class_id' in filters:
+        sessions = sessions.filter(class_session_id=filters['class_id'])
+    return sessions
+
+
+def scoped_records(teacher, filters):
+    records = AttendanceRecord.objects.filter(teacher=teacher) if teacher else AttendanceRecord.objects.all()
+    if 'date_from' in filters:
+        records = records.filter(session_date__gte=filters['date_from'])
+    if 'date_to' in filters:
+        records = records.filter(session_date__lte=filters['date_to'])
+    if 'class_id' in filters:
+        records = records.filter(class_session_id=filters['class_id'])
+    return records
+
+
+def _page_size(params, default, maximum):
+    return max(1, min(int(params.get('limit', default)), maximum))
+
+
+def _format_session(session):
+    session['date'] = session['date'].strftime('%Y-%m-%d')
+    session['start_time'] = session['start_time'].strftime('%H:%M:%S')
+    if session['end_time']:
+        session['end_time'] = session['end_time'].strftime('%H:%M:%S')
+    return session
+
+
+def _format_record(record):
+    record['date'] = record['date'].strftime('%Y-%m-%d')
+    record['time'] = record['time'].strftime('%H:%M:%S')
+    record['timestamp'] = record['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+    if record['arrival_time']:
+        record['arrival_time'] = record['arrival_time'].strftime('%H:%M:%S')
+    return record
+
+
+def get_attendance_summary(user, filters):
+    """Counts-only dashboard payload: O(students + sessions), no per-record data"""
+    teacher = None if user.is_admin else user
+    # One filter() call so both conditions apply to the same class membership
+    membership = {}
+    if teacher:
+        membership['classes__teacher'] = teacher
+    if 'class_id' in filters:
+        membership['classes__id'] = filters['class_id']
+    students = list(Student.objects.filter(is_active=True, **membership).distinct().values('id', 'name', 'student_id', 'email'))
+
+    sessions = [
+        _format_session(session) for session in scoped_sessions(teacher, filters).order_by('-date', '-start_time').values(
+            'id', 'name', 'date', 'start_time', 'end_time', 'class_session_id', 'class_session__name',
+            'summary__present', 'summary__late', 'summary__eligible'
+        )
+    ]
+    for session in sessions:
+        present = session.pop('summary__present') or 0
+        eligible = session.pop('summary__eligible') or 0
+        session['present_count'] = present
+        session['late_count'] = session.pop('summary__late') or 0
+        session['eligible_count'] = max(eligible, present)
+        session['absent_count'] = max(eligible - present, 0)
+
+    records = scoped_records(teacher, filters)
+    totals = records.aggregate(total=Count('id'), late=Count('id', filter=Q(is_late=True)))
+    daily_counts = {
+        row['date'].strftime('%Y-%m-%d'): row['count']
+        for row in records.values('date').annotate(count=Count('id')).order_by('date')
+    }
+
+    return {
+        'filters': {name: str(value) for name, value in filters.items()},
+        'today_date': date.today().strftime('%Y-%m-%d'),
+        'total_students': len(students),
+        'total_sessions': len(sessions),
+        'total_records': totals['total'],
+        'late_totals': {'on_time': totals['total'] - totals['late'], 'late': totals['late']},
+        'late_percentage': round(totals['late'] / totals['total'] * 100, 2) if totals['total'] else 0,
+        'daily_counts': daily_counts,
+        'student_statistics': get_student_statistics(teacher, students, filters),
+        'sessions': sessions,
+        'sessions_list': sorted(set(session['name'] for session in sessions)),
+        'unique_dates': sorted(set(session['date'] for session in sessions)),
+        'teacher_info': {
+            'name': user.get_full_name(),
+            'username': user.username,
+            'department': user.department,
+            'is_admin': user.is_admin
+        }
+    }
+
+
 @login_required
 def dashboard(request):
     """Render the main dashboard page"""
@@ -137,36 +342,51 @@ def dashboard(request):
     return render(request, 'dashboard.html', context)
 
 
+@server_timing
 @login_required
 @require_http_methods(["GET"])
+@conditional_payload('dashboard_data', columnar=True)
+@read_from_replica
 def dashboard_data(request):
-    """API endpoint for dashboard data"""
+    """API endpoint for dashboard data (?format=columnar for the columnar encoding)"""
     try:
-        teacher = None if request.user.is_admin else request.user
-        data = get_complete_attendance_data(teacher)
-        
-        data['analytics'] = {
-            'total_records': len(data['all_attendance_records']),
-            'late_percentage': 0
-        }
-        
-        if data['all_attendance_records']:
-            late_records = [r for r in data['all_attendance_records'] if r['is_late']]
-            data['analytics']['late_percentage'] = round((len(late_records) / len(data['all_attendance_records'])) * 100, 2)
-        
-        data['teacher_info'] = {
-            'name': request.user.get_full_name(),
-            'username': request.user.username,
-            'department': request.user.department,
-            'is_admin': request.user.is_admin
-        }
-        
-        return JsonResponse(data)
+        with timed_stage('cache'):
+            if wants_columnar(request):
+                body = cached_json('dashboard_data:columnar', request.user,
+                                   lambda: columnar_attendance_data(build_dashboard_payload(request.user)),
+                                   encode=encode_compact)
+                return HttpResponse(body, content_type=COLUMNAR_MEDIA_TYPE)
+            body = cached_json('dashboard_data', request.user, lambda: build_dashboard_payload(request.user))
+        return HttpResponse(body, content_type='application/json')
         
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
 
 
+def build_dashboard_payload(user):
+    """Full dashboard payload for `user` (admins see every teacher's data)"""
+    teacher = None if user.is_admin else user
+    with timed_stage('db_lookup'):
+        data = get_complete_attendance_data(teacher)
+    
+    data['analytics'] = {
+        'total_records': len(data['all_attendance_records']),
+        'late_percentage': 0
+    }
+    
+    if data['all_attendance_records']:
+        late_records = [r for r in data['all_attendance_records'] if r['is_late']]
+        data['analytics']['late_percentage'] = round((len(late_records) / len(data['all_attendance_records'])) * 100, 2)
+    
+    data['teacher_info'] = {
+        'name': user.get_full_name(),
+        'username': user.username,
+        'department': user.department,
+        'is_admin': user.is_admin
+    }
+    return data
+
+
 @login_required
 @csrf_exempt
 def mark_onboarding_complete(request):
@@ -193,26 +413,239 @@ def advanced_analytics(request):
     return render(request, 'advanced_analytics.html')
 
 
+@server_timing
 @login_required
+@conditional_payload('advanced_analytics_data', vary_on_query=True)
+@read_from_replica
 def advanced_analytics_data(request):
-    """API endpoint for advanced analytics"""
+    """
+    API endpoint for advanced analytics: the server-side analytics series, not the raw records
+    (page through /attendance_records/ for those).
+    ?date_from= / ?date_to= limit the analytics series to a window, archived terms included.
+    """
     try:
-        teacher = None if request.user.is_admin else request.user
-        base_data = get_complete_attendance_data(teacher)
+        filters = parse_dashboard_filters(request.GET)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date (YYYY-MM-DD)'}, status=400)
+    filters.pop('class_id', None)
+    try:
+        with timed_stage('cache'):
+            body = cached_json(f"advanced_analytics_data:{filters_key(filters)}", request.user,
+                               lambda: build_analytics_payload(request.user, filters))
+        return HttpResponse(body, content_type='application/json')
         
-        enhanced_data = {
-            **base_data,
-            'analytics_ready': True
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+def build_analytics_payload(user, filters=None):
+    """Advanced analytics payload for `user`, with the analytics series limited to the date filters"""
+    teacher = None if user.is_admin else user
+    filters = filters or {}
+    with timed_stage('db_lookup'):
+        # Read the cursor first: changes committed while building are re-sent, never skipped
+        change_cursor = latest_cursor()
+        classes = sorted(set(scoped_sessions(teacher, {}).filter(class_session__isnull=False).values_list(
+            'class_session__name', flat=True)))
+    with timed_stage('analytics'):
+        analytics = compute_analytics(teacher, filters.get('date_from'), filters.get('date_to'))
+    
+    return {
+        'today_date': date.today().strftime('%Y-%m-%d'),
+        'classes': classes,
+        'analytics': analytics,
+        'analytics_filters': {name: str(value) for name, value in filters.items()},
+        'change_cursor': change_cursor,
+        'analytics_ready': True
+    }
+
+
+@server_timing
+@login_required
+@require_http_methods(["GET"])
+@read_from_replica
+def analytics_changes(request):
+    """Delta of the analytics data since ?cursor=: changed rows, tombstones and refreshed aggregates"""
+    try:
+        cursor = int(request.GET.get('cursor', '0'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    limit = _page_size(request.GET, 500, 2000)
+    teacher = None if request.user.is_admin else request.user
+
+    try:
+        with timed_stage('db_lookup'):
+            changes = changes_since(teacher, cursor, limit)
+        payload = {
+            'cursor': changes['cursor'],
+            'has_more': changes['has_more'],
+            'reset': changes['reset'],
+            'records': [_format_record(record) for record in changes['records'].values()],
+            'sessions': [_format_session(session) for session in changes['sessions'].values()],
+            'deleted': changes['deleted'],
+            'enrollments': changes['enrollments'],
         }
-        
-        return JsonResponse(enhanced_data)
-        
+        if changes['cursor'] != cursor and not changes['reset']:
+            # Aggregates are O(students + sessions); recomputing beats patching them client-side
+            with timed_stage('analytics'):
+                students = listed_students(teacher)
+                payload['all_students'] = students
+                payload['student_statistics'] = get_student_statistics(teacher, students)
+                payload['analytics'] = compute_analytics(teacher)
+        return JsonResponse(payload)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+@server_timing
+@login_required
+@require_http_methods(["GET"])
+@conditional_payload('dashboard_summary', vary_on_query=True)
+@read_from_replica
+def dashboard_summary(request):
+    """Summary section of the dashboard: totals, per-student statistics and per-session counts"""
+    try:
+        filters = parse_dashboard_filters(request.GET)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date (YYYY-MM-DD) or class_id'}, status=400)
+    try:
+        with timed_stage('cache'):
+            body = cached_json(f"dashboard_summary:{filters_key(filters)}", request.user,
+                               lambda: get_attendance_summary(request.user, filters))
+        return HttpResponse(body, content_type='application/json')
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+@server_timing
+@login_required
+@require_http_methods(["GET"])
+@conditional_payload('attendance_records', vary_on_query=True)
+@read_from_replica
+def attendance_records(request):
+    """One page of attendance records, newest first; pass next_cursor back as ?cursor= for the next page"""
+    try:
+        filters = parse_dashboard_filters(request.GET)
+        limit = _page_size(request.GET, 100, 500)
+        cursor = int(request.GET['cursor']) if request.GET.get('cursor') else None
+        session_id = int(request.GET['session_id']) if request.GET.get('session_id') else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date, class_id, session_id, cursor or limit'}, status=400)
+
+    try:
+        teacher = None if request.user.is_admin else request.user
+        records = scoped_records(teacher, filters)
+        if session_id is not None:
+            records = records.filter(session_id=session_id)
+        if cursor is not None:
+            records = records.filter(id__lt=cursor)
+        with timed_stage('db_lookup'):
+            page = list(records.order_by('-id').values(
+                'id', 'student__name', 'student_id', 'session__name', 'session_id',
+                'session__class_session__name', 'date', 'time', 'arrival_time', 'is_late', 'timestamp'
+            )[:limit + 1])
+        has_more = len(page) > limit
+        page = [_format_record(record) for record in page[:limit]]
+        return JsonResponse({
+            'records': page,
+            'count': len(page),
+            'has_more': has_more,
+            'next_cursor': str(page[-1]['id']) if has_more else None,
+        })
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+@server_timing
+@login_required
+@require_http_methods(["GET"])
+@conditional_payload('session_details', vary_on_query=True)
+@read_from_replica
+def session_details(request):
+    """Present/absent/late lists for one session (?session_id=) or a page of sessions, newest first"""
+    try:
+        filters = parse_dashboard_filters(request.GET)
+        limit = _page_size(request.GET, 20, 100)
+        session_id = int(request.GET['session_id']) if request.GET.get('session_id') else None
+        cursor = None
+        if request.GET.get('cursor'):
+            # Keyset cursor over (date, start_time, id): "YYYY-MM-DD|HH:MM:SS|id"
+            cursor_date, cursor_time, cursor_id = request.GET['cursor'].split('|')
+            cursor = (datetime.strptime(cursor_date, '%Y-%m-%d').date(),
+                      datetime.strptime(cursor_time, '%H:%M:%S').time(), int(cursor_id))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date, class_id, session_id, cursor or limit'}, status=400)
+
+    try:
+        teacher = None if request.user.is_admin else request.user
+        sessions = scoped_sessions(teacher, filters)
+        if session_id is not None:
+            sessions = sessions.filter(id=session_id)
+        if cursor is not None:
+            sessions = sessions.filter(
+                Q(date__lt=cursor[0]) |
+                Q(date=cursor[0], start_time__lt=cursor[1]) |
+                Q(date=cursor[0], start_time=cursor[1], id__lt=cursor[2])
+            )
+        with timed_stage('db_lookup'):
+            page = list(sessions.order_by('-date', '-start_time', '-id').values(
+                'id', 'name', 'date', 'start_time', 'end_time', 'class_session_id', 'class_session__name'
+            )[:limit + 1])
+            has_more = len(page) > limit
+            page = page[:limit]
+            next_cursor = None
+            if has_more:
+                last = page[-1]
+                next_cursor = f"{last['date']:%Y-%m-%d}|{last['start_time']:%H:%M:%S}|{last['id']}"
+
+            records_by_session = {}
+            for record in AttendanceRecord.objects.filter(session_id__in=[s['id'] for s in page]).order_by('id').values(
+                'session_id', 'student__name', 'is_late', 'arrival_time', 'time'
+            ):
+                records_by_session.setdefault(record['session_id'], []).append(record)
+
+            class_student_names = {}
+            memberships = Student.classes.through.objects.filter(
+                class_id__in={s['class_session_id'] for s in page}, student__is_active=True
+            ).order_by('student_id').values_list('class_id', 'student__name')
+            for class_id, student_name in memberships:
+                class_student_names.setdefault(class_id, []).append(student_name)
+
+        details = []
+        for session in page:
+            session_records = records_by_session.get(session['id'], [])
+            present_students = [r['student__name'] for r in session_records]
+            eligible_students = class_student_names.get(session['class_session_id']) or present_students
+            present_set = set(present_students)
+            absent_students = [name for name in eligible_students if name not in present_set]
+            details.append({
+                'session_info': _format_session(session),
+                'attendees': [
+                    {
+                        'name': r['student__name'],
+                        'is_late': r['is_late'],
+                        'time': (r['arrival_time'] or r['time']).strftime('%H:%M:%S'),
+                    }
+                    for r in session_records
+                ],
+                'present_students': present_students,
+                'absent_students': absent_students,
+                'present_count': len(present_students),
+                'absent_count': len(absent_students),
+                'eligible_count': len(eligible_students),
+                'late_students': [r['student__name'] for r in session_records if r['is_late']],
+                'on_time_students': [r['student__name'] for r in session_records if not r['is_late']]
+            })
+
+        return JsonResponse({'sessions': details, 'has_more': has_more, 'next_cursor': next_cursor})
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
 
 
+@server_timing
 @login_required
 @csrf_exempt
+@read_from_replica
 def export_data(request):
     """Export attendance data in various formats"""
     if request.method == "POST":
@@ -224,6 +657,25 @@ def export_data(request):
             report_title = data.get("title", "Attendance Report")
 
             teacher = None if request.user.is_admin else request.user
+
+            # Large workbooks are built by a job so they do not hold the worker past its timeout
+            large = (export_type == "excel"
+                     and export_row_count(teacher, *parse_export_range(date_from, date_to)) > settings.EXPORT_SYNC_MAX_ROWS)
+            if data.get("async") or large:
+                job = enqueue('build_export', {
+                    'type': export_type,
+                    'extension': EXPORT_EXTENSIONS.get(export_type, export_type),
+                    'date_from': date_from,
+                    'date_to': date_to,
+                    'title': report_title,
+                    'teacher_id': teacher.id if teacher else None,
+                }, created_by=request.user)
+                return JsonResponse({
+                    'message': 'Export is being generated',
+                    'job_id': job.id,
+                    'status_url': f"/jobs/{job.id}/"
+                }, status=202)
+
             return generate_export_file(export_type, date_from, date_to, report_title, teacher)
 
         except Exception as e:
@@ -232,38 +684,192 @@ def export_data(request):
     return JsonResponse({'error': 'Method not allowed'}, status=405)
 
 
-def generate_export_file(export_type, date_from=None, date_to=None, report_title="Attendance Report", teacher=None):
-    """Helper function to generate export files"""
-    attendance_data = get_complete_attendance_data(teacher)
+EXPORT_CHUNK_SIZE = 2000  # rows fetched per database round trip and written per response chunk
+EXPORT_HEADER = ['Student Name', 'Session', 'Date', 'Time', 'Status', 'Late']
 
+
+def export_rows(teacher=None, date_from=None, date_to=None, using='default'):
+    """
+    (student name, session name, date, time, is_late) of every exported record,
+    archived terms first, then records in id order as the dashboard lists them.
+    Records are filtered and read in chunks by the database.
+    """
+    records = AttendanceRecord.objects.using(using)
+    if teacher:
+        records = records.filter(teacher=teacher)
     if date_from and date_to:
-        date_from_obj = datetime.strptime(date_from, '%Y-%m-%d').date()
-        date_to_obj = datetime.strptime(date_to, '%Y-%m-%d').date()
-        attendance_data['all_attendance_records'] = [
-            record for record in attendance_data['all_attendance_records']
-            if date_from_obj <= datetime.strptime(record['date'], '%Y-%m-%d').date() <= date_to_obj
-        ]
+        for row in archived_records(teacher, date_from, date_to).itertuples(index=False):
+            # Archives are read by session date; the export filters on the record date
+            if date_from <= row.date <= date_to:
+                yield row.student_name, row.session_name, row.date, row.time, bool(row.is_late)
+        records = records.filter(date__range=(date_from, date_to))
+    yield from records.order_by('id').values_list(
+        'student__name', 'session__name', 'date', 'time', 'is_late'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+class _Echo:
+    """File-like object for csv.writer that hands back each formatted row"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    """Encoded CSV chunks of EXPORT_CHUNK_SIZE rows; records the export size when done"""
+    writer = csv.writer(_Echo())
+    size = 0
+    lines = [writer.writerow(EXPORT_HEADER)]
+    for student_name, session_name, day, time, is_late in rows:
+        lines.append(writer.writerow([
+            student_name,
+            session_name if session_name else 'N/A',
+            day.strftime('%Y-%m-%d'),
+            time.strftime('%H:%M:%S'),
+            'Present',
+            'Yes' if is_late else 'No'
+        ]))
+        if len(lines) >= EXPORT_CHUNK_SIZE:
+            chunk = ''.join(lines).encode('utf-8')
+            size += len(chunk)
+            lines = []
+            yield chunk
+    chunk = ''.join(lines).encode('utf-8')
+    size += len(chunk)
+    yield chunk
+    metrics.export_bytes.observe(size, format='csv')
+
+
+def parse_export_range(date_from, date_to):
+    """(date_from, date_to) as dates; exports are only limited when both are given"""
+    if date_from and date_to:
+        return (datetime.strptime(date_from, '%Y-%m-%d').date(),
+                datetime.strptime(date_to, '%Y-%m-%d').date())
+    return None, None
+
+
+REPORT_WRITERS = {
+    'excel': (write_xlsx, XLSX_CONTENT_TYPE),
+    'word': (write_docx, DOCX_CONTENT_TYPE),
+}
+COLUMNAR_EXPORT_TYPES = {'parquet': PARQUET_CONTENT_TYPE, 'arrow': ARROW_CONTENT_TYPE}
+
+
+def _measured(chunks, export_format):
+    """Pass `chunks` through; records the export size when done"""
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    metrics.export_bytes.observe(size, format=export_format)
+
+
+def generate_export_file(export_type, date_from=None, date_to=None, report_title="Attendance Report", teacher=None):
+    """Helper function to generate export files"""
+    date_from, date_to = parse_export_range(date_from, date_to)
+    # Rows are read while the response is sent, after the view's routing
+    # state is gone; pin the database chosen now
+    using = router.db_for_read(AttendanceRecord)
 
     if export_type == "csv":
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Student Name', 'Session', 'Date', 'Time', 'Status', 'Late'])
-        for record in attendance_data['all_attendance_records']:
-            writer.writerow([
-                record['student__name'],
-                record['session__name'] if record['session__name'] else 'N/A',
-                record['date'],
-                record['time'],
-                'Present',
-                'Yes' if record['is_late'] else 'No'
-            ])
-        response = HttpResponse(output.getvalue(), content_type='text/csv')
+        response = StreamingHttpResponse(
+            stream_csv(export_rows(teacher, date_from, date_to, using)), content_type='text/csv'
+        )
         response['Content-Disposition'] = f'attachment; filename="{report_title}.csv"'
         return response
 
+    if export_type in COLUMNAR_EXPORT_TYPES:
+        extension = EXPORT_EXTENSIONS[export_type]
+        response = StreamingHttpResponse(
+            _measured(stream_export(export_type, teacher, date_from, date_to, using), extension),
+            content_type=COLUMNAR_EXPORT_TYPES[export_type]
+        )
+        response['Content-Disposition'] = f'attachment; filename="{report_title}.{extension}"'
+        return response
+
+    if export_type in REPORT_WRITERS:
+        write, content_type = REPORT_WRITERS[export_type]
+        # Spooled to an anonymous temporary file, which FileResponse streams and closes
+        output = tempfile.TemporaryFile()
+        try:
+            write(output, teacher, date_from, date_to, report_title, using)
+        except Exception:
+            output.close()
+            raise
+        size = output.tell()
+        output.seek(0)
+        metrics.export_bytes.observe(size, format=EXPORT_EXTENSIONS[export_type])
+        response = FileResponse(output, as_attachment=True, content_type=content_type,
+                                filename=f"{report_title}.{EXPORT_EXTENSIONS[export_type]}")
+        response['Content-Length'] = size
+        return response
+
     return JsonResponse({'error': 'Export type not supported'}, status=400)
 
 
+def incremental_export_stream(consumer, export_type):
+    """
+    (chunks, start, high) of the consumer's next incremental export: records
+    with ids in (start, high]. The watermark moves to `high` once the chunks
+    are exhausted, i.e. after the whole file was written.
+    """
+    start = consumer.watermark
+    records, high = incremental.pending_records(consumer)
+    if export_type == "csv":
+        chunks = stream_csv(records.values_list(
+            'student__name', 'session__name', 'date', 'time', 'is_late'
+        ).iterator(chunk_size=EXPORT_CHUNK_SIZE))
+    else:
+        chunks = _measured(write_stream(export_type, queryset_batches(records)), EXPORT_EXTENSIONS[export_type])
+
+    def delivered():
+        yield from chunks
+        if not incremental.advance(consumer, start, high):
+            logger.warning(f"Export consumer {consumer.id} moved during an export; watermark left alone")
+
+    return delivered(), start, high
+
+
+@server_timing
+@login_required
+@csrf_exempt
+@require_http_methods(["POST"])
+def incremental_export(request, consumer_name):
+    """Records created since the consumer's last export, as csv / parquet / arrow"""
+    try:
+        data = json.loads(request.body or '{}')
+        export_type = data.get("type", "csv")
+        if export_type != "csv" and export_type not in COLUMNAR_EXPORT_TYPES:
+            return JsonResponse({'error': 'Export type not supported'}, status=400)
+
+        consumer = incremental.consumer_for(request.user, consumer_name)
+        chunks, start, high = incremental_export_stream(consumer, export_type)
+        extension = EXPORT_EXTENSIONS[export_type]
+        response = StreamingHttpResponse(chunks, content_type=COLUMNAR_EXPORT_TYPES.get(export_type, 'text/csv'))
+        response['Content-Disposition'] = f'attachment; filename="{consumer_name}-{start}-{high}.{extension}"'
+        response['X-Export-Watermark-From'] = start
+        response['X-Export-Watermark'] = high
+        return response
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+@server_timing
+@login_required
+@csrf_exempt
+@require_http_methods(["POST"])
+def reset_export_consumer(request, consumer_name):
+    """Set a consumer's watermark: 0 (default) re-exports everything, "latest" skips the history"""
+    try:
+        data = json.loads(request.body or '{}')
+        consumer = incremental.reset(
+            incremental.consumer_for(request.user, consumer_name), data.get("watermark", 0)
+        )
+        return JsonResponse({'consumer': consumer.name, 'watermark': consumer.watermark})
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
 @login_required
 def test_onboarding(request):
     """Test page for onboarding system"""
@@ -0,0 +1,68 @@
+"""
+Live attendance feed (Server-Sent Events)
+"""
+from .common_imports import *
+from django.http import StreamingHttpResponse
+from ..events import TooManySubscribers, broker
+
+
+def _sse(event_type, data, event_id=None):
+    lines = [f"event: {event_type}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _event_stream(subscription, backlog, complete):
+    # Streams end after SSE_STREAM_SECONDS (or when the subscriber overflows);
+    # EventSource then reconnects with Last-Event-ID and resumes from the buffer
+    deadline = time.monotonic() + getattr(settings, 'SSE_STREAM_SECONDS', 300)
+    heartbeat = getattr(settings, 'SSE_HEARTBEAT_SECONDS', 15)
+    try:
+        yield f"retry: {getattr(settings, 'SSE_RETRY_MS', 3000)}\n\n"
+        if not complete:
+            yield _sse('reset', {})
+        for event in backlog:
+            yield _sse('attendance', event.data, event.id)
+        while time.monotonic() < deadline and not subscription.overflowed:
+            event = subscription.get(timeout=min(heartbeat, max(deadline - time.monotonic(), 0)))
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield _sse('attendance', event.data, event.id)
+    finally:
+        subscription.close()
+
+
+@login_required
+@require_http_methods(["GET"])
+def attendance_events(request):
+    """Stream new attendance records of the teacher's sessions (or of one session)"""
+    session_id = request.GET.get('session_id')
+    if session_id:
+        sessions = AttendanceSession.objects.filter(id=session_id) if session_id.isdigit() else AttendanceSession.objects.none()
+        if not request.user.is_admin:
+            sessions = sessions.filter(teacher=request.user)
+        if not sessions.exists():
+            return JsonResponse({'error': 'Session not found'}, status=404)
+        session_id = int(session_id)
+
+    last_event_id = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('last_event_id')
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+
+    try:
+        subscription, backlog, complete = broker.subscribe(
+            teacher_id=None if request.user.is_admin else request.user.id,
+            session_id=session_id or None,
+            last_event_id=last_event_id,
+            queue_size=getattr(settings, 'SSE_QUEUE_SIZE', 100),
+        )
+    except TooManySubscribers:
+        logger.warning(f"Rejected live feed for {request.user.username}: too many subscribers")
+        return JsonResponse({'error': 'Too many live connections, try again later'}, status=503)
+
+    response = StreamingHttpResponse(_event_stream(subscription, backlog, complete), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # disable proxy buffering
+    return response
@@ -1,13 +1,22 @@
 import os
+import re
+import base64
+import logging
 import boto3
 from botocore.exceptions import ClientError
 from django.conf import settings
 from PIL import Image
 import io
-import requests
 import numpy as np
 import cv2
 
+from ..timing import timed
+from .. import metrics
+from ..logging_utils import sampled
+from ..image_cache import image_fetcher
+
+logger = logging.getLogger('faceapp.recognition')
+
 # AWS Rekognition Configuration
 rekognition_client = None
 s3_client = None
@@ -17,11 +26,11 @@ AWS_CONFIGURED = False
 try:
     from dotenv import load_dotenv
     load_dotenv()
-    print("✅ Loaded environment variables from .env")
+    logger.debug("Loaded environment variables from .env")
 except ImportError:
-    print("⚠️ python-dotenv not available")
+    logger.debug("python-dotenv not available")
 except Exception as e:
-    print(f"⚠️ Error loading .env: {e}")
+    logger.warning(f"Error loading .env: {e}")
 
 # Initialize AWS Rekognition
 try:
@@ -48,34 +57,76 @@ try:
         # Create collection if it doesn't exist
         try:
             rekognition_client.describe_collection(CollectionId=AWS_COLLECTION_ID)
-            print(f"✅ AWS Rekognition collection '{AWS_COLLECTION_ID}' exists")
+            logger.info(f"AWS Rekognition collection '{AWS_COLLECTION_ID}' exists")
         except ClientError as e:
             if e.response['Error']['Code'] == 'ResourceNotFoundException':
                 rekognition_client.create_collection(CollectionId=AWS_COLLECTION_ID)
-                print(f"✅ Created AWS Rekognition collection '{AWS_COLLECTION_ID}'")
+                logger.info(f"Created AWS Rekognition collection '{AWS_COLLECTION_ID}'")
             else:
-                print(f"Error checking collection: {e}")
+                logger.error(f"Error checking collection: {e}")
         
         AWS_CONFIGURED = True
-        print("✅ AWS Rekognition configured successfully")
+        logger.info("AWS Rekognition configured successfully")
     else:
-        print("⚠️ AWS credentials not found in environment variables")
+        logger.warning("AWS credentials not found in environment variables")
 except Exception as e:
-    print(f"⚠️ AWS Rekognition initialization failed: {e}")
+    logger.warning(f"AWS Rekognition initialization failed: {e}")
     AWS_CONFIGURED = False
 
 
+def _log_payload(operation, response):
+    """Log a raw Rekognition response at DEBUG level for a sample of calls"""
+    if logger.isEnabledFor(logging.DEBUG) and sampled(getattr(settings, 'RECOGNITION_PAYLOAD_LOG_SAMPLE_RATE', 0)):
+        logger.debug(f"{operation} response: {response}")
+
+
+@timed('decode')
+def decode_base64_image(image_data):
+    """Decode a base64 data URL (or bare base64 string) into raw image bytes"""
+    img_str = re.sub("^data:image/.+;base64,", "", image_data)
+    return base64.b64decode(img_str)
+
+
+@timed('decode')
+def prepare_detection_frame(img_bytes):
+    """Decode image bytes into an RGB frame and re-encode it as JPEG for detection"""
+    nparr = np.frombuffer(img_bytes, np.uint8)
+    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    pil_image = Image.fromarray(rgb_frame)
+    img_byte_arr = io.BytesIO()
+    pil_image.save(img_byte_arr, format='JPEG')
+    return rgb_frame, img_byte_arr.getvalue()
+
+
+def scale_faces_to_frame(detected_faces, height, width):
+    """Convert relative Rekognition bounding boxes into pixel boxes for the frontend"""
+    return [
+        {
+            "top": int(face['top'] * height),
+            "right": int((face['left'] + face['width']) * width),
+            "bottom": int((face['top'] + face['height']) * height),
+            "left": int(face['left'] * width)
+        }
+        for face in detected_faces
+    ]
+
+
+@timed('detect')
 def detect_faces_rekognition(image_bytes):
     """Detect faces using AWS Rekognition"""
     if not AWS_CONFIGURED or not rekognition_client:
-        print("❌ AWS Rekognition not configured")
+        logger.error("AWS Rekognition not configured")
+        metrics.recognition_calls.inc(operation='detect', outcome='unconfigured')
         return []
     
     try:
-        response = rekognition_client.detect_faces(
-            Image={'Bytes': image_bytes},
-            Attributes=['DEFAULT']
-        )
+        with metrics.recognition_seconds.time(operation='detect'):
+            response = rekognition_client.detect_faces(
+                Image={'Bytes': image_bytes},
+                Attributes=['DEFAULT']
+            )
         
         faces = []
         for face_detail in response['FaceDetails']:
@@ -88,124 +139,137 @@ def detect_faces_rekognition(image_bytes):
                 'confidence': face_detail['Confidence']
             })
         
-        print(f"✅ Detected {len(faces)} faces with AWS Rekognition")
+        logger.info(f"Detected {len(faces)} faces", extra={'faces': len(faces)})
+        metrics.recognition_calls.inc(operation='detect', outcome='faces' if faces else 'no_faces')
         return faces
         
     except ClientError as e:
-        print(f"❌ AWS Rekognition face detection error: {e}")
+        logger.error(f"AWS Rekognition face detection error: {e}")
+        metrics.recognition_calls.inc(operation='detect', outcome='error')
         return []
     except Exception as e:
-        print(f"❌ Face detection error: {e}")
+        logger.exception(f"Face detection error: {e}")
+        metrics.recognition_calls.inc(operation='detect', outcome='error')
         return []
 
 
+@timed('index')
 def index_face_rekognition(image_bytes, student_id, student_name):
     """Index a face in AWS Rekognition collection"""
     if not AWS_CONFIGURED or not rekognition_client:
-        print("❌ AWS Rekognition not configured")
+        logger.error("AWS Rekognition not configured")
+        metrics.recognition_calls.inc(operation='index', outcome='unconfigured')
         return None
     
     try:
-        response = rekognition_client.index_faces(
-            CollectionId=AWS_COLLECTION_ID,
-            Image={'Bytes': image_bytes},
-            ExternalImageId=str(student_id),
-            DetectionAttributes=['DEFAULT'],
-            MaxFaces=1,
-            QualityFilter='AUTO'
-        )
-        print(f"📊 AWS Response: {response}") 
+        with metrics.recognition_seconds.time(operation='index'):
+            response = rekognition_client.index_faces(
+                CollectionId=AWS_COLLECTION_ID,
+                Image={'Bytes': image_bytes},
+                ExternalImageId=str(student_id),
+                DetectionAttributes=['DEFAULT'],
+                MaxFaces=1,
+                QualityFilter='AUTO'
+            )
+        _log_payload("IndexFaces", response)
         if response['FaceRecords']:
             face_id = response['FaceRecords'][0]['Face']['FaceId']
-            print(f"✅ Indexed face for {student_name} (Face ID: {face_id})")
-            print(f"✅ ExternalImageId stored: {student_id}") 
+            logger.info(f"Indexed face for {student_name} (Face ID: {face_id})", extra={'student_id': str(student_id), 'face_id': face_id})
+            metrics.recognition_calls.inc(operation='index', outcome='indexed')
             return face_id
         else:
-            print(f"❌ No face detected for {student_name}")
+            logger.warning(f"No face detected for {student_name}", extra={'student_id': str(student_id)})
+            metrics.recognition_calls.inc(operation='index', outcome='no_face')
             return None
             
     except ClientError as e:
         error_code = e.response['Error']['Code']
         if error_code == 'InvalidParameterException':
-            print(f"❌ Invalid image format or no face detected: {e}")
+            logger.warning(f"Invalid image format or no face detected: {e}")
+            metrics.recognition_calls.inc(operation='index', outcome='no_face')
         else:
-            print(f"❌ AWS Rekognition indexing error: {e}")
+            logger.error(f"AWS Rekognition indexing error: {e}")
+            metrics.recognition_calls.inc(operation='index', outcome='error')
         return None
     except Exception as e:
-        print(f"❌ Face indexing error: {e}")
+        logger.exception(f"Face indexing error: {e}")
+        metrics.recognition_calls.inc(operation='index', outcome='error')
         return None
 
 
+@timed('recognize')
 def search_face_rekognition(image_bytes, threshold=80):
     """Search for a face in AWS Rekognition collection"""
     if not AWS_CONFIGURED or not rekognition_client:
-        print("❌ AWS Rekognition not configured")
+        logger.error("AWS Rekognition not configured")
+        metrics.recognition_calls.inc(operation='search', outcome='unconfigured')
         return None, 0
     
     try:
-        response = rekognition_client.search_faces_by_image(
-            CollectionId=AWS_COLLECTION_ID,
-            Image={'Bytes': image_bytes},
-            MaxFaces=1,
-            FaceMatchThreshold=threshold
-        )
-        print(f"📊 Search response: {response}")
-        print(f"🎯 Matches found: {len(response.get('FaceMatches', []))}")
+        with metrics.recognition_seconds.time(operation='search'):
+            response = rekognition_client.search_faces_by_image(
+                CollectionId=AWS_COLLECTION_ID,
+                Image={'Bytes': image_bytes},
+                MaxFaces=1,
+                FaceMatchThreshold=threshold
+            )
+        _log_payload("SearchFacesByImage", response)
         if response['FaceMatches']:
             match = response['FaceMatches'][0]
             student_id = match['Face']['ExternalImageId']
             similarity = match['Similarity']
             
-            print(f"✅ Face match found: Student ID {student_id}, Similarity: {similarity:.2f}%")
+            logger.info(f"Face match found: Student ID {student_id}, Similarity: {similarity:.2f}%", extra={'student_id': student_id, 'similarity': round(similarity, 2)})
+            metrics.recognition_calls.inc(operation='search', outcome='match')
             return student_id, similarity
         else:
-            print(f"❌ No face match found (threshold: {threshold}%)")
+            logger.info(f"No face match found (threshold: {threshold}%)", extra={'threshold': threshold})
+            metrics.recognition_calls.inc(operation='search', outcome='no_match')
             return None, 0
             
     except ClientError as e:
         error_code = e.response['Error']['Code']
         if error_code == 'InvalidParameterException':
-            print(f"❌ No face detected in image: {e}")
+            logger.info(f"No face detected in image: {e}")
+            metrics.recognition_calls.inc(operation='search', outcome='no_face')
         else:
-            print(f"❌ AWS Rekognition search error: {e}")
+            logger.error(f"AWS Rekognition search error: {e}")
+            metrics.recognition_calls.inc(operation='search', outcome='error')
         return None, 0
     except Exception as e:
-        print(f"❌ Face search error: {e}")
+        logger.exception(f"Face search error: {e}")
+        metrics.recognition_calls.inc(operation='search', outcome='error')
         return None, 0
 
 
+@timed('delete_face')
 def delete_face_rekognition(face_id):
     """Delete a face from AWS Rekognition collection"""
     if not AWS_CONFIGURED or not rekognition_client:
-        print("❌ AWS Rekognition not configured")
+        logger.error("AWS Rekognition not configured")
+        metrics.recognition_calls.inc(operation='delete', outcome='unconfigured')
         return False
     
     try:
-        rekognition_client.delete_faces(
-            CollectionId=AWS_COLLECTION_ID,
-            FaceIds=[face_id]
-        )
-        print(f"✅ Deleted face {face_id} from collection")
+        with metrics.recognition_seconds.time(operation='delete'):
+            rekognition_client.delete_faces(
+                CollectionId=AWS_COLLECTION_ID,
+                FaceIds=[face_id]
+            )
+        logger.info(f"Deleted face {face_id} from collection")
+        metrics.recognition_calls.inc(operation='delete', outcome='deleted')
         return True
         
     except ClientError as e:
-        print(f"❌ Error deleting face: {e}")
+        logger.error(f"Error deleting face: {e}")
+        metrics.recognition_calls.inc(operation='delete', outcome='error')
         return False
 
 
 def load_image_from_path_or_url(image_path):
-    """Load image from local path or Cloudinary URL"""
+    """Load image from local path or Cloudinary URL as a read-only RGB array"""
     try:
-        if image_path.startswith('http://') or image_path.startswith('https://'):
-            response = requests.get(image_path)
-            image = Image.open(io.BytesIO(response.content))
-            return np.array(image.convert('RGB'))
-        else:
-            full_path = os.path.join(settings.MEDIA_ROOT, image_path)
-            if os.path.exists(full_path):
-                image = cv2.imread(full_path)
-                return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            return None
+        return image_fetcher.load_rgb(image_path)
     except Exception as e:
-        print(f"Error loading image: {e}")
+        logger.warning(f"Error loading image: {e}")
         return None
@@ -0,0 +1,47 @@
+"""
+Background job status and download views
+"""
+from .common_imports import *
+from django.http import FileResponse
+from ..jobs import job_status_payload, wake_worker
+from ..models import BackgroundJob
+
+
+def _get_job_for_user(request, job_id):
+    job = BackgroundJob.objects.filter(id=job_id).first()
+    if job is None or (not request.user.is_admin and job.created_by_id != request.user.id):
+        return None
+    return job
+
+
+@login_required
+@require_http_methods(["GET"])
+def job_status(request, job_id):
+    """Poll the status of a background job started by the current user"""
+    job = _get_job_for_user(request, job_id)
+    if job is None:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    if job.status == BackgroundJob.STATUS_QUEUED:
+        wake_worker()
+    return JsonResponse(job_status_payload(job))
+
+
+@login_required
+@require_http_methods(["GET"])
+def job_download(request, job_id):
+    """Download the file produced by a finished export job"""
+    job = _get_job_for_user(request, job_id)
+    if job is None:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    if job.status != BackgroundJob.STATUS_SUCCEEDED or not job.result or 'path' not in job.result:
+        return JsonResponse({'error': 'Export is not ready', 'status': job.status}, status=409)
+
+    file_path = os.path.join(settings.MEDIA_ROOT, job.result['path'])
+    if not os.path.exists(file_path):
+        return JsonResponse({'error': 'Export file has expired'}, status=410)
+    return FileResponse(
+        open(file_path, 'rb'),
+        as_attachment=True,
+        filename=job.result.get('filename'),
+        content_type=job.result.get('content_type', 'application/octet-stream')
+    )
@@ -0,0 +1,28 @@
+"""
+Prometheus metrics endpoint
+"""
+import hmac
+
+from .common_imports import *
+from .. import metrics
+
+
+@require_http_methods(["GET"])
+def metrics_view(request):
+    """
+    Expose application metrics in the Prometheus text format, to scrapers
+    sending "Authorization: Bearer <METRICS_TOKEN>" and to logged-in admins.
+    Without a METRICS_TOKEN only admins can read them.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    scraper = bool(token) and hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                                  f"Bearer {token}".encode())
+    admin = request.user.is_authenticated and (request.user.is_admin or request.user.is_staff)
+    if not (scraper or admin):
+        security_logger.warning(f"Rejected /metrics scrape from {request.META.get('REMOTE_ADDR')}")
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+
+    return HttpResponse(
+        metrics.registry().render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -2,8 +2,10 @@
 Student management views for adding and retrieving students
 """
 from .common_imports import *
-from .face_recognition_utils import delete_face_rekognition
-import cloudinary.uploader
+from ..jobs import enqueue
+from ..tasks import cloudinary_public_id
+from ..student_images import store_photo, derivative_bytes, image_url, VARIANTS
+from ..models import StudentImage
 import json
 
 
@@ -17,6 +19,7 @@ def home(request):
     return response
 
 
+@server_timing
 @login_required
 @csrf_exempt
 def add_student(request):
@@ -44,108 +47,68 @@ def add_student(request):
                 logger.error("AWS Rekognition not configured")
                 return JsonResponse({"error": "Face recognition service not configured"}, status=500)
 
-            # Decode base64 image
+            # Decode base64 image and store it by content hash
             try:
-                image_data = image_data.split(',')[1]
-                image_bytes = base64.b64decode(image_data)
-                image = Image.open(io.BytesIO(image_bytes))
-            except Exception as e:
+                with timed_stage('decode'):
+                    image_bytes = base64.b64decode(image_data.split(',')[1])
+                with timed_stage('stage_image'):
+                    student_image, _, image_created = store_photo(image_bytes)
+            except (IndexError, ValueError, OSError) as e:
                 logger.error(f"Image decoding failed for user {request.user.username}: {str(e)}")
                 return JsonResponse({"error": "Invalid image format"}, status=400)
 
-            # Convert to RGB if needed
-            if image.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                if image.mode == 'P':
-                    image = image.convert('RGBA')
-                background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                image = background
-            elif image.mode != 'RGB':
-                image = image.convert('RGB')
-
-            # Convert image to bytes for AWS
-            img_byte_arr = io.BytesIO()
-            image.save(img_byte_arr, format='JPEG', quality=95)
-            img_byte_arr.seek(0)
-            aws_image_bytes = img_byte_arr.read()
+            # Re-enrolling a photo one of this teacher's students already uses is a no-op;
+            # another teacher's student with the same photo only shares the stored image
+            if not image_created:
+                enrolled = student_image.students.filter(is_active=True, classes__teacher=request.user).first()
+                if enrolled is not None:
+                    logger.info(f"Photo {student_image.content_hash[:12]} already enrolled for {enrolled.name}")
+                    return JsonResponse({
+                        "message": f"Student {enrolled.name} is already enrolled with this photo",
+                        "student_id": enrolled.id,
+                        "processing_time": f"{time.time() - start_time:.2f}s"
+                    })
 
             # Generate unique student ID if not provided
             if not student_id:
                 student_id = f"STU{int(time.time())}"
 
-            # Index face in AWS Rekognition
-            try:
-                face_id = index_face_rekognition(aws_image_bytes, student_id, student_name)
-                
-                if face_id is None:
-                    logger.warning(f"No face detected in image for {student_name}")
-                    return JsonResponse({
-                        "error": "No face detected. Please ensure:\n• Your face is clearly visible\n• Good lighting (no shadows)\n• Look directly at camera\n• Remove sunglasses/masks"
-                    }, status=400)
-                
-                logger.info(f"Face indexed for {student_name} (Face ID: {face_id})")
-                    
-            except Exception as e:
-                logger.error(f"Face detection failed for {student_name}: {str(e)}")
-                return JsonResponse({"error": "Face detection failed. Please try again with better lighting."}, status=400)
+            with timed_stage('db_write'):
+                with transaction.atomic():
+                    # Create student record (face_encoding is filled in by the index job)
+                    student = Student.objects.create(
+                        name=student_name,
+                        student_id=student_id,
+                        email=email if email else None,
+                        phone=phone if phone else None,
+                        image_path=student_image.original,
+                        image=student_image,
+                    )
 
-            # Generate unique filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{student_name.lower().replace(' ', '_')}_{timestamp}.jpg"
-            
-            # Try to upload to Cloudinary first, fallback to local storage
-            try:
-                logger.info(f"Attempting to upload {filename} to Cloudinary...")
-                img_byte_arr.seek(0)
-                
-                upload_result = cloudinary.uploader.upload(
-                    img_byte_arr,
-                    folder="attendance_students",
-                    public_id=filename.replace('.jpg', ''),
-                    resource_type="image"
-                )
-                relative_path = upload_result['secure_url']
-                logger.info(f"Successfully uploaded to Cloudinary: {relative_path}")
-            except Exception as cloudinary_error:
-                logger.warning(f"Cloudinary upload failed: {cloudinary_error}. Saving locally...")
-                file_path = os.path.join(settings.MEDIA_ROOT, 'students', filename)
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                image.save(file_path, 'JPEG', quality=95)
-                relative_path = os.path.join('students', filename)
-                logger.info(f"Saved locally: {relative_path}")
+                    # Automatically add student to all classes of the logged-in teacher
+                    teacher_classes = list(Class.objects.filter(teacher=request.user, is_active=True))
+                    if teacher_classes:
+                        student.classes.add(*teacher_classes)
+                        logger.info(f"Student {student_name} automatically added to {len(teacher_classes)} classes")
 
-            # Store AWS Face ID as face encoding
-            face_encoding_data = json.dumps({
-                'face_id': face_id,
-                'student_id': student_id,
-                'indexed_at': datetime.now().isoformat(),
-                'service': 'aws_rekognition'
-            })
-
-            # Create student record
-            student = Student.objects.create(
-                name=student_name,
-                student_id=student_id,
-                email=email if email else None,
-                phone=phone if phone else None,
-                image_path=relative_path,
-                face_encoding=face_encoding_data
-            )
-
-            # Automatically add student to all classes of the logged-in teacher
-            teacher_classes = Class.objects.filter(teacher=request.user, is_active=True)
-            if teacher_classes.exists():
-                student.classes.add(*teacher_classes)
-                logger.info(f"Student {student_name} automatically added to {teacher_classes.count()} classes")
+                    job = enqueue(
+                        'index_student_face',
+                        {'student_pk': student.id},
+                        idempotency_key=f"index_student_face:{student.id}",
+                        created_by=request.user,
+                    )
 
             processing_time = time.time() - start_time
-            logger.info(f"Student {student_name} added successfully in {processing_time:.2f}s")
+            logger.info(f"Student {student_name} queued for face indexing in {processing_time:.2f}s (job {job.id})")
+            performance_logger.info(f"add_student stages for {student_name}: {request.stage_timer.log_summary()}")
             
             return JsonResponse({
-                "message": f"Student {student_name} added successfully!",
+                "message": f"Student {student_name} is being enrolled...",
                 "student_id": student.id,
+                "job_id": job.id,
+                "status_url": f"/jobs/{job.id}/",
                 "processing_time": f"{processing_time:.2f}s"
-            })
+            }, status=202)
 
         except Exception as e:
             processing_time = time.time() - start_time
@@ -159,13 +122,16 @@ def add_student(request):
 def get_all_students(request):
     """Get all students in the system"""
     try:
-        all_students = Student.objects.filter(is_active=True).prefetch_related('classes')
+        all_students = Student.objects.filter(is_active=True).select_related('image').prefetch_related(
+            Prefetch('classes', queryset=Class.objects.filter(is_active=True).select_related('teacher').order_by('id'),
+                     to_attr='current_classes')
+        )
         students_data = []
         
         for student in all_students:
-            current_classes = student.classes.filter(is_active=True)
-            teacher_classes = current_classes.filter(teacher=request.user)
-            is_in_teacher_classes = teacher_classes.exists()
+            current_classes = student.current_classes
+            teacher_classes = [cls for cls in current_classes if cls.teacher_id == request.user.id]
+            is_in_teacher_classes = bool(teacher_classes)
             
             students_data.append({
                 'id': student.id,
@@ -173,6 +139,8 @@ def get_all_students(request):
                 'student_id': student.student_id,
                 'email': student.email,
                 'phone': student.phone,
+                'thumbnail_url': image_url(student.image),
+                'face_crop_url': image_url(student.image, 'face_crop'),
                 'created_at': student.created_at.strftime('%Y-%m-%d'),
                 'current_classes': [
                     {
@@ -204,18 +172,22 @@ def get_all_students(request):
 
 
 @login_required
+@conditional_payload('teacher_students')
 def get_teacher_students(request):
     """Get all students in the logged-in teacher's classes"""
     try:
         students = Student.objects.filter(
             classes__teacher=request.user,
             is_active=True
-        ).distinct().prefetch_related('classes')
+        ).distinct().select_related('image').prefetch_related(
+            Prefetch('classes', queryset=Class.objects.filter(teacher=request.user, is_active=True).order_by('id'),
+                     to_attr='teacher_classes')
+        )
         
         students_data = []
         
         for student in students:
-            student_classes = student.classes.filter(teacher=request.user, is_active=True)
+            student_classes = student.teacher_classes
             
             students_data.append({
                 'id': student.id,
@@ -223,6 +195,8 @@ def get_teacher_students(request):
                 'student_id': student.student_id,
                 'email': student.email,
                 'phone': student.phone,
+                'thumbnail_url': image_url(student.image),
+                'face_crop_url': image_url(student.image, 'face_crop'),
                 'created_at': student.created_at.strftime('%Y-%m-%d'),
                 'classes': [
                     {
@@ -243,6 +217,7 @@ def get_teacher_students(request):
         return JsonResponse({'error': str(e)}, status=400)
 
 
+@server_timing
 @login_required
 @csrf_exempt
 def delete_student(request, student_id):
@@ -264,52 +239,41 @@ def delete_student(request, student_id):
             logger.warning(f"Unauthorized deletion attempt: Student {student_id} not in teacher's classes")
             return JsonResponse({"error": "You don't have permission to delete this student"}, status=403)
         
-        # Extract face ID from face_encoding and delete from AWS Rekognition
+        # Extract face ID from face_encoding; the Rekognition and Cloudinary deletes run as a background job
+        face_id = None
         if student.face_encoding:
             try:
-                face_data = json.loads(student.face_encoding)
-                if 'face_id' in face_data:
-                    face_id = face_data['face_id']
-                    delete_face_rekognition(face_id)
-                    logger.info(f"Deleted face {face_id} from AWS Rekognition")
-            except Exception as e:
-                logger.warning(f"Failed to delete face from AWS: {e}")
-        
-        # Delete image from Cloudinary if stored there
-        try:
-            if student.image_path and isinstance(student.image_path, str) and student.image_path.startswith('http') and 'res.cloudinary.com' in student.image_path:
-                # Extract public_id from URL: .../upload/v<ver>/<folder>/<name>.<ext>
-                # We take the part after '/upload/' and drop version and extension
-                parts = student.image_path.split('/upload/')
-                if len(parts) == 2:
-                    tail = parts[1]
-                    # Remove version segment if present (e.g., v1729989999/)
-                    if tail.startswith('v'):
-                        tail = '/'.join(tail.split('/')[1:])
-                    # Drop file extension
-                    public_id = tail.rsplit('.', 1)[0]
-                    # Perform delete
-                    cloudinary.uploader.destroy(public_id, resource_type='image')
-                    logger.info(f"Deleted Cloudinary asset {public_id} for student {student.name}")
-        except Exception as e:
-            logger.warning(f"Failed to delete Cloudinary image for student {student.name}: {e}")
+                face_id = json.loads(student.face_encoding).get('face_id')
+            except (ValueError, AttributeError) as e:
+                logger.warning(f"Unreadable face encoding for student {student.name}: {e}")
 
-        # Remove student from all classes
-        student.classes.clear()
-        
-        # Delete all attendance records for this student
-        attendance_count = AttendanceRecord.objects.filter(student=student).delete()[0]
-        logger.info(f"Deleted {attendance_count} attendance records for student {student.name}")
-        
-        # Mark student as inactive
-        student.is_active = False
-        student.save()
+        with transaction.atomic():
+            # Remove student from all classes
+            student.classes.clear()
+            
+            # Delete all attendance records for this student
+            attendance_count = AttendanceRecord.objects.filter(student=student).delete()[0]
+            logger.info(f"Deleted {attendance_count} attendance records for student {student.name}")
+            
+            # Mark student as inactive
+            student.is_active = False
+            student.save()
+
+            cleanup_job = None
+            if face_id or student.image_id or cloudinary_public_id(student.image_path):
+                cleanup_job = enqueue(
+                    'delete_student_assets',
+                    {'face_id': face_id, 'image_path': student.image_path, 'image_id': student.image_id},
+                    idempotency_key=f"delete_student_assets:{student.id}",
+                    created_by=request.user,
+                )
         
         logger.info(f"Student {student.name} deleted successfully by user {request.user.username}")
         
         return JsonResponse({
             "message": f"Student {student.name} has been deleted successfully",
-            "attendance_records_deleted": attendance_count
+            "attendance_records_deleted": attendance_count,
+            "cleanup_job_id": cleanup_job.id if cleanup_job else None
         })
         
     except Student.DoesNotExist:
@@ -318,3 +282,28 @@ def delete_student(request, student_id):
     except Exception as e:
         logger.error(f"Error deleting student: {str(e)}")
         return JsonResponse({"error": str(e)}, status=400)
+
+
+@login_required
+@require_http_methods(["GET"])
+def student_image(request, content_hash, variant):
+    """Serve a photo derivative by content hash; the URL never changes, so it is cached forever"""
+    if variant not in VARIANTS:
+        return JsonResponse({"error": "Unknown image variant"}, status=404)
+    student_image = StudentImage.objects.filter(content_hash=content_hash).first()
+    # Teachers only see photos of students in their classes
+    if student_image is None or not (
+            request.user.is_admin or student_image.students.filter(classes__teacher=request.user).exists()):
+        return JsonResponse({"error": "Image not found"}, status=404)
+    etag = f'"{content_hash}-{variant}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponse(status=304)
+    else:
+        try:
+            response = HttpResponse(derivative_bytes(student_image, variant), content_type='image/jpeg')
+        except Exception as e:
+            logger.error(f"Could not load {variant} for image {content_hash[:12]}: {str(e)}")
+            return JsonResponse({"error": "Image unavailable"}, status=404)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response